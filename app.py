@@ -1,19 +1,36 @@
-from flask import Flask, render_template, request, jsonify, send_file, flash, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, send_file, flash, redirect, url_for
 import os
-from ticket_generator import TicketGenerator
+from ticket_generator import EXPORT_FORMATS, TicketGenerator
+from ticket_archive import ZipBundleCache, stream_zip
+from qr_render import OUTPUT_FORMATS
 from ticket_security import TicketSecurity, TicketValidator
-import zipfile
+from ticket_stats import LiveStats
 import io
 import base64
+import itertools
 import json
-from PIL import Image
 from datetime import datetime
 
 app = Flask(__name__)
 app.secret_key = 'qr_generator_secret_key_2024'
 
-# Initialiser le générateur de billets
-ticket_gen = TicketGenerator()
+# Initialiser le générateur de billets (configuration par variables d'environnement,
+# voir TicketGenerator.from_environ)
+ticket_gen = TicketGenerator.from_environ()
+
+# TICKET_ZIP_CACHE_DIR : archives /download_batch gardées sur disque et resservies telles quelles
+zip_cache = ZipBundleCache(os.environ['TICKET_ZIP_CACHE_DIR']) if os.environ.get('TICKET_ZIP_CACHE_DIR') else None
+
+# Tableaux de bord en direct : statistiques recalculées au plus une fois par
+# intervalle (TICKET_LIVE_INTERVAL secondes), pour tous les abonnés à la fois.
+# Chaque flux garde un thread du worker : TICKET_LIVE_MAX_STREAMS flux au plus
+# par worker (la moitié des threads par défaut), les scans gardent le reste
+live_stats = LiveStats(
+    ticket_gen.get_live_stats,
+    interval=float(os.environ.get('TICKET_LIVE_INTERVAL', 1)),
+    max_streams=int(os.environ.get('TICKET_LIVE_MAX_STREAMS',
+                                   max(1, int(os.environ.get('GUNICORN_THREADS', 8)) // 2)))
+)
 
 @app.route('/')
 def index():
@@ -35,10 +52,11 @@ def ticket_generator():
             results = []
             
             try:
-                # Charger l'image pour l'affichage
-                image_path = result['filepath']
-                with open(image_path, 'rb') as img_file:
-                    img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+                # Charger l'image pour l'affichage (rendue ici si elle n'existe pas encore)
+                preview_format = 'svg' if ticket_gen.image_format == 'svg' else 'png'
+                img_base64 = base64.b64encode(
+                    ticket_gen.get_ticket_file(result['filename'], preview_format)
+                ).decode('utf-8')
                 
                 results.append({
                     'success': True,
@@ -47,7 +65,8 @@ def ticket_generator():
                     'event_name': event_name,
                     'filename': result['filename'],
                     'filepath': result['filepath'],
-                    'image_base64': img_base64
+                    'image_base64': img_base64,
+                    'image_mimetype': OUTPUT_FORMATS[preview_format]['mimetype']
                 })
                 
                 flash(f'Billet généré automatiquement pour {buyer_name}!', 'success')
@@ -69,6 +88,22 @@ def scanner():
     """Page de scan et validation des billets"""
     return render_template('scanner.html')
 
+@app.route('/scanner/manifest')
+def scanner_manifest():
+    """Manifeste du mode hors ligne (complet, ou delta depuis la version du client)"""
+    try:
+        manifest = ticket_gen.get_offline_manifest(
+            event_name=request.args.get('event') or None,
+            tickets_since=request.args.get('tickets_since') or None,
+            validations_since=request.args.get('validations_since') or None
+        )
+        return jsonify(manifest)
+    except Exception as e:
+        return jsonify({
+            'error': 'Erreur lors de la création du manifeste',
+            'details': str(e)
+        }), 500
+
 @app.route('/validate-ticket', methods=['POST'])
 def validate_ticket():
     """Valider un billet scanné"""
@@ -101,6 +136,107 @@ def validate_ticket():
             'details': str(e)
         })
 
+# Nombre maximum de scans par requête /validate-tickets, et taille de corps
+# correspondante (un scan V1 avec lieu et horodatage tient dans 2 Ko)
+MAX_BULK_SCANS = 5000
+MAX_BULK_BYTES = MAX_BULK_SCANS * 2048
+
+def too_many_scans():
+    return jsonify({
+        'error': 'Trop de scans',
+        'details': f'Maximum {MAX_BULK_SCANS} scans par requête'
+    }), 413
+
+@app.route('/validate-tickets', methods=['POST'])
+def validate_tickets():
+    """Valider une série de scans (lecteurs portables, rejeu d'un arriéré)
+    
+    Corps : tableau JSON, ou NDJSON (une ligne par scan) avec le type
+    application/x-ndjson. Chaque scan : {"qr_data", "location", "timestamp"},
+    plus "offline": true pour une entrée déjà admise par un scanner hors ligne.
+    Les résultats sont rendus dans l'ordre ; pour un billet scanné plusieurs
+    fois, seul le premier scan est accepté. Une entrée hors ligne refusée
+    car déjà utilisée est signalée dans "conflicts" (personne admise deux fois).
+    """
+    try:
+        # Refuser avant de lire le corps : la limite borne aussi la mémoire et le temps d'analyse
+        if request.content_length is not None and request.content_length > MAX_BULK_BYTES:
+            return too_many_scans()
+        if request.mimetype == 'application/x-ndjson':
+            lines = (line for line in request.stream if line.strip())
+            scans = [json.loads(line) for line in itertools.islice(lines, MAX_BULK_SCANS + 1)]
+        else:
+            # Corps sans longueur annoncée (envoi par morceaux) : lecture bornée
+            body = request.stream.read(MAX_BULK_BYTES + 1)
+            if len(body) > MAX_BULK_BYTES:
+                return too_many_scans()
+            try:
+                scans = json.loads(body)
+            except ValueError:
+                scans = None
+        
+        if not isinstance(scans, list) or not all(isinstance(scan, dict) for scan in scans):
+            return jsonify({
+                'error': 'Format invalide',
+                'details': 'Un tableau JSON (ou des lignes NDJSON) de scans est attendu'
+            }), 400
+        if len(scans) > MAX_BULK_SCANS:
+            return too_many_scans()
+        
+        user_agent = request.headers.get('User-Agent', '')
+        to_validate = []
+        for scan in scans:
+            qr_data = scan.get('qr_data')
+            if not isinstance(qr_data, str) or not qr_data.strip():
+                continue
+            to_validate.append((qr_data.strip(), {
+                'location': scan.get('location', ''),
+                'validated_at': scan.get('timestamp', ''),
+                'user_agent': user_agent,
+                'offline': bool(scan.get('offline'))
+            }))
+        
+        validations = iter(ticket_gen.validate_tickets_qr(to_validate))
+        results = []
+        for index, scan in enumerate(scans):
+            qr_data = scan.get('qr_data')
+            if not isinstance(qr_data, str) or not qr_data.strip():
+                result = {'valid': False, 'error': 'Aucune donnée QR fournie'}
+            else:
+                result = next(validations)
+            result['index'] = index
+            results.append(result)
+        
+        accepted = sum(1 for result in results if result['valid'])
+        conflicts = [
+            {
+                'index': result['index'],
+                'ticket_id': (result.get('ticket_data') or {}).get('ticket_id'),
+                'scanned_at': scans[result['index']].get('timestamp', ''),
+                'location': scans[result['index']].get('location', ''),
+                'previous_validation': result.get('previous_validation')
+            }
+            for result in results
+            if scans[result['index']].get('offline') and result.get('previous_validation')
+        ]
+        return jsonify({
+            'results': results,
+            'accepted': accepted,
+            'rejected': len(results) - accepted,
+            'conflicts': conflicts
+        })
+        
+    except ValueError as e:
+        return jsonify({
+            'error': 'Format invalide',
+            'details': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'error': 'Erreur de validation',
+            'details': str(e)
+        }), 500
+
 @app.route('/ticket-stats')
 def ticket_stats():
     """Page des statistiques de billetterie"""
@@ -111,17 +247,50 @@ def ticket_stats():
                          stats=stats, 
                          validation_stats=validation_stats)
 
+@app.route('/ticket-stats/stream')
+def ticket_stats_stream():
+    """Flux Server-Sent Events des statistiques (admissions, refus, portes, génération)"""
+    stream = live_stats.subscribe()
+    if stream is None:
+        # Trop de tableaux de bord ouverts : le client se rabat sur /ticket-stats
+        return jsonify({
+            'error': 'Trop de flux en direct ouverts',
+            'fallback': url_for('ticket_stats')
+        }), 503, {'Retry-After': '30'}
+    return Response(
+        stream,
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # pas de mise en tampon par nginx
+        }
+    )
+
 @app.route('/download/<filename>')
 def download_file(filename):
-    """Télécharger un fichier QR code"""
+    """Télécharger un fichier QR code (?format=png, svg ou matrix)"""
     try:
+        output_format = request.args.get('format')
+        if output_format and output_format not in OUTPUT_FORMATS:
+            flash(f'Format inconnu: {output_format}', 'error')
+            return redirect(url_for('index'))
+        
         filepath = os.path.join(ticket_gen.output_dir, filename)
         print(f"Debug - Tentative téléchargement: {filepath}")
         print(f"Debug - Fichier existe: {os.path.exists(filepath)}")
         
-        if os.path.exists(filepath):
+        if not output_format and os.path.exists(filepath):
             print(f"Debug - Envoi du fichier: {filename}")
             return send_file(filepath, as_attachment=True, download_name=filename)
+        
+        # Autre format ou image absente du disque : rendu à la demande depuis qr_content
+        data = ticket_gen.get_ticket_file(filename, output_format)
+        if data is not None:
+            output_format = output_format or 'png'
+            download_name = os.path.splitext(filename)[0] + OUTPUT_FORMATS[output_format]['extension']
+            app.logger.debug("Image rendue à la demande: %s", download_name)
+            return send_file(io.BytesIO(data), mimetype=OUTPUT_FORMATS[output_format]['mimetype'],
+                             as_attachment=True, download_name=download_name)
         else:
             print(f"Debug - Fichier non trouvé: {filepath}")
             flash('Fichier non trouvé.', 'error')
@@ -133,31 +302,81 @@ def download_file(filename):
 
 @app.route('/download_batch')
 def download_batch():
-    """Télécharger tous les QR codes récents dans un fichier ZIP"""
+    """Télécharger les billets dans un fichier ZIP envoyé au fil de l'eau
+    
+    Filtres optionnels : ?event=, ?type=, ?from= et ?to= (dates ISO de génération)
+    """
     try:
-        # Créer un fichier ZIP en mémoire
-        memory_file = io.BytesIO()
+        selection = {
+            "event_name": request.args.get('event') or None,
+            "ticket_type": request.args.get('type') or None,
+            "since": request.args.get('from') or None,
+            "until": request.args.get('to') or None
+        }
+        summary = ticket_gen.get_selection_summary(**selection)
+        if not summary["count"]:
+            flash('Aucun billet ne correspond à cette sélection', 'error')
+            return redirect(url_for('index'))
         
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            # Ajouter tous les fichiers du dossier generated_tickets
-            for filename in os.listdir(ticket_gen.output_dir):
-                if filename.endswith('.png'):
-                    filepath = os.path.join(ticket_gen.output_dir, filename)
-                    zf.write(filepath, filename)
+        # La clé inclut le nombre de billets et le plus récent : un nouveau billet invalide l'archive
+        cache_key = ZipBundleCache.key_for(selection, summary) if zip_cache else None
+        if zip_cache:
+            cached_path = zip_cache.get(cache_key)
+            if cached_path:
+                return send_file(
+                    cached_path,
+                    mimetype='application/zip',
+                    as_attachment=True,
+                    download_name='tickets_batch.zip'
+                )
         
-        memory_file.seek(0)
+        chunks = stream_zip(ticket_gen.iter_ticket_files(**selection))
+        if zip_cache:
+            chunks = zip_cache.store(cache_key, chunks)
         
-        return send_file(
-            memory_file,
+        return Response(
+            chunks,
             mimetype='application/zip',
-            as_attachment=True,
-            download_name='tickets_batch.zip'
+            headers={'Content-Disposition': 'attachment; filename=tickets_batch.zip'}
         )
         
     except Exception as e:
         flash(f'Erreur lors de la création du ZIP: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+@app.route('/export')
+def export_tickets():
+    """Exporter la liste des billets en CSV ou NDJSON, envoyée au fil de l'eau
+    
+    ?format=csv (par défaut) ou ndjson ; filtres optionnels ?event=, ?status=,
+    ?from= et ?to= (dates ISO de génération) ; ?validation=1 ajoute l'état de
+    scan de chaque billet. La réponse est envoyée par morceaux (chunked) au
+    fur et à mesure de la lecture de la base.
+    """
+    output_format = request.args.get('format', 'csv')
+    if output_format not in EXPORT_FORMATS:
+        return jsonify({
+            'error': 'Format inconnu',
+            'details': f"Formats disponibles: {', '.join(EXPORT_FORMATS)}"
+        }), 400
+    
+    chunks = ticket_gen.iter_export(
+        output_format,
+        event_name=request.args.get('event') or None,
+        status=request.args.get('status') or None,
+        since=request.args.get('from') or None,
+        until=request.args.get('to') or None,
+        include_validation=request.args.get('validation') in ('1', 'true', 'yes')
+    )
+    return Response(
+        chunks,
+        mimetype=EXPORT_FORMATS[output_format],
+        headers={
+            'Content-Disposition': f'attachment; filename=tickets.{output_format}',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
 if __name__ == '__main__':
     # Créer les dossiers nécessaires
     os.makedirs('templates', exist_ok=True)
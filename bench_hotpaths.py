@@ -0,0 +1,292 @@
+"""
+Microbenchmarks des chemins critiques de la billetterie
+
+    python bench_hotpaths.py [--sizes 1000,10000,100000] [--output bench_results.json]
+                             [--baseline bench_baseline.json] [--save-baseline] [--tolerance 0.3]
+
+Mesure, en microsecondes par appel (médiane, moyenne, p95, minimum) :
+- signature et encodage : create_ticket_data, encode_ticket_for_qr,
+  decode_ticket_from_qr, validate_ticket (indépendants de la taille de la base) ;
+- create_qr_code pour plusieurs tailles de module et niveaux de correction ;
+- pour chaque taille de base (billets dont la moitié déjà validés) :
+  validate_and_log sur des billets neufs, déjà scannés (refus depuis le cache
+  en mémoire, puis depuis la base des validations : « duplicate-cold ») et des
+  contenus invalides, puis les statistiques (get_event_statistics, get_validation_stats,
+  get_live_stats).
+
+Chaque mesure est répétée en plusieurs séries (--rounds) qui se partagent le
+budget de temps du cas (--budget secondes), chacune d'au moins --min-samples
+appels. La médiane retenue est celle de la meilleure série : une série
+perturbée (autre processus, ramasse-miettes) ne fausse pas le résultat. Le
+stockage suit TICKET_STORAGE, comme l'application.
+
+Les résultats sont écrits en JSON (--output). Avec --baseline, chaque médiane
+est comparée à celle de la référence : au-delà de la tolérance, la mesure est
+signalée en régression (si l'appel le plus rapide a lui aussi ralenti) et le
+script sort avec le code 1. Un cas qui n'a pas atteint le nombre minimal
+d'appels (entrées épuisées) est signalé mais pas comparé. --save-baseline
+enregistre les résultats comme nouvelle référence (propre à une machine).
+"""
+
+import argparse
+import base64
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PACKAGE_DIR)
+
+QR_BOX_SIZES = (5, 10, 20)
+QR_ERROR_LEVELS = ("L", "M", "Q", "H")
+ROUNDS = 5
+MIN_SAMPLES = 10  # appels par série
+
+
+def measure(function, inputs, budget=1.0, rounds=None, min_ops=None, max_ops=50000):
+    """Chronométrer function(entrée) en `rounds` séries se partageant le budget de temps
+    
+    Chaque série continue jusqu'à sa part du budget et au moins min_ops appels
+    (au plus max_ops / rounds : les entrées d'une liste finie sont réparties entre
+    les séries). median_us est la médiane de la meilleure série ; below_floor
+    signale un cas dont une série n'a pas eu min_ops entrées.
+    """
+    rounds = rounds or ROUNDS
+    min_ops = min_ops or MIN_SAMPLES
+    timings = []
+    round_medians = []
+    below_floor = False
+    for _ in range(rounds):
+        round_timings = []
+        started = time.perf_counter()
+        for item in itertools.islice(inputs, max(1, max_ops // rounds)):
+            before = time.perf_counter_ns()
+            function(item)
+            round_timings.append(time.perf_counter_ns() - before)
+            if len(round_timings) >= min_ops and time.perf_counter() - started > budget / rounds:
+                break
+        if len(round_timings) < min_ops:
+            below_floor = True
+        if not round_timings:
+            break
+        round_medians.append(statistics.median(round_timings))
+        timings.extend(round_timings)
+    if not timings:
+        raise ValueError("Aucune entrée à mesurer")
+    timings.sort()
+    return {
+        "ops": len(timings),
+        "rounds": len(round_medians),
+        "median_us": min(round_medians) / 1000,
+        "mean_us": statistics.fmean(timings) / 1000,
+        "p95_us": timings[min(len(timings) - 1, int(len(timings) * 0.95))] / 1000,
+        "min_us": timings[0] / 1000,
+        "below_floor": below_floor
+    }
+
+
+def garbage_payloads():
+    """Contenus refusés au scan : texte quelconque, base64 invalide, signature falsifiée"""
+    forged = base64.b64encode(json.dumps({
+        "data": {"event_name": "Faux", "ticket_id": "00000000-0000-0000-0000-000000000000"},
+        "signature": "0" * 64,
+        "version": "1.0"
+    }).encode()).decode()
+    return itertools.cycle([
+        "https://example.com/pas-un-billet",
+        "TICKET_V1:@@@pas du base64@@@",
+        f"TICKET_V1:{forged}",
+        "TICKET-V2:ABC",
+    ])
+
+
+def bench_security(budget):
+    """Signature, encodage et vérification d'un billet (sans base)"""
+    from ticket_security import TicketSecurity
+
+    security = TicketSecurity()
+    buyer_info = {"nom": "Jean Dupont", "email": "jean.dupont@example.com",
+                  "achat_le": datetime.datetime.now().isoformat()}
+    additional_data = {"type_billet": "Standard", "prix": "25€"}
+
+    def create(_):
+        return security.create_ticket_data("Benchmark", "0b5e4c1a-8f43-4a57-9c3e-1d2f3a4b5c6d",
+                                           buyer_info, "2025-12-31T20:00:00", additional_data)
+
+    signed = create(None)
+    qr_content = security.encode_ticket_for_qr(signed)
+    decoded = security.decode_ticket_from_qr(qr_content)
+    return {
+        "create_ticket_data": measure(create, itertools.repeat(None), budget),
+        "encode_ticket_for_qr": measure(security.encode_ticket_for_qr, itertools.repeat(signed), budget),
+        "decode_ticket_from_qr": measure(security.decode_ticket_from_qr, itertools.repeat(qr_content), budget),
+        "validate_ticket": measure(security.validate_ticket, itertools.repeat(decoded), budget),
+    }, qr_content
+
+
+def bench_qr_codes(qr_content, budget):
+    """Création du QR code d'un billet V1, par taille de module et niveau de correction"""
+    from qr_generator import QRCodeGenerator
+
+    generator = QRCodeGenerator()
+    results = {}
+    for box_size, level in itertools.product(QR_BOX_SIZES, QR_ERROR_LEVELS):
+        results[f"create_qr_code[box={box_size},ec={level}]"] = measure(
+            lambda data: generator.create_qr_code(data, size=box_size, error_correction=level),
+            itertools.repeat(qr_content), budget
+        )
+    return results
+
+
+def bench_database(size, budget):
+    """validate_and_log et statistiques sur une base de `size` billets (moitié validés)"""
+    from ticket_generator import TicketGenerator
+
+    generator = TicketGenerator.from_environ()
+    generator.render_images = False
+    results = generator.generate_batch_tickets("Benchmark", [f"Invité {i}" for i in range(size)],
+                                               chunk_size=5000)
+    contents = [generator.get_ticket_info(result["ticket_id"])["qr_content"] for result in results]
+    validated, fresh = contents[:size // 2], contents[size // 2:]
+    generator.validate_tickets_qr([(qr_content, {"location": "Porte A"}) for qr_content in validated])
+
+    validator = generator.validator
+    scanner_info = {"location": "Porte B", "user_agent": "bench"}
+
+    def validate_cold(data):
+        # Contenu inconnu du cache en mémoire : le refus passe par la base des validations
+        with validator._cache_lock:
+            validator._used_payloads.clear()
+        return validator.validate_and_log(data, scanner_info)
+
+    measures = {
+        "validate_and_log[fresh]": measure(lambda data: validator.validate_and_log(data, scanner_info),
+                                           iter(fresh), budget, max_ops=len(fresh)),
+        "validate_and_log[duplicate]": measure(lambda data: validator.validate_and_log(data, scanner_info),
+                                               itertools.cycle(validated), budget),
+        "validate_and_log[duplicate-cold]": measure(validate_cold, itertools.cycle(validated), budget),
+        "validate_and_log[garbage]": measure(lambda data: validator.validate_and_log(data, scanner_info),
+                                             garbage_payloads(), budget),
+        "get_event_statistics": measure(lambda _: generator.get_event_statistics("Benchmark"),
+                                        itertools.repeat(None), budget),
+        "get_validation_stats": measure(lambda _: validator.get_validation_stats(),
+                                        itertools.repeat(None), budget),
+        "get_live_stats": measure(lambda _: generator.get_live_stats(), itertools.repeat(None), budget),
+    }
+    generator.ticket_store.close()
+    validator.store.close()
+    return measures
+
+
+def compare(results, baseline, tolerance):
+    """Comparer les médianes (meilleure série) et les minimums à la référence ; retourne les régressions"""
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if current.get("below_floor") or reference.get("below_floor"):
+            print(f"  {name:48s} ⚠️ trop peu d'appels ({current['ops']}), non comparé")
+            continue
+        ratio = current["median_us"] / reference["median_us"] if reference["median_us"] else 1.0
+        # Régression seulement si l'appel le plus rapide a aussi ralenti : un
+        # ralentissement de la machine pendant toutes les séries n'en est pas une
+        if ratio > 1 + tolerance and reference.get("min_us") and \
+                current["min_us"] / reference["min_us"] <= 1 + tolerance:
+            print(f"  {name:48s} {reference['median_us']:11.1f} -> {current['median_us']:11.1f} µs "
+                  f"(x{ratio:.2f}) ⚠️ appel le plus rapide inchangé, machine chargée ?")
+            continue
+        status = "❌ RÉGRESSION" if ratio > 1 + tolerance else ("✓ plus rapide" if ratio < 1 - tolerance else "✓")
+        print(f"  {name:48s} {reference['median_us']:11.1f} -> {current['median_us']:11.1f} µs "
+              f"(x{ratio:.2f}) {status}")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    global ROUNDS, MIN_SAMPLES
+    parser = argparse.ArgumentParser(description="Microbenchmarks des chemins critiques de la billetterie")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="tailles de base, séparées par des virgules")
+    parser.add_argument("--budget", type=float, default=1.0, help="secondes par mesure")
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help="séries par mesure")
+    parser.add_argument("--min-samples", type=int, default=MIN_SAMPLES,
+                        help="appels minimum par série (en dessous, la mesure n'est pas comparée)")
+    parser.add_argument("--output", default="bench_results.json", help="fichier JSON des résultats")
+    parser.add_argument("--baseline", default=None, help="résultats de référence à comparer")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="enregistrer les résultats comme référence (--baseline)")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="ralentissement toléré sur la médiane de la meilleure série (0.3 = +30 %%)")
+    args = parser.parse_args(argv)
+    ROUNDS, MIN_SAMPLES = args.rounds, args.min_samples
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    storage = os.environ.get("TICKET_STORAGE", "json")
+    print(f"=== Microbenchmarks (stockage {storage}, bases de {', '.join(map(str, sizes))} billets) ===")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            security_results, qr_content = bench_security(args.budget)
+            results.update(security_results)
+            results.update(bench_qr_codes(qr_content, args.budget))
+            for size in sizes:
+                os.makedirs(str(size))
+                os.chdir(str(size))
+                started = time.perf_counter()
+                results.update({f"{name}@{size}": measure_result
+                                for name, measure_result in bench_database(size, args.budget).items()})
+                print(f"  base de {size} billets mesurée en {time.perf_counter() - started:.1f} s")
+                os.chdir(directory)
+        finally:
+            os.chdir(PACKAGE_DIR)
+
+    for name, result in results.items():
+        print(f"  {name:48s} médiane {result['median_us']:11.1f} µs  p95 {result['p95_us']:11.1f} µs  "
+              f"({result['ops']} appels en {result['rounds']} séries)"
+              + (" ⚠️ sous le minimum d'appels" if result["below_floor"] else ""))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": storage,
+            "sizes": sizes,
+            "rounds": ROUNDS,
+            "min_samples": MIN_SAMPLES,
+            "date": datetime.datetime.now().isoformat()
+        },
+        "results": results
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"✓ Résultats écrits dans {output}")
+
+    if baseline_path and args.save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"✓ Référence enregistrée dans {baseline_path}")
+    elif baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"=== Comparaison avec {baseline_path} (tolérance +{args.tolerance:.0%}) ===")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} régression(s): {', '.join(regressions)}")
+            return 1
+        print("✓ Aucune régression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
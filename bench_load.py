@@ -0,0 +1,335 @@
+"""
+Test de charge HTTP : rejoue l'affluence aux portes sur /validate-ticket
+
+    python bench_load.py [--requests 2000] [--duration 30] [--concurrency 32]
+                         [--server werkzeug|gunicorn] [--workers 4] [--mix 80,15,5]
+                         [--output load_results.json]
+
+Dans un dossier temporaire, émet les billets puis lance l'application dans un
+processus séparé : serveur threadé de Werkzeug, ou gunicorn avec
+gunicorn.conf.py et --workers (WEB_CONCURRENCY). Le stockage suit
+TICKET_STORAGE, comme l'application ; avec plusieurs workers gunicorn, le
+défaut est le journal partagé.
+
+Les scans arrivent selon une courbe d'ouverture des portes : l'affluence
+monte vite, culmine vers le premier cinquième de --duration puis décroît
+(loi gamma de forme 2). Les scans se répartissent entre premiers passages,
+billets rescannés (déjà passés) et contenus invalides, selon --mix en
+pourcentages. Les envois suivent les horaires prévus (charge ouverte) : un
+serveur saturé fait monter la latence au lieu de ralentir les envois.
+
+Rapport :
+- latence p50/p95/p99 depuis l'heure prévue d'arrivée (attente côté client
+  comprise) et depuis l'envoi ;
+- débit par seconde ;
+- réponses inattendues : billet admis deux fois, billet jamais admis,
+  contenu invalide accepté, erreurs HTTP.
+"""
+
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PACKAGE_DIR)
+
+JUNK_PAYLOADS = [
+    "https://example.com/pas-un-billet",
+    "TICKET_V1:@@@pas du base64@@@",
+    "TICKET_V1:eyJkYXRhIjp7fSwic2lnbmF0dXJlIjoiMDAifQ==",
+    "TICKET-V2:ABC",
+]
+
+# Exécuté dans le processus serveur (mode werkzeug)
+WERKZEUG_SERVER = """
+import sys
+from werkzeug.serving import run_simple
+import app
+run_simple("127.0.0.1", int(sys.argv[1]), app.app, threaded=True)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def issue_tickets(count, prevalidated):
+    """Émettre `count` billets dans le dossier courant ; retourne (à scanner, déjà validés)"""
+    from ticket_generator import TicketGenerator
+
+    generator = TicketGenerator.from_environ()
+    generator.render_images = False
+    results = generator.generate_batch_tickets("Test de charge", [f"Invité {i}" for i in range(count)],
+                                               chunk_size=5000)
+    contents = [generator.get_ticket_info(result["ticket_id"])["qr_content"] for result in results]
+    generator.validate_tickets_qr([(qr_content, {"location": "Prévente"}) for qr_content in contents[:prevalidated]])
+    generator.ticket_store.close()
+    generator.validator.store.close()
+    return contents[prevalidated:], contents[:prevalidated]
+
+
+def arrival_schedule(count, duration, rng):
+    """Heures d'arrivée (secondes après l'ouverture), pic vers duration / 5"""
+    scale = duration / 5  # mode de la loi gamma de forme 2
+    times = []
+    while len(times) < count:
+        arrival = rng.gammavariate(2, scale)
+        if arrival < duration:
+            times.append(arrival)
+    return sorted(times)
+
+
+def build_scans(schedule, to_scan, prevalidated, mix, rng):
+    """Associer à chaque arrivée un scan (type, contenu) selon le mélange demandé"""
+    fresh_share, rescan_share, _ = mix
+    scanned = list(prevalidated)
+    fresh = iter(to_scan)
+    scans = []
+    for arrival in schedule:
+        draw = rng.random() * 100
+        kind = "fresh" if draw < fresh_share else "rescan" if draw < fresh_share + rescan_share else "junk"
+        if kind == "fresh":
+            qr_content = next(fresh, None)
+            if qr_content is None:
+                kind = "rescan"
+            else:
+                scanned.append(qr_content)
+        if kind == "rescan":
+            qr_content = rng.choice(scanned)
+        elif kind == "junk":
+            qr_content = rng.choice(JUNK_PAYLOADS)
+        scans.append((arrival, kind, qr_content))
+    return scans
+
+
+class Client:
+    """Connexions HTTP persistantes, une par thread"""
+
+    def __init__(self, port):
+        self.port = port
+        self.local = threading.local()
+
+    def post(self, path, fields):
+        body = urlencode(fields)
+        headers = {"Content-Type": "application/x-www-form-urlencoded", "User-Agent": "bench_load"}
+        for attempt in range(2):
+            connection = getattr(self.local, "connection", None)
+            if connection is None:
+                connection = self.local.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            try:
+                connection.request("POST", path, body, headers)
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                self.local.connection = None
+                if attempt:
+                    raise
+
+
+def start_server(args, directory, port):
+    environ = dict(os.environ, PYTHONPATH=PACKAGE_DIR, FLASK_ENV="production", TICKET_LAZY_IMAGES="1")
+    if args.server == "gunicorn":
+        environ["WEB_CONCURRENCY"] = str(args.workers)
+        command = ["gunicorn", "-c", os.path.join(PACKAGE_DIR, "gunicorn.conf.py"),
+                   "-b", f"127.0.0.1:{port}", "app:app"]
+    else:
+        command = [sys.executable, "-c", WERKZEUG_SERVER, str(port)]
+    server = subprocess.Popen(command, cwd=directory, env=environ,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté au démarrage (code {server.returncode})")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Le serveur ne répond pas après 30 s")
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    values = sorted(values)
+
+    def at(share):
+        return values[min(len(values) - 1, int(len(values) * share))] * 1000
+
+    return {"p50": at(0.50), "p95": at(0.95), "p99": at(0.99)}
+
+
+def run_load(client, scans, concurrency):
+    """Envoyer les scans à leur heure ; retourne un résultat par scan"""
+    results = [None] * len(scans)
+    doors = ["Porte Nord", "Porte Sud", "Porte Est", "Porte Ouest"]
+
+    def send(index, scheduled, kind, qr_content):
+        sent = time.perf_counter()
+        try:
+            status, body = client.post("/validate-ticket", {
+                "qr_data": qr_content,
+                "scanner_location": doors[index % len(doors)],
+                "timestamp": datetime.datetime.now().isoformat()
+            })
+            valid = json.loads(body).get("valid") if status == 200 else None
+        except (OSError, http.client.HTTPException, ValueError):
+            status, valid = None, None
+        done = time.perf_counter()
+        results[index] = {"kind": kind, "qr_content": qr_content, "status": status, "valid": valid,
+                          "scheduled": scheduled, "sent": sent, "done": done}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        for index, (arrival, kind, qr_content) in enumerate(scans):
+            delay = started + arrival - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, index, started + arrival, kind, qr_content)
+    return started, results
+
+
+def report(started, results, prevalidated):
+    """Latences, débit par seconde et réponses inattendues
+    
+    Un rescan peut atteindre le serveur avant le premier passage du même
+    billet : on vérifie donc par billet (une seule admission, aucune pour un
+    billet déjà validé) et non scan par scan.
+    """
+    admissions = {}
+    for r in results:
+        if r["kind"] != "junk" and r["status"] == 200:
+            admissions[r["qr_content"]] = admissions.get(r["qr_content"], 0) + bool(r["valid"])
+    prevalidated = set(prevalidated)
+    unexpected = {
+        "http_errors": sum(1 for r in results if r["status"] != 200),
+        "double_admissions": sum(1 for qr_content, count in admissions.items()
+                                 if count > (0 if qr_content in prevalidated else 1)),
+        "never_admitted": sum(1 for qr_content, count in admissions.items()
+                              if not count and qr_content not in prevalidated),
+        "junk_accepted": sum(1 for r in results if r["kind"] == "junk" and r["valid"]),
+    }
+    elapsed = max(r["done"] for r in results) - started
+    per_second = {}
+    for r in results:
+        second = int(r["done"] - started)
+        bucket = per_second.setdefault(second, [])
+        bucket.append(r["done"] - r["scheduled"])
+    return {
+        "requests": len(results),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(results) / elapsed if elapsed else None,
+        "latency_ms": percentiles([r["done"] - r["scheduled"] for r in results]),
+        "service_latency_ms": percentiles([r["done"] - r["sent"] for r in results]),
+        "by_kind": {
+            kind: {"count": len(latencies), **percentiles(latencies)}
+            for kind in ("fresh", "rescan", "junk")
+            for latencies in [[r["done"] - r["scheduled"] for r in results if r["kind"] == kind]]
+        },
+        "per_second": [
+            {"second": second, "requests": len(latencies), **percentiles(latencies)}
+            for second, latencies in sorted(per_second.items())
+        ],
+        "unexpected": unexpected
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge HTTP de /validate-ticket")
+    parser.add_argument("--requests", type=int, default=2000, help="nombre de scans envoyés")
+    parser.add_argument("--tickets", type=int, default=None, help="billets émis (défaut : --requests)")
+    parser.add_argument("--duration", type=float, default=30, help="durée de l'arrivée du public (s)")
+    parser.add_argument("--concurrency", type=int, default=32, help="requêtes simultanées maximum")
+    parser.add_argument("--server", choices=("werkzeug", "gunicorn"), default="werkzeug")
+    parser.add_argument("--workers", type=int, default=4, help="workers gunicorn")
+    parser.add_argument("--mix", default="80,15,5",
+                        help="pourcentages premiers passages, rescans, contenus invalides")
+    parser.add_argument("--seed", type=int, default=1, help="graine du tirage des arrivées")
+    parser.add_argument("--output", default=None, help="fichier JSON du rapport")
+    args = parser.parse_args(argv)
+    mix = [float(share) for share in args.mix.split(",")]
+    if len(mix) != 3 or abs(sum(mix) - 100) > 0.01:
+        parser.error("--mix attend trois pourcentages dont la somme fait 100")
+    if args.server == "gunicorn" and args.workers > 1:
+        os.environ.setdefault("TICKET_STORAGE", "shared")  # comme gunicorn.conf.py
+    ticket_count = args.tickets or args.requests
+    output = os.path.abspath(args.output) if args.output else None
+    rng = random.Random(args.seed)
+
+    storage = os.environ.get("TICKET_STORAGE", "json")
+    server_label = f"gunicorn, {args.workers} workers" if args.server == "gunicorn" else "werkzeug threadé"
+    print(f"=== Test de charge : {args.requests} scans en {args.duration:g} s "
+          f"({server_label}, stockage {storage}) ===")
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            prevalidated = max(1, min(100, ticket_count // 10))
+            to_scan, already_validated = issue_tickets(ticket_count, prevalidated)
+        finally:
+            os.chdir(PACKAGE_DIR)
+        print(f"✓ {ticket_count} billets émis ({prevalidated} déjà validés)")
+        scans = build_scans(arrival_schedule(args.requests, args.duration, rng),
+                            to_scan, already_validated, mix, rng)
+
+        port = free_port()
+        server = start_server(args, directory, port)
+        try:
+            client = Client(port)
+            # Échauffement : chargement des bases dans chaque worker
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(lambda qr_content: client.post("/validate-ticket", {"qr_data": qr_content}),
+                                  already_validated[:1] * max(8, args.workers * 4)))
+            started, results = run_load(client, scans, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+    result = report(started, results, already_validated)
+    print(f"✓ Débit moyen : {result['throughput_rps']:.0f} scans/s sur {result['elapsed_s']:.1f} s")
+    for label, key in (("Latence (arrivée -> réponse)", "latency_ms"),
+                       ("Latence (envoi -> réponse)  ", "service_latency_ms")):
+        latency = result[key]
+        print(f"✓ {label} : p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+              f"p99 {latency['p99']:.1f} ms")
+    for kind, label in (("fresh", "premiers passages"), ("rescan", "rescans"), ("junk", "invalides")):
+        by_kind = result["by_kind"][kind]
+        if by_kind["count"]:
+            print(f"  {label:18s} {by_kind['count']:6d} scans, p95 {by_kind['p95']:.1f} ms")
+    print("  seconde  scans  p50 (ms)  p95 (ms)")
+    for second in result["per_second"]:
+        print(f"  {second['second']:7d} {second['requests']:6d} {second['p50']:9.1f} {second['p95']:9.1f}")
+
+    unexpected = result["unexpected"]
+    if any(unexpected.values()):
+        print(f"❌ Réponses inattendues : {unexpected}")
+    else:
+        print("✓ Aucune réponse inattendue (pas de double admission)")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({"meta": {"server": args.server, "workers": args.workers, "storage": storage,
+                                "requests": args.requests, "duration": args.duration,
+                                "concurrency": args.concurrency, "mix": mix, "seed": args.seed},
+                       **result}, f, indent=2, ensure_ascii=False)
+        print(f"✓ Rapport écrit dans {output}")
+    return 1 if any(unexpected.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
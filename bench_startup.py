@@ -0,0 +1,88 @@
+"""
+Mesure du temps de démarrage de l'application web
+
+    python bench_startup.py [nombre_de_billets] [répétitions]
+
+Crée une base de billets (dont la moitié validés) dans un dossier temporaire,
+puis lance plusieurs processus Python neufs qui importent app.py, comme un
+worker gunicorn ou un conteneur qui démarre, et mesure :
+- le temps d'import de l'application ;
+- le temps de la première requête de scan, qui charge les bases.
+Vérifie aussi que l'import ne charge ni la pile d'imagerie ni les bases.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Exécuté dans chaque processus neuf
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+heavy = [name for name in ("PIL", "qrcode", "numpy") if name in sys.modules]
+loaded = app.ticket_gen._ticket_store_loaded or app.ticket_gen.validator._store_loaded
+response = app.app.test_client().post("/validate-ticket", data={"qr_data": sys.argv[1]})
+first_request = time.perf_counter()
+print(json.dumps({
+    "import": imported - started,
+    "first_request": first_request - imported,
+    "heavy_modules": heavy,
+    "databases_loaded_at_import": loaded,
+    "status": response.status_code
+}))
+"""
+
+
+def create_database(count):
+    """Générer `count` billets et en valider la moitié ; retourne un QR code à scanner"""
+    sys.path.insert(0, PACKAGE_DIR)
+    from ticket_generator import TicketGenerator
+
+    generator = TicketGenerator.from_environ()
+    generator.render_images = False
+    results = generator.generate_batch_tickets("Benchmark", [f"Invité {i}" for i in range(count)])
+    contents = [generator.get_ticket_info(result["ticket_id"])["qr_content"] for result in results]
+    generator.validate_tickets_qr([(qr_content, None) for qr_content in contents[:count // 2]])
+    generator.validator.store.flush()
+    generator.ticket_store.flush()
+    return contents[-1]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.symlink(os.path.join(PACKAGE_DIR, "templates"), "templates")
+        print(f"=== Démarrage de l'application ({count} billets, "
+              f"stockage {os.environ.get('TICKET_STORAGE', 'json')}) ===")
+        ticket_to_scan = create_database(count)
+
+        environ = dict(os.environ, PYTHONPATH=PACKAGE_DIR, FLASK_ENV="production")
+        measures = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, "-c", STARTUP_PROBE, ticket_to_scan],
+                                    capture_output=True, text=True, env=environ, check=True).stdout
+            measures.append(json.loads(output.strip().splitlines()[-1]))
+        os.chdir(PACKAGE_DIR)
+
+    import_times = [measure["import"] * 1000 for measure in measures]
+    request_times = [measure["first_request"] * 1000 for measure in measures]
+    print(f"✓ Import de app.py     : médiane {statistics.median(import_times):7.1f} ms "
+          f"(min {min(import_times):.1f} ms)")
+    print(f"✓ Première requête     : médiane {statistics.median(request_times):7.1f} ms "
+          f"(chargement des bases compris)")
+    print(f"✓ Modules d'imagerie chargés à l'import : {measures[0]['heavy_modules'] or 'aucun'}")
+    print(f"✓ Bases chargées à l'import : {'oui' if measures[0]['databases_loaded_at_import'] else 'non'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import multiprocessing
+import os
+
+# Un worker par cœur à l'entrée. L'application est chargée une seule fois
+# dans le processus maître puis forkée (clé, bases et modules déjà en mémoire).
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+preload_app = True
+
+# Threads par worker : un tableau de bord en direct (/ticket-stats/stream)
+# garde une connexion ouverte, il ne doit pas bloquer un worker entier.
+# Les flux sont plafonnés à la moitié des threads (TICKET_LIVE_MAX_STREAMS)
+# pour que les scans en gardent toujours
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Avec plusieurs workers, les billets utilisés doivent être vus par tous :
+# journal partagé verrouillé par défaut (ou TICKET_STORAGE=sqlite).
+# Le stockage "json" ou "journal" garderait une copie par worker, et un même
+# billet pourrait être accepté une fois par worker.
+if workers > 1:
+    storage = os.environ.setdefault('TICKET_STORAGE', 'shared')
+    if storage not in ('shared', 'sqlite'):
+        print(f"⚠️ TICKET_STORAGE={storage} n'est pas partagé entre {workers} workers : "
+              f"utilisez 'shared' ou 'sqlite'")
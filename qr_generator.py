@@ -1,39 +1,78 @@
-import qrcode
 import uuid
 import hashlib
 import datetime
 import os
-from PIL import Image, ImageDraw, ImageFont
-import json
 import random
 import string
+from qr_render import OUTPUT_FORMATS, build_qr, make_qr_image, render_qr
+from ticket_storage import JournalStore
+
+
+class UniquenessIndex:
+    """Index d'unicité des QR codes : empreintes des données et identifiants
+    
+    Construit en une passe au chargement de l'historique, puis tenu à jour à
+    chaque code : les vérifications ne parcourent plus l'historique.
+    """
+    
+    def __init__(self, codes=()):
+        self.hashes = set()
+        self.unique_ids = set()
+        self.duplicates = []
+        for data_hash, code_info in codes:
+            self.add(data_hash, code_info.get("unique_id"))
+    
+    def add(self, data_hash, unique_id):
+        self.hashes.add(data_hash)
+        if unique_id in self.unique_ids:
+            self.duplicates.append(unique_id)
+        else:
+            self.unique_ids.add(unique_id)
+
 
 class QRCodeGenerator:
     def __init__(self):
         self.output_dir = "generated_qr"
         self.history_file = "qr_history.json"
-        self.generated_codes = self.load_history()
-        
-        # Assurer que le dossier de sortie existe
-        os.makedirs(self.output_dir, exist_ok=True)
+        # Historique lu au premier accès, dossier de sortie créé à la première image
+        self._history = None
+        self._uniqueness = None
+    
+    @property
+    def history(self):
+        """Stockage de l'historique (journalisé : une ligne ajoutée par QR code)"""
+        if self._history is None:
+            self.load_history()
+        return self._history
+    
+    @property
+    def generated_codes(self):
+        """Historique des QR codes générés, par empreinte des données (chargé au premier accès)"""
+        return self.history.records
+    
+    @property
+    def uniqueness(self):
+        """Index d'unicité des QR codes générés"""
+        if self._uniqueness is None:
+            self.load_history()
+        return self._uniqueness
     
     def load_history(self):
-        """Charger l'historique des QR codes générés"""
+        """Charger l'historique des QR codes générés et reconstruire l'index d'unicité"""
+        if self._history is not None:
+            self._history.close()
+        self._history = JournalStore(self.history_file, "qr_codes")
         try:
-            if os.path.exists(self.history_file):
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            self._history.load()
         except Exception as e:
             print(f"Erreur lors du chargement de l'historique: {e}")
-        return {}
+        # Enregistrements compacts : l'identifiant est lu sans reconstruire chaque code
+        self._uniqueness = UniquenessIndex(self._history.records.packed_items())
+        return self._history.records
     
     def save_history(self):
-        """Sauvegarder l'historique des QR codes générés"""
-        try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(self.generated_codes, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Erreur lors de la sauvegarde de l'historique: {e}")
+        """Réécrire l'historique complet (le journal est fusionné dans qr_history.json)"""
+        self.history.save()
     
     def generate_unique_id(self, method="uuid"):
         """Générer un identifiant unique selon différentes méthodes"""
@@ -49,39 +88,56 @@ class QRCodeGenerator:
         else:
             return str(uuid.uuid4())
     
-    def create_qr_code(self, data, unique_id=None, size=10, border=4, error_correction='M'):
-        """Créer un QR code avec les paramètres spécifiés"""
-        # Configuration de la correction d'erreur
-        error_corrections = {
-            'L': qrcode.constants.ERROR_CORRECT_L,  # ~7%
-            'M': qrcode.constants.ERROR_CORRECT_M,  # ~15%
-            'Q': qrcode.constants.ERROR_CORRECT_Q,  # ~25%
-            'H': qrcode.constants.ERROR_CORRECT_H   # ~30%
-        }
+    def create_qr_code(self, data, unique_id=None, size=10, border=4, error_correction='M',
+                       output_format=None):
+        """Créer un QR code avec les paramètres spécifiés
         
-        # Créer l'instance QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=error_corrections.get(error_correction, qrcode.constants.ERROR_CORRECT_M),
-            box_size=size,
-            border=border,
-        )
+        Sans output_format, retourne une image PIL. Avec "png", "svg" ou
+        "matrix", retourne directement les octets dans ce format.
+        """
+        # Créer l'instance QR code et ajouter les données
+        qr = build_qr(data, error_correction, box_size=size, border=border)
         
-        # Ajouter les données
-        qr.add_data(data)
-        qr.make(fit=True)
+        if output_format is not None:
+            return render_qr(qr, output_format), qr
         
-        # Créer l'image
-        img = qr.make_image(fill_color="black", back_color="white")
+        # Créer l'image (rendu NumPy si disponible)
+        img = make_qr_image(qr)
         
         return img, qr
     
     def generate_unique_qr(self, base_data="", id_method="uuid", include_timestamp=True, 
-                          custom_prefix="", size=10, border=4, error_correction='M'):
-        """Générer un QR code unique avec diverses options"""
+                          custom_prefix="", size=10, border=4, error_correction='M',
+                          output_format="png"):
+        """Générer un QR code unique avec diverses options
+        
+        output_format : "png" (image PIL retournée), "svg" ou "matrix" (octets retournés)
+        """
+        created = self._create_unique_qr(base_data, id_method, include_timestamp, custom_prefix,
+                                         size, border, error_correction, output_format)
+        if created is None:
+            return None, None, None
         
-        # Générer un identifiant unique
-        unique_id = self.generate_unique_id(id_method)
+        img, qr_data, filepath, data_hash, code_info = created
+        self.history.put(data_hash, code_info)
+        
+        return img, qr_data, filepath
+    
+    def _create_unique_qr(self, base_data="", id_method="uuid", include_timestamp=True, 
+                          custom_prefix="", size=10, border=4, error_correction='M',
+                          output_format="png"):
+        """Créer l'image d'un QR code unique et l'indexer, sans l'écrire dans l'historique
+        
+        Retourne (image, données, chemin, empreinte, entrée d'historique), ou None si
+        le code existe déjà.
+        """
+        uniqueness = self.uniqueness
+        
+        # Générer un identifiant unique (nouveau tirage s'il est déjà dans l'index)
+        for _ in range(3):
+            unique_id = self.generate_unique_id(id_method)
+            if unique_id not in uniqueness.unique_ids:
+                break
         
         # Construire les données du QR code
         qr_data = ""
@@ -99,22 +155,32 @@ class QRCodeGenerator:
         
         # Vérifier l'unicité
         data_hash = hashlib.md5(qr_data.encode()).hexdigest()
-        if data_hash in self.generated_codes:
+        if data_hash in uniqueness.hashes or unique_id in uniqueness.unique_ids:
             print("Attention: Ce QR code a déjà été généré!")
-            return None, None, None
+            return None
         
         # Créer le QR code
-        img, qr_obj = self.create_qr_code(qr_data, unique_id, size, border, error_correction)
+        if output_format == "png":
+            img, qr_obj = self.create_qr_code(qr_data, unique_id, size, border, error_correction)
+        else:
+            img, qr_obj = self.create_qr_code(qr_data, unique_id, size, border, error_correction,
+                                              output_format=output_format)
         
         # Générer le nom du fichier
-        filename = f"qr_{unique_id}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
+        extension = OUTPUT_FORMATS[output_format]["extension"]
+        filename = f"qr_{unique_id}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}"
         filepath = os.path.join(self.output_dir, filename)
         
         # Sauvegarder l'image
-        img.save(filepath)
+        os.makedirs(self.output_dir, exist_ok=True)
+        if output_format == "png":
+            img.save(filepath)
+        else:
+            with open(filepath, 'wb') as f:
+                f.write(img)
         
-        # Enregistrer dans l'historique
-        self.generated_codes[data_hash] = {
+        # Entrée d'historique, indexée tout de suite (un lot voit ses propres codes)
+        code_info = {
             "unique_id": unique_id,
             "data": qr_data,
             "filename": filename,
@@ -123,26 +189,33 @@ class QRCodeGenerator:
             "method": id_method,
             "size": size,
             "border": border,
-            "error_correction": error_correction
+            "error_correction": error_correction,
+            "format": output_format
         }
+        uniqueness.add(data_hash, unique_id)
         
-        self.save_history()
-        
-        return img, qr_data, filepath
+        return img, qr_data, filepath, data_hash, code_info
     
-    def generate_batch_qr(self, count=10, base_data="", id_method="uuid", **kwargs):
-        """Générer plusieurs QR codes uniques en lot"""
+    def generate_batch_qr(self, count=10, base_data="", id_method="uuid", chunk_size=500, **kwargs):
+        """Générer plusieurs QR codes uniques en lot
+        
+        L'historique est écrit par paquets de chunk_size codes (une écriture
+        et un fsync par paquet) plutôt qu'après chaque code.
+        """
         results = []
+        pending = []
         
         for i in range(count):
             try:
-                img, data, filepath = self.generate_unique_qr(
+                created = self._create_unique_qr(
                     base_data=f"{base_data}_batch_{i+1}" if base_data else f"batch_{i+1}",
                     id_method=id_method,
                     **kwargs
                 )
                 
-                if img and data and filepath:
+                if created is not None:
+                    img, data, filepath, data_hash, code_info = created
+                    pending.append((data_hash, code_info))
                     results.append({
                         "index": i+1,
                         "data": data,
@@ -162,6 +235,13 @@ class QRCodeGenerator:
                     "status": "error",
                     "error": str(e)
                 })
+            
+            if len(pending) >= chunk_size:
+                self.history.put_many(pending)
+                pending = []
+        
+        if pending:
+            self.history.put_many(pending)
         
         return results
     
@@ -173,23 +253,17 @@ class QRCodeGenerator:
             return {"total": 0, "methods": {}, "recent": []}
         
         # Compter par méthode
-        methods = {}
-        recent_codes = []
+        methods = self.history.count_by("method", default="unknown")
         
-        for code_hash, code_info in self.generated_codes.items():
-            method = code_info.get("method", "unknown")
-            methods[method] = methods.get(method, 0) + 1
-            
-            # Garder les 5 plus récents
-            recent_codes.append({
+        # Les 5 plus récents (plus récent en premier)
+        recent_codes = [
+            {
                 "id": code_info["unique_id"],
                 "created_at": code_info["created_at"],
                 "filename": code_info["filename"]
-            })
-        
-        # Trier par date de création (plus récent en premier)
-        recent_codes.sort(key=lambda x: x["created_at"], reverse=True)
-        recent_codes = recent_codes[:5]
+            }
+            for code_info in self.history.find(order_by="created_at", descending=True, limit=5)
+        ]
         
         return {
             "total": total_count,
@@ -198,22 +272,14 @@ class QRCodeGenerator:
         }
     
     def verify_uniqueness(self):
-        """Vérifier l'unicité de tous les QR codes générés"""
-        unique_ids = set()
-        duplicates = []
-        
-        for code_hash, code_info in self.generated_codes.items():
-            unique_id = code_info["unique_id"]
-            if unique_id in unique_ids:
-                duplicates.append(unique_id)
-            else:
-                unique_ids.add(unique_id)
+        """Vérifier l'unicité de tous les QR codes générés (réponse tirée de l'index)"""
+        uniqueness = self.uniqueness
         
         return {
-            "total_codes": len(self.generated_codes),
-            "unique_ids": len(unique_ids),
-            "duplicates": duplicates,
-            "is_all_unique": len(duplicates) == 0
+            "total_codes": len(uniqueness.hashes),
+            "unique_ids": len(uniqueness.unique_ids),
+            "duplicates": list(uniqueness.duplicates),
+            "is_all_unique": not uniqueness.duplicates
         }
 
 
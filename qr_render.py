@@ -0,0 +1,178 @@
+import functools
+import io
+
+# qrcode, PIL et NumPy ne sont importés qu'au premier rendu : importer ce module
+# (et donc l'application web) ne charge pas la pile d'imagerie.
+
+# Niveaux de correction d'erreur (constantes qrcode.constants.ERROR_CORRECT_*)
+ERROR_CORRECTIONS = {
+    'L': "~7%",
+    'M': "~15%",
+    'Q': "~25%",
+    'H': "~30%"
+}
+
+# Formats de sortie disponibles : type MIME et extension de fichier
+OUTPUT_FORMATS = {
+    "png": {"mimetype": "image/png", "extension": ".png"},
+    "svg": {"mimetype": "image/svg+xml", "extension": ".svg"},
+    "matrix": {"mimetype": "application/octet-stream", "extension": ".bin"},
+}
+
+
+@functools.lru_cache(maxsize=None)
+def optional_numpy():
+    """Module NumPy, importé au premier appel, ou None s'il n'est pas installé"""
+    try:
+        import numpy
+    except ImportError:  # NumPy est optionnel : rendu PIL classique sinon
+        return None
+    return numpy
+
+
+def __getattr__(name):
+    # qr_render.numpy : NumPy importé à la demande
+    if name == "numpy":
+        return optional_numpy()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def build_qr(data, error_correction='M', box_size=10, border=4):
+    """Construire la matrice d'un QR code (version choisie automatiquement)"""
+    import qrcode
+    
+    level = error_correction if error_correction in ERROR_CORRECTIONS else 'M'
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=getattr(qrcode.constants, f"ERROR_CORRECT_{level}"),
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def encode_png(img):
+    """Encoder une image en PNG (octets)"""
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def rasterize_matrix(matrix, box_size=10):
+    """Image PIL 1 bit construite directement depuis la matrice de modules (NumPy)
+    
+    Chaque module est agrandi à box_size pixels par répétition de tableau,
+    puis les lignes sont compactées en bits, le format brut du mode "1".
+    """
+    from PIL import Image
+    numpy = optional_numpy()
+    
+    modules = numpy.asarray(matrix, dtype=bool)
+    pixels = (~modules).repeat(box_size, axis=0).repeat(box_size, axis=1)
+    size = pixels.shape[0]
+    return Image.frombytes("1", (size, size), numpy.packbits(pixels, axis=1).tobytes())
+
+
+def make_qr_image(qr, rasterizer=None):
+    """Image noir et blanc d'un QR code construit
+    
+    rasterizer : "numpy" (par défaut si NumPy est installé) ou "pil"
+    (rendu module par module de qrcode).
+    """
+    rasterizer = rasterizer or ("numpy" if optional_numpy() is not None else "pil")
+    if rasterizer == "numpy":
+        return rasterize_matrix(qr.get_matrix(), qr.box_size)
+    return qr.make_image(fill_color="black", back_color="white")
+
+
+def matrix_to_svg(matrix, box_size=10):
+    """SVG compact : un seul chemin où chaque suite de modules noirs d'une ligne
+    est un trait horizontal d'épaisseur 1, en déplacements relatifs (coordonnées
+    en modules, mise à l'échelle par le viewBox)."""
+    count = len(matrix)
+    parts = []
+    pen_x, pen_y = 0, 0
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < count:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < count and row[x]:
+                x += 1
+            parts.append(f"m{start - pen_x} {y - pen_y}h{x - start}")
+            pen_x, pen_y = x, y
+
+    pixels = count * box_size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{pixels}" height="{pixels}" '
+        f'viewBox="0 0 {count} {count}" shape-rendering="crispEdges">'
+        f'<rect width="{count}" height="{count}" fill="#fff"/>'
+        f'<path d="M0 .5{"".join(parts)}" fill="none" stroke="#000"/></svg>'
+    )
+
+
+def pack_matrix(matrix):
+    """Matrice de modules compactée en bits.
+
+    Format : taille (uint16 big-endian) puis une ligne par taille, chaque
+    ligne complétée à l'octet, bit de poids fort = module de gauche,
+    1 = module noir. La bordure est incluse.
+    """
+    count = len(matrix)
+    stride = (count + 7) // 8
+    padding = stride * 8 - count
+    packed = bytearray(count.to_bytes(2, 'big'))
+    for row in matrix:
+        bits = "".join("1" if cell else "0" for cell in row) + "0" * padding
+        packed += int(bits, 2).to_bytes(stride, 'big')
+    return bytes(packed)
+
+
+def unpack_matrix(data):
+    """Relire une matrice produite par pack_matrix"""
+    count = int.from_bytes(data[:2], 'big')
+    stride = (count + 7) // 8
+    if len(data) != 2 + stride * count:
+        raise ValueError("Matrice compactée de taille invalide")
+
+    matrix = []
+    for y in range(count):
+        row_bits = int.from_bytes(data[2 + y * stride:2 + (y + 1) * stride], 'big')
+        row_bits >>= stride * 8 - count
+        matrix.append([bool(row_bits >> (count - 1 - x) & 1) for x in range(count)])
+    return matrix
+
+
+def render_qr(qr, output_format="png"):
+    """Produire les octets d'un QR code déjà construit dans le format demandé"""
+    if output_format == "png":
+        return encode_png(make_qr_image(qr))
+    if output_format == "svg":
+        return matrix_to_svg(qr.get_matrix(), qr.box_size).encode('utf-8')
+    if output_format == "matrix":
+        return pack_matrix(qr.get_matrix())
+    raise ValueError(f"Format de sortie inconnu: {output_format} (choix: {', '.join(OUTPUT_FORMATS)})")
+
+
+if __name__ == "__main__":
+    import timeit
+    
+    print("=== Rendu PNG : NumPy vs qrcode/PIL ===")
+    if optional_numpy() is None:
+        print("NumPy n'est pas installé : seul le rendu PIL est disponible")
+    else:
+        qr = build_qr("TICKET_V1:" + "A" * 500)
+        print(f"QR version {qr.version} ({qr.modules_count}x{qr.modules_count} modules)")
+        for box_size in (4, 6, 8, 10, 12, 16, 20):
+            qr.box_size = box_size
+            reference = make_qr_image(qr, "pil").get_image()
+            assert make_qr_image(qr, "numpy").tobytes() == reference.convert("1").tobytes()
+            
+            pil_time = min(timeit.repeat(lambda: make_qr_image(qr, "pil"), number=5, repeat=3)) / 5
+            numpy_time = min(timeit.repeat(lambda: make_qr_image(qr, "numpy"), number=5, repeat=3)) / 5
+            print(f"✓ box_size={box_size:2d}: PIL {pil_time * 1000:6.2f} ms, "
+                  f"NumPy {numpy_time * 1000:6.2f} ms (x{pil_time / numpy_time:.1f})")
@@ -0,0 +1,273 @@
+"""
+Service de scan asynchrone (ASGI) : même contrat que /validate-ticket de l'app Flask
+
+    uvicorn scan_service:app --port 5001
+
+Les requêtes ne touchent pas au disque : chaque scan est placé dans une file,
+une seule tâche d'écriture regroupe tous les scans arrivés pendant une courte
+fenêtre (TICKET_COMMIT_WINDOW_MS, 5 ms par défaut) et les valide et enregistre
+en une écriture (TicketValidator.validate_many_and_log). Chaque requête reçoit
+sa réponse une fois le lot enregistré ; si l'écriture échoue, tout le lot
+reçoit une 503 (Retry-After) et aucun billet n'est marqué utilisé.
+
+Sans dépendance hors bibliothèque standard (uvicorn ou tout serveur ASGI pour
+le lancer).
+"""
+
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
+from urllib.parse import parse_qs
+
+from ticket_generator import TicketGenerator
+
+# Taille maximale du corps d'une requête de scan
+MAX_BODY_BYTES = 64 * 1024
+
+
+def parse_form(content_type, body):
+    """Champs d'un formulaire urlencoded ou multipart/form-data (FormData du scanner)"""
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser().parsebytes(
+            b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+        )
+        fields = {}
+        for part in message.get_payload() if message.is_multipart() else []:
+            name = part.get_param("name", header="content-disposition")
+            if name and name not in fields:
+                payload = part.get_payload(decode=True) or b""
+                fields[name] = payload.decode(part.get_content_charset() or "utf-8", "replace")
+        return fields
+    return {name: values[0] for name, values in parse_qs(body.decode("utf-8", "replace")).items()}
+
+
+class ScanService:
+    """Application ASGI de validation des billets avec écritures groupées"""
+
+    def __init__(self, generator=None, window=0.005, max_batch=1000):
+        self.generator = generator
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = None
+        self._writer = None
+        # Un seul thread : les lots sont enregistrés l'un après l'autre, dans l'ordre
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scan-writer")
+
+    def _start(self):
+        """Créer le générateur et la tâche d'écriture au premier usage"""
+        if self.generator is None:
+            self.generator = TicketGenerator.from_environ()
+        if self._writer is None or self._writer.done():
+            self._queue = asyncio.Queue()
+            self._writer = asyncio.get_running_loop().create_task(self._write_batches())
+
+    async def stop(self):
+        """Arrêter la tâche d'écriture une fois les scans en attente enregistrés"""
+        if self._writer is not None:
+            self._queue.put_nowait(None)
+            await self._writer
+            self._writer = None
+        if self.generator is not None:
+            self.generator.validator.store.flush()
+
+    async def validate(self, qr_data, scanner_info=None):
+        """Valider un scan ; rend la main une fois la validation enregistrée"""
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((qr_data, scanner_info, future))
+        return await future
+
+    async def _write_batches(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            if self._queue.empty():
+                # Laisser les scans concurrents rejoindre le lot
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if None in batch:  # demande d'arrêt (stop)
+                stopping = True
+                batch = [item for item in batch if item is not None]
+                while not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                if not batch:
+                    break
+
+            scans = [(qr_data, scanner_info) for qr_data, scanner_info, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self.generator.validate_tickets_qr, scans
+                )
+            except Exception as e:
+                print(f"Erreur lors de l'enregistrement d'un lot de {len(batch)} scans: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():  # client parti entre-temps
+                    future.set_result(result)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        if scope["path"] != "/validate-ticket":
+            await self._send_json(send, 404, {"error": "Page non trouvée"})
+            return
+        if scope["method"] != "POST":
+            await self._send_json(send, 405, {"error": "Méthode non autorisée"})
+            return
+
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                   for name, value in scope.get("headers", [])}
+        body = await self._read_body(receive)
+        if body is None:
+            await self._send_json(send, 413, {"valid": False, "error": "Requête trop volumineuse"})
+            return
+
+        try:
+            form = parse_form(headers.get("content-type", ""), body)
+            qr_data = form.get("qr_data", "").strip()
+            if not qr_data:
+                await self._send_json(send, 200, {"valid": False, "error": "Aucune donnée QR fournie"})
+                return
+
+            # Informations du scanner
+            scanner_info = {
+                "location": form.get("scanner_location", ""),
+                "validated_at": form.get("timestamp", ""),
+                "user_agent": headers.get("user-agent", "")
+            }
+        except Exception as e:
+            await self._send_json(send, 200, {
+                "valid": False,
+                "error": "Erreur de validation",
+                "details": str(e)
+            })
+            return
+
+        try:
+            result = await self.validate(qr_data, scanner_info)
+        except Exception as e:
+            # Lot non enregistré : rien n'est admis, le scanner doit rescanner
+            await self._send_json(send, 503, {
+                "valid": False,
+                "error": "Validation non enregistrée, rescanner le billet",
+                "details": str(e)
+            }, [(b"retry-after", b"1")])
+            return
+        await self._send_json(send, 200, result)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _read_body(self, receive):
+        """Corps complet de la requête, ou None s'il dépasse MAX_BODY_BYTES"""
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        return b"".join(chunks)
+
+    async def _send_json(self, send, status, data, headers=()):
+        body = json.dumps(data).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                *headers
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+app = ScanService(window=int(os.environ.get("TICKET_COMMIT_WINDOW_MS", 5)) / 1000)
+
+
+async def _benchmark(count=20000, concurrency=500):
+    """Scans concurrents appelés directement sur l'application ASGI (sans réseau)"""
+    import tempfile
+    import time
+    from urllib.parse import urlencode
+
+    previous_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            service = ScanService(TicketGenerator(storage=os.environ.get("TICKET_STORAGE", "journal"),
+                                                  render_images=False))
+            tickets = service.generator.generate_batch_tickets("Benchmark", [f"Invité {i}" for i in range(count)])
+            bodies = [urlencode({"qr_data": service.generator.get_ticket_info(ticket["ticket_id"])["qr_content"],
+                                 "scanner_location": "Porte A"}).encode() for ticket in tickets]
+
+            async def scan(body):
+                async def receive():
+                    return {"type": "http.request", "body": body, "more_body": False}
+                responses = []
+
+                async def send(message):
+                    responses.append(message)
+                scope = {"type": "http", "path": "/validate-ticket", "method": "POST",
+                         "headers": [(b"content-type", b"application/x-www-form-urlencoded")]}
+                await service(scope, receive, send)
+                return json.loads(responses[1]["body"])
+
+            # `concurrency` clients qui enchaînent chacun leurs scans
+            pending = iter(bodies)
+            results = []
+
+            async def client():
+                for body in pending:
+                    results.append(await scan(body))
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            await service.stop()
+        finally:
+            # Revenir au dossier de l'appelant avant de supprimer le dossier temporaire
+            os.chdir(previous_dir)
+
+    accepted = sum(1 for result in results if result["valid"])
+    print(f"✓ {count} scans ({accepted} acceptés) en {elapsed:.2f} s : {count / elapsed:.0f} scans/s")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["bench"]:
+        asyncio.run(_benchmark())
+    else:
+        try:
+            import uvicorn
+        except ImportError:
+            print("uvicorn n'est pas installé : pip install uvicorn")
+            sys.exit(1)
+        uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 5001)))
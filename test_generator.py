@@ -188,9 +188,41 @@ def test_edge_cases():
     print("✓ Génération avec paramètres minimums: OK")
     print()
 
+def test_output_formats():
+    """Test des formats de sortie SVG et matrice"""
+    print("=== Test 8: Formats de sortie ===")
+    
+    import gzip
+    from qr_render import unpack_matrix
+    
+    generator = QRCodeGenerator()
+    
+    png_data, qr = generator.create_qr_code("Formats de sortie", output_format="png")
+    svg_data, _ = generator.create_qr_code("Formats de sortie", output_format="svg")
+    matrix_data, _ = generator.create_qr_code("Formats de sortie", output_format="matrix")
+    
+    assert png_data.startswith(b"\x89PNG"), "PNG invalide"
+    assert svg_data.startswith(b"<svg") and svg_data.count(b"<path") == 1, "Le SVG doit tenir en un seul chemin"
+    assert unpack_matrix(matrix_data) == qr.get_matrix(), "La matrice compactée doit être relue à l'identique"
+    assert len(gzip.compress(svg_data)) < len(png_data), "Le SVG compressé doit être plus léger que le PNG"
+    
+    import qr_render
+    if qr_render.numpy is not None:
+        for box_size in (4, 10, 20):
+            qr.box_size = box_size
+            reference = qr_render.make_qr_image(qr, "pil").get_image().convert("1")
+            assert qr_render.make_qr_image(qr, "numpy").tobytes() == reference.tobytes(), \
+                "Le rendu NumPy doit être identique au rendu PIL"
+    
+    svg_img, data, filepath = generator.generate_unique_qr(base_data="SVG", output_format="svg")
+    assert filepath.endswith(".svg") and os.path.exists(filepath), "Fichier SVG non créé"
+    
+    print(f"✓ PNG: {len(png_data)} octets, SVG: {len(svg_data)} octets, matrice: {len(matrix_data)} octets")
+    print()
+
 def run_performance_test():
     """Test de performance"""
-    print("=== Test 8: Performance ===")
+    print("=== Test 9: Performance ===")
     
     generator = QRCodeGenerator()
     
@@ -215,13 +247,47 @@ def run_performance_test():
     assert success_count == 10, "Tous les QR codes n'ont pas été générés"
     print()
 
+def test_uniqueness_index():
+    """Test de l'index d'unicité persistant"""
+    print("=== Test 10: Index d'unicité ===")
+    
+    generator = QRCodeGenerator()
+    before = generator.verify_uniqueness()["total_codes"]
+    batch_results = generator.generate_batch_qr(count=20, base_data="Index", id_method="random",
+                                                include_timestamp=False, chunk_size=8)
+    assert all(r["status"] == "success" for r in batch_results), "Lot incomplet"
+    
+    # Historique relu par un nouveau générateur : même index, sans doublon
+    reloaded = QRCodeGenerator()
+    uniqueness = reloaded.verify_uniqueness()
+    assert uniqueness["total_codes"] == before + 20 == len(reloaded.generated_codes)
+    assert uniqueness["is_all_unique"], "Des doublons ont été détectés!"
+    
+    # Les mêmes données ne peuvent pas être générées deux fois
+    img, data, filepath = reloaded.generate_unique_qr(base_data="Index_batch_1", include_timestamp=False)
+    assert data is not None
+    reloaded.generate_unique_id = lambda method="uuid": data.split("|")[0]
+    assert reloaded.generate_unique_qr(base_data="Index_batch_1", include_timestamp=False) == (None, None, None)
+    
+    # Un doublon déjà présent dans l'historique est signalé au chargement
+    duplicate = dict(reloaded.generated_codes[next(iter(reloaded.generated_codes))])
+    reloaded.history.put("doublon_de_test", duplicate)
+    uniqueness = QRCodeGenerator().verify_uniqueness()
+    assert uniqueness["duplicates"] == [duplicate["unique_id"]] and not uniqueness["is_all_unique"]
+    del reloaded.history.records["doublon_de_test"]
+    reloaded.save_history()
+    assert QRCodeGenerator().verify_uniqueness()["is_all_unique"]
+    
+    print(f"✓ {uniqueness['total_codes']} codes indexés, doublon détecté au rechargement")
+    print()
+
 def cleanup_test_files():
     """Nettoyer les fichiers de test"""
     print("=== Nettoyage des fichiers de test ===")
     
     output_dir = "generated_qr"
     if os.path.exists(output_dir):
-        files = [f for f in os.listdir(output_dir) if f.endswith('.png')]
+        files = [f for f in os.listdir(output_dir) if f.endswith(('.png', '.svg', '.bin'))]
         print(f"✓ Suppression de {len(files)} fichiers de test...")
         
         for file in files:
@@ -231,14 +297,14 @@ def cleanup_test_files():
             except Exception as e:
                 print(f"✗ Erreur suppression {file}: {e}")
     
-    # Supprimer le fichier d'historique de test
-    history_file = "qr_history.json"
-    if os.path.exists(history_file):
-        try:
-            os.remove(history_file)
-            print("✓ Fichier d'historique supprimé")
-        except Exception as e:
-            print(f"✗ Erreur suppression historique: {e}")
+    # Supprimer le fichier d'historique de test (et son journal)
+    for history_file in ("qr_history.json", "qr_history.json.journal", "qr_history.json.journal.compacting"):
+        if os.path.exists(history_file):
+            try:
+                os.remove(history_file)
+                print(f"✓ Fichier d'historique supprimé: {history_file}")
+            except Exception as e:
+                print(f"✗ Erreur suppression historique: {e}")
     
     print()
 
@@ -257,7 +323,9 @@ def main():
         test_statistics()
         test_custom_parameters()
         test_edge_cases()
+        test_output_formats()
         run_performance_test()
+        test_uniqueness_index()
         
         print("🎉 TOUS LES TESTS SONT PASSÉS AVEC SUCCÈS!")
         print()
@@ -0,0 +1,1008 @@
+"""
+Script de test pour la billetterie sécurisée
+Chaque test s'exécute dans un dossier temporaire pour ne pas toucher aux vraies bases
+"""
+
+import csv
+import io
+import itertools
+import os
+import asyncio
+import sys
+import json
+import zipfile
+import tempfile
+import threading
+import time
+import multiprocessing
+import contextlib
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from ticket_archive import ZipBundleCache, stream_zip
+from ticket_images import TicketImageCache
+from ticket_issue import issue_from_csv
+from ticket_records import CompactRecords
+from ticket_storage import JournalStore, SharedJournalStore, SqliteStore
+from ticket_generator import TicketGenerator
+from ticket_schema import migrate
+from ticket_security import V2_NUMBERED_RECORD, offline_tag
+from ticket_stats import LiveStats
+from scan_service import ScanService
+
+
+@contextlib.contextmanager
+def dossier_temporaire():
+    """Exécuter le bloc dans un dossier de travail temporaire"""
+    ancien_dossier = os.getcwd()
+    with tempfile.TemporaryDirectory() as dossier:
+        os.chdir(dossier)
+        try:
+            yield dossier
+        finally:
+            os.chdir(ancien_dossier)
+
+
+def test_journal_store():
+    """Test du stockage journalisé : ajout, relecture et compaction"""
+    print("=== Test 1: Stockage journalisé ===")
+
+    with dossier_temporaire():
+        store = JournalStore("base.json", fsync_every=0, compact_every=0)
+        store.load()
+        for i in range(5):
+            store.put(f"billet_{i}", {"numero": i})
+        store.close()
+
+        assert not os.path.exists("base.json"), "Le snapshot ne doit pas être réécrit à chaque ajout"
+        with open("base.json.journal", encoding='utf-8') as f:
+            assert len(f.readlines()) == 5, "Une ligne de journal par enregistrement"
+
+        # Simuler un crash au milieu d'une écriture
+        with open("base.json.journal", 'a', encoding='utf-8') as f:
+            f.write('{"op":"put","key":"billet_5","val')
+
+        relu = JournalStore("base.json", compact_every=0)
+        records = relu.load()
+        assert len(records) == 5, "Le journal doit être rejoué jusqu'à la ligne tronquée"
+        assert records["billet_3"] == {"numero": 3}
+
+        relu.compact(background=False)
+        relu.close()
+        with open("base.json", encoding='utf-8') as f:
+            assert len(json.load(f)) == 5, "La compaction doit produire un snapshot complet"
+        assert os.path.getsize("base.json.journal") == 0, "Le journal doit être vidé après compaction"
+
+        # Comptages et recherches pendant des ajouts depuis un autre thread
+        concurrent = JournalStore("concurrent.json", "tickets", fsync_every=0, compact_every=0)
+        concurrent.load()
+        writer = threading.Thread(target=lambda: [concurrent.put(f"billet_{i}", {"event_name": "Live"})
+                                                  for i in range(20000)])
+        writer.start()
+        while writer.is_alive():
+            concurrent.count(event_name="Live")
+            concurrent.count_by("event_name")
+            list(concurrent.find(event_name="Live", limit=10))
+        writer.join()
+        assert concurrent.count(event_name="Live") == 20000
+        concurrent.close()
+
+    print("✓ Journal rejoué et compacté")
+    print()
+
+
+def test_ticket_generator_journal():
+    """Test du générateur de billets avec stockage journalisé"""
+    print("=== Test 2: Billets et validations journalisés ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator(storage="journal")
+        result = generator.generate_ticket("Soirée Test", "Jean Dupont")
+        first = generator.validate_ticket_qr(result["qr_content"])
+        assert first["valid"], "Le billet doit être valide au premier scan"
+        generator.ticket_store.close()
+        generator.validator.store.close()
+
+        # Redémarrage : tout doit être retrouvé depuis les journaux
+        restarted = TicketGenerator(storage="journal")
+        assert restarted.get_ticket_info(result["ticket_id"]) is not None
+        second = restarted.validate_ticket_qr(result["qr_content"])
+        assert not second["valid"], "Le double scan doit être détecté après redémarrage"
+
+    print("✓ Billets et validations retrouvés après redémarrage")
+    print()
+
+
+def test_sqlite_store():
+    """Test du stockage SQLite : migration JSON, requêtes indexées, marquage atomique"""
+    print("=== Test 3: Stockage SQLite ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator()
+        for i in range(3):
+            generator.generate_ticket("Soirée A", f"Invité {i}", ticket_type="VIP")
+        result = generator.generate_ticket("Soirée B", "Invité B")
+        generator.validate_ticket_qr(result["qr_content"])
+
+        # Le premier lancement en SQLite importe les fichiers JSON
+        migrated = TicketGenerator(storage="sqlite")
+        assert len(migrated.tickets) == 4, "Les billets JSON doivent être migrés"
+        assert result["ticket_id"] in migrated.tickets
+
+        stats = migrated.get_event_statistics("Soirée A")
+        assert stats["total_tickets_generated"] == 3
+        assert stats["ticket_types"] == {"VIP": 3}
+        assert len(stats["recent_tickets"]) == 3
+
+        duplicate = migrated.validate_ticket_qr(result["qr_content"])
+        assert duplicate["error"] == "Billet déjà utilisé", "La validation migrée doit bloquer le double scan"
+
+        # Deux connexions sur la même base : une seule insertion gagne
+        other = SqliteStore("ticket_validations.json", "validations")
+        other.load()
+        assert other.insert_if_absent("billet_x", {"validated_at": "t1"}) is None
+        assert migrated.validator.store.insert_if_absent("billet_x", {"validated_at": "t2"}) == {"validated_at": "t1"}
+        other.close()
+
+    print("✓ Migration, statistiques et double scan OK")
+    print()
+
+
+def test_parallel_batch():
+    """Test de la génération en lot avec un pool de processus"""
+    print("=== Test 4: Génération en lot parallèle ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator()
+        buyers = [{"nom": "Marie", "email": "marie@email.com"}, 42, "Paul", "Sophie"]
+        results = generator.generate_batch_tickets("Soirée Lot", buyers, workers=2, chunk_size=2)
+
+        assert [r["index"] for r in results] == [1, 2, 3, 4], "L'ordre des résultats doit être conservé"
+        assert not results[1]["success"], "Un acheteur invalide doit produire une erreur"
+        for result in (results[0], results[2], results[3]):
+            assert result["success"], result.get("error")
+            assert os.path.exists(result["filepath"]), "Le PNG doit être écrit par le pool"
+
+        reloaded = TicketGenerator()
+        assert len(reloaded.tickets) == 3, "Tous les billets du lot doivent être enregistrés"
+
+    print("✓ 3/4 billets générés dans l'ordre, erreur conservée")
+    print()
+
+
+def test_compact_payload():
+    """Test du format compact TICKET-V2"""
+    print("=== Test 5: Format compact V2 ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator(payload_format="v2")
+        result = generator.generate_ticket("Soirée V2", "Jean Dupont", event_date="2025-12-31T20:00:00",
+                                           ticket_type="VIP")
+        qr_content = result["qr_content"]
+        assert qr_content.startswith("TICKET-V2:")
+        assert len(qr_content) < 80, "Le contenu V2 doit rester très court"
+
+        # Falsifier un caractère doit invalider la signature
+        forged = qr_content[:-1] + ("0" if qr_content[-1] != "0" else "1")
+        assert not generator.validate_ticket_qr(forged)["valid"], "Un billet modifié doit être refusé"
+
+        validation = generator.validate_ticket_qr(qr_content)
+        assert validation["valid"], validation.get("error")
+        assert validation["event_name"] == "Soirée V2"
+        assert validation["ticket_data"]["buyer_info"]["nom"] == "Jean Dupont", "Acheteur complété depuis la base"
+        assert validation["event_date"] == "2025-12-31T20:00:00"
+
+        # Les billets V1 restent acceptés
+        generator.payload_format = "v1"
+        legacy = generator.generate_ticket("Soirée V2", "Paul")
+        assert generator.validate_ticket_qr(legacy["qr_content"])["valid"]
+
+    print("✓ Billets V2 signés, validés et complétés depuis la base")
+    print()
+
+
+def test_lazy_images():
+    """Test du rendu des images à la demande avec cache LRU et disque"""
+    print("=== Test 6: Rendu des images à la demande ===")
+
+    with dossier_temporaire():
+        cache = TicketImageCache(max_bytes=10 * 1024, disk_dir="cache", disk_max_bytes=10 * 1024)
+        generator = TicketGenerator(render_images=False, image_cache=cache)
+        first = generator.generate_ticket("Soirée Lazy", "Jean")
+        second = generator.generate_ticket("Soirée Lazy", "Paul")
+        assert first["image"] is None and not os.path.exists(first["filepath"]), "Aucun PNG à la génération"
+
+        png = generator.get_ticket_png(first["filename"])
+        assert png.startswith(b"\x89PNG"), "Le PNG doit être rendu au premier accès"
+        assert generator.get_ticket_png(first["filename"]) == png
+        assert cache.get_stats()["hits"] == 1 and cache.get_stats()["misses"] == 1
+
+        # Le cache disque survit au cache mémoire
+        cache.clear()
+        assert generator.get_ticket_png(first["filename"]) == png
+        assert cache.get_stats()["misses"] == 1, "Le PNG doit être relu depuis le cache disque"
+
+        generator.get_ticket_png(second["filename"])
+        assert cache.get_stats()["bytes"] <= 10 * 1024, "Le LRU mémoire doit rester borné"
+        assert generator.get_ticket_png("inconnu.png") is None
+        assert generator.get_ticket_png("../tickets_database.json") is None
+
+    print("✓ Images rendues au premier accès puis servies depuis le cache")
+    print()
+
+
+def test_batch_zip():
+    """Test de l'archive ZIP filtrée, envoyée par morceaux puis mise en cache"""
+    print("=== Test 7: Archive ZIP des billets ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator(render_images=False)
+        for i in range(3):
+            generator.generate_ticket("Soirée Zip", f"Invité {i}", ticket_type="VIP")
+        generator.generate_ticket("Soirée Zip", "Standard")
+        generator.generate_ticket("Autre soirée", "Ailleurs", ticket_type="VIP")
+
+        selection = {"event_name": "Soirée Zip", "ticket_type": "VIP"}
+        assert generator.get_selection_summary(**selection)["count"] == 3
+        assert generator.get_selection_summary(until="2000-01-01")["count"] == 0
+
+        cache = ZipBundleCache("zip_cache")
+        key = ZipBundleCache.key_for(selection, generator.get_selection_summary(**selection))
+        chunks = list(cache.store(key, stream_zip(generator.iter_ticket_files(**selection), chunk_size=1)))
+        assert len(chunks) > 3, "L'archive doit être produite par morceaux"
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+            infos = archive.infolist()
+            assert len(infos) == 3, "Seuls les billets VIP de l'événement doivent être archivés"
+            assert all(info.compress_type == zipfile.ZIP_STORED for info in infos), "PNG stockés sans recompression"
+            assert archive.read(infos[0]).startswith(b"\x89PNG"), "Les images absentes doivent être rendues"
+
+        cached_path = cache.get(key)
+        assert cached_path is not None, "L'archive complète doit être mise en cache"
+        with open(cached_path, 'rb') as f:
+            assert f.read() == b"".join(chunks)
+
+    print("✓ Archive filtrée, STORED, en cache pour les téléchargements suivants")
+    print()
+
+
+def test_batch_signing():
+    """Test de la signature et de la vérification en lot"""
+    print("=== Test 8: Signature en lot ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator(render_images=False)
+        security = generator.security
+        tickets = [{"ticket_id": f"billet_{i}", "buyer_info": {"nom": f"Invité {i}"}} for i in range(3)]
+        signed = security.sign_many("Soirée Lot", tickets)
+        contents = [content for _, content in signed]
+
+        single = security.create_ticket_data("Soirée Lot", "billet_0", buyer_info={"nom": "Invité 0"})
+        assert single["data"]["buyer_info"] == signed[0][0]["data"]["buyer_info"]
+
+        results = security.verify_many(contents + ["TICKET_V1:ZmFrZQ=="])
+        assert [result["valid"] for result in results] == [True, True, True, False]
+        assert [result["ticket_id"] for result in results[:3]] == ["billet_0", "billet_1", "billet_2"]
+
+        compact = security.sign_many("Soirée Lot", [{"ticket_id": "12345678-1234-5678-1234-567812345678"}],
+                                     compact=True)
+        assert security.verify_many([compact[0][1]])[0]["valid"], "Le format compact doit aussi être signé en lot"
+
+        generator.payload_format = "v2"
+        results = generator.generate_batch_tickets("Soirée Lot", ["Jean", "Paul"], event_date="pas une date")
+        assert not any(result["success"] for result in results), "Une date invalide doit faire échouer le lot"
+
+    print("✓ Billets signés et vérifiés en lot")
+    print()
+
+
+def test_validation_fast_path():
+    """Test des refus immédiats : billet déjà utilisé et contenus déjà refusés"""
+    print("=== Test 9: Refus avant vérification de la signature ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator(render_images=False)
+        validator = generator.validator
+        validator.rejected_cache_size = 2
+        result = generator.generate_ticket("Soirée Rapide", "Jean")
+        assert validator.validate_and_log(result["qr_content"])["valid"]
+        assert validator.validate_and_log("FLYER")["error"] == "QR code non reconnu"
+        forged = result["qr_content"][:-4] + "AAA="
+        forged_error = validator.validate_and_log(forged)["error"]
+
+        # Plus aucun décodage : tout doit venir des raccourcis
+        decode = validator.security.decode_ticket_from_qr
+        validator.security.decode_ticket_from_qr = None
+        duplicate = validator.validate_and_log(result["qr_content"])
+        assert duplicate["error"] == "Billet déjà utilisé"
+        assert duplicate["ticket_data"]["ticket_id"] == result["ticket_id"]
+        assert validator.validate_and_log("FLYER")["error"] == "QR code non reconnu"
+        assert validator.validate_and_log(forged)["error"] == forged_error
+        validator.security.decode_ticket_from_qr = decode
+
+        validator.validate_and_log("AUTRE FLYER")
+        assert len(validator._rejected_payloads) == 2, "Le cache des refus doit rester borné"
+
+        validator.reset_validations()
+        assert validator.validate_and_log(result["qr_content"])["valid"], "La réinitialisation vide les raccourcis"
+
+    print("✓ Doubles scans et contenus refusés traités sans décodage")
+    print()
+
+
+def _scanner_partage(nom_worker):
+    """Worker de test : tente de marquer les mêmes billets que les autres"""
+    store = SharedJournalStore("validations.json", "validations", fsync_every=0, compact_every=7)
+    store.load()
+    accepted = [key for key in (f"billet_{i}" for i in range(40))
+                if store.insert_if_absent(key, {"validated_at": nom_worker}) is None]
+    store.close()
+    return accepted
+
+
+def test_shared_store():
+    """Test du stockage partagé : un billet accepté une seule fois entre processus"""
+    print("=== Test 10: Validation multi-processus ===")
+
+    with dossier_temporaire():
+        with multiprocessing.get_context("fork").Pool(4) as pool:
+            accepted = pool.map(_scanner_partage, [f"worker_{i}" for i in range(4)])
+
+        all_accepted = [key for keys in accepted for key in keys]
+        assert sorted(all_accepted) == sorted(f"billet_{i}" for i in range(40)), \
+            "Chaque billet doit être accepté exactement une fois"
+
+        store = SharedJournalStore("validations.json", "validations")
+        store.load()
+        assert store.count() == 40, "Les compactions concurrentes ne doivent rien perdre"
+
+        # Un autre processus écrit : visible sans recharger
+        other = SharedJournalStore("validations.json", "validations")
+        other.load()
+        other.put("billet_x", {"validated_at": "autre"})
+        assert store.get("billet_x") == {"validated_at": "autre"}
+        other.compact()
+        other.put("billet_y", {"validated_at": "autre"})
+        assert store.count() == 42, "Le journal compacté ailleurs doit être relu"
+        assert store.insert_if_absent("billet_y", {}) == {"validated_at": "autre"}
+
+        # Un processus tué en pleine écriture laisse une ligne incomplète
+        with open("validations.json.journal", "a", encoding='utf-8') as f:
+            f.write('{"op":"put","key":"billet_tronq')
+        assert store.get("billet_y") == {"validated_at": "autre"}, "La ligne incomplète doit être ignorée"
+        other.put("billet_z", {"validated_at": "après"})
+        assert store.get("billet_z") == {"validated_at": "après"}, "L'ajout suivant doit rester lisible"
+        assert store.get("billet_tronque") is None and store.count() == 43
+        third = SharedJournalStore("validations.json", "validations")
+        third.load()
+        assert third.count() == 43
+
+        # Deux compactions ailleurs puis un journal plus long que la position
+        # mémorisée : la génération (pas l'inode) impose de tout relire
+        with open("validations.json.lock", encoding='utf-8') as f:
+            generation = int(f.read())
+        other.compact()
+        other.compact()
+        other.put_many((f"gen_{i}", {"validated_at": "gen"}) for i in range(100))
+        with open("validations.json.lock", encoding='utf-8') as f:
+            assert int(f.read()) == generation + 2
+        assert store.count() == 143 and store.get("gen_99") == {"validated_at": "gen"}
+
+    print(f"✓ 40 billets, {len(all_accepted)} acceptations réparties sur 4 processus")
+    print()
+
+
+def test_bulk_validation():
+    """Test de la validation en lot : ordre, premier scan gagnant, une seule écriture"""
+    print("=== Test 11: Validation en lot ===")
+
+    for storage in ("json", "sqlite"):
+        with dossier_temporaire():
+            generator = TicketGenerator(storage=storage, render_images=False)
+            first = generator.generate_ticket("Soirée Lot", "Jean")["qr_content"]
+            second = generator.generate_ticket("Soirée Lot", "Paul")["qr_content"]
+
+            writes = []
+            store = generator.validator.store
+            if storage == "json":
+                write_snapshot = store._write_snapshot
+                store._write_snapshot = lambda records: writes.append(1) or write_snapshot(records)
+
+            scans = [(first, {"location": "A"}), ("FLYER", None), (first, {"location": "B"}), (second, None)]
+            results = generator.validate_tickets_qr(scans)
+            assert [result["valid"] for result in results] == [True, False, False, True]
+            assert results[2]["error"] == "Billet déjà utilisé"
+            assert results[2]["previous_validation"]["scanner_info"]["location"] == "A", "Le premier scan gagne"
+            if storage == "json":
+                assert writes == [1], "Une seule écriture pour tout le lot"
+            assert generator.validator.store.count() == 2
+
+    print("✓ Lot validé dans l'ordre, doublon refusé, une seule écriture")
+    print()
+
+
+def test_offline_manifest():
+    """Test du manifeste des scanners hors ligne : complet, delta et billets utilisés"""
+    print("=== Test 12: Manifeste hors ligne ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator(render_images=False)
+        first = generator.generate_ticket("Soirée Offline", "Jean")["qr_content"]
+        generator.generate_ticket("Autre soirée", "Paul")
+
+        manifest = generator.get_offline_manifest("Soirée Offline")
+        assert manifest["full"] and manifest["tags"] == [offline_tag(first)]
+        assert manifest["used"] == [] and manifest["version"]["tickets"] is not None
+        assert first not in json.dumps(manifest), "Le manifeste ne doit contenir que des empreintes"
+
+        second = generator.generate_ticket("Soirée Offline", "Marie")["qr_content"]
+        generator.validate_ticket_qr(first)
+        delta = generator.get_offline_manifest("Soirée Offline", manifest["version"]["tickets"],
+                                               manifest["version"]["validations"])
+        assert not delta["full"]
+        assert offline_tag(second) in delta["tags"], "Le delta doit contenir les nouveaux billets"
+        assert delta["used"] == [offline_tag(first)], "Le delta doit contenir les billets utilisés"
+
+    print("✓ Manifeste complet puis delta (nouveaux billets et billets utilisés)")
+    print()
+
+
+def test_numbered_tickets():
+    """Test des billets numérotés : numéros signés et registre d'un bit par billet"""
+    print("=== Test 13: Billets numérotés ===")
+
+    for payload_format in ("v1", "v2"):
+        with dossier_temporaire():
+            generator = TicketGenerator(payload_format=payload_format, render_images=False, numbered=True)
+            first = generator.generate_ticket("Soirée Numérotée", "Jean")
+            batch = generator.generate_batch_tickets("Soirée Numérotée", ["Paul", "Marie"])
+            generator.generate_ticket("Autre soirée", "Luc")
+
+            ticket_data = generator.security.decode_ticket_from_qr(first["qr_content"])
+            assert ticket_data is not None and generator.security.validate_ticket(ticket_data)["valid"]
+            numbers = [generator.get_ticket_info(result["ticket_id"])["ticket_number"]
+                       for result in [first] + batch]
+            assert numbers == [1, 2, 3], f"Numéros séquentiels attendus: {numbers}"
+
+            assert generator.validate_ticket_qr(first["qr_content"])["valid"]
+            generator.validator._used_payloads.clear()  # forcer le passage par le registre
+            again = generator.validate_ticket_qr(first["qr_content"])
+            assert again["error"] == "Billet déjà utilisé"
+
+            stats = [generator.bitmaps.for_event(name[:-5]).get_stats()
+                     for name in sorted(os.listdir("ticket_bitmaps"))]
+            assert sorted(stats, key=lambda s: s["issued"]) == [{"issued": 1, "used": 0}, {"issued": 3, "used": 1}]
+            assert all(os.path.getsize(os.path.join("ticket_bitmaps", name)) == 9
+                       for name in os.listdir("ticket_bitmaps")), "En-tête de 8 octets + 1 octet de bits"
+
+            generator.validator.reset_validations()
+            assert generator.validate_ticket_qr(first["qr_content"])["valid"], "Registre remis à zéro"
+
+            # Validation non enregistrée : le billet n'est pas marqué utilisé
+            def panne(*args, **kwargs):
+                raise OSError("disque plein")
+
+            validations = generator.validator.store
+            validations.insert_many_if_absent = panne
+            paul = generator.get_ticket_info(batch[0]["ticket_id"])["qr_content"]
+            try:
+                generator.validate_ticket_qr(paul)
+                assert False, "L'échec d'écriture doit remonter"
+            except OSError:
+                pass
+            del validations.insert_many_if_absent
+            assert generator.validate_ticket_qr(paul)["valid"], "Le bit ne doit pas rester posé"
+
+            # Billets rendus mais non enregistrés : images effacées, numéros rendus au registre
+            generator.render_images = True
+            os.makedirs(generator.output_dir, exist_ok=True)
+            images = set(os.listdir(generator.output_dir))
+            generator.ticket_store.put_many = panne
+            failed = generator.generate_batch_tickets("Soirée Numérotée", ["Zoé", "Léa"])
+            assert not any(result["success"] for result in failed)
+            assert set(os.listdir(generator.output_dir)) == images, "Aucune image signée orpheline"
+            del generator.ticket_store.put_many
+            retry = generator.generate_batch_tickets("Soirée Numérotée", ["Zoé", "Léa"])
+            assert [generator.get_ticket_info(result["ticket_id"])["ticket_number"] for result in retry] == [4, 5]
+
+    print(f"✓ Numéros 1..n signés (V1 et V2, enregistrement V2 de {V2_NUMBERED_RECORD.size} octets), "
+          "double scan refusé par le registre")
+    print()
+
+
+def test_incremental_stats():
+    """Test des statistiques tenues à jour : mêmes chiffres qu'un recomptage, refus comptés"""
+    print("=== Test 14: Statistiques incrémentales ===")
+
+    for storage in ("json", "shared"):
+        with dossier_temporaire():
+            generator = TicketGenerator(storage=storage, render_images=False)
+            first = generator.generate_ticket("Soirée A", "Jean", ticket_type="VIP")["qr_content"]
+            generator.generate_batch_tickets("Soirée B", ["Paul", "Marie"])
+            generator.validate_tickets_qr([(first, None), (first, None), ("FLYER", None)])
+
+            stats = generator.get_event_statistics()
+            assert stats["total_tickets_generated"] == 3 and stats["total_tickets_validated"] == 1
+            assert stats["events"] == generator.ticket_store.count_by("event_name", default="Inconnu")
+            assert stats["ticket_types"] == {"VIP": 1, "Standard": 2}
+            assert [ticket["buyer_info"]["nom"] for ticket in stats["recent_tickets"]][-1] == "Jean"
+            assert generator.get_event_statistics("Soirée B")["ticket_types"] == {"Standard": 2}
+            assert generator.validator.get_validation_stats()["invalid_scans"] == 2
+
+            # Billets ajoutés par un autre processus : rattrapés sans recomptage complet
+            other = TicketGenerator(storage=storage, render_images=False)
+            other.generate_ticket("Soirée A", "Luc")
+            if storage == "json":
+                generator.ticket_store.load()
+            assert generator.get_event_statistics("Soirée A")["total_tickets_generated"] == 2
+
+            generator.validator.reset_validations()
+            validation_stats = generator.validator.get_validation_stats()
+            assert validation_stats["total_validated"] == 0 and validation_stats["invalid_scans"] == 0
+
+            if storage == "shared":
+                # Refus vus par deux workers : mêmes totaux quel que soit celui qui répond
+                other.validate_tickets_qr([("FLYER", {"location": "Porte B"}), ("PUB", {"location": "Porte B"})])
+                generator.validate_ticket_qr("TRACT", {"location": "Porte A"})
+                for worker in (generator, other):
+                    validation_stats = worker.validator.get_validation_stats()
+                    assert validation_stats["invalid_scans"] == 3
+                    assert validation_stats["invalid_by_location"] == {"Porte A": 1, "Porte B": 2}
+                other.validator.reset_validations()
+                assert generator.validator.get_validation_stats()["invalid_scans"] == 0
+
+                # Refus rapprochés : les derniers sont écrits par le minuteur
+                generator.validator.rejections.flush_interval = 0.05
+                generator.validate_ticket_qr("TRACT 2", {"location": "Porte A"})
+                generator.validate_ticket_qr("TRACT 3", {"location": "Porte A"})
+                time.sleep(0.3)
+                assert other.validator.get_validation_stats()["invalid_by_location"] == {"Porte A": 2}
+
+    print("✓ Compteurs identiques à un recomptage, refus et écritures externes pris en compte")
+    print()
+
+
+def test_live_stats():
+    """Test du flux en direct : un seul calcul pour tous les abonnés, sections modifiées seules"""
+    print("=== Test 15: Statistiques en direct (SSE) ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator(render_images=False)
+        first = generator.generate_ticket("Soirée Live", "Jean")["qr_content"]
+        generator.validate_tickets_qr([(first, {"location": "Porte A"}), ("FLYER", {"location": "Porte B"})])
+
+        computations = []
+        live = LiveStats(lambda: computations.append(1) or generator.get_live_stats(), interval=60)
+        streams = [live.stream() for _ in range(50)]
+        for stream in streams:
+            assert next(stream).startswith("retry:")
+            messages = [next(stream) for _ in range(4)]
+        assert computations == [1], "Les abonnés doivent partager le même calcul"
+        assert messages[3] == ('event: gates\ndata: {"Porte A": {"admitted": 1, "rejected": 0}, '
+                               '"Porte B": {"admitted": 0, "rejected": 1}}\n\n')
+
+        # Seule la section modifiée est renvoyée
+        generator.generate_ticket("Soirée Live", "Paul")
+        live.interval = 0
+        stream = streams[0]
+        assert next(stream).startswith("event: generation\n")
+
+    # Deux workers : le flux de l'un compte les refus vus par l'autre
+    with dossier_temporaire():
+        worker_a = TicketGenerator(storage="shared", render_images=False)
+        worker_b = TicketGenerator(storage="shared", render_images=False)
+        worker_b.validate_tickets_qr([("FLYER", {"location": "Porte C"}), ("PUB", {"location": "Porte C"})])
+        messages = list(itertools.islice(LiveStats(worker_a.get_live_stats, interval=60).stream(), 5))
+        assert messages[3] == 'event: rejections\ndata: {"total": 2}\n\n'
+        assert messages[4] == 'event: gates\ndata: {"Porte C": {"admitted": 0, "rejected": 2}}\n\n'
+
+    with dossier_temporaire():
+        # Pool de 4 threads comme un worker gunicorn : 3 flux au plus, le 4e est
+        # renvoyé vers /ticket-stats et un scan passe encore
+        import app as application
+        application.live_stats = LiveStats(application.ticket_gen.get_live_stats, max_streams=3)
+        client = application.app.test_client()
+        ticket = application.ticket_gen.generate_ticket("Soirée Live", "Marie")["qr_content"]
+        opened = threading.Semaphore(0)
+        closing = threading.Event()
+
+        def dashboard():
+            response = client.get('/ticket-stats/stream', buffered=False)
+            if response.status_code != 200:
+                return response.status_code, response.get_json()
+            next(response.response)
+            opened.release()
+            closing.wait(10)  # le thread reste occupé tant que le flux est ouvert
+            response.close()
+            return response.status_code, None
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            dashboards = [pool.submit(dashboard) for _ in range(3)]
+            for _ in range(3):
+                assert opened.acquire(timeout=5), "Les 3 premiers flux doivent s'ouvrir"
+            refused = pool.submit(dashboard).result(timeout=5)
+            assert refused == (503, {"error": "Trop de flux en direct ouverts", "fallback": "/ticket-stats"})
+            scan = pool.submit(client.post, '/validate-ticket', data={'qr_data': ticket})
+            assert scan.result(timeout=5).get_json()["valid"], "Un scan doit passer malgré les flux ouverts"
+            closing.set()
+            assert [future.result(timeout=5)[0] for future in dashboards] == [200, 200, 200]
+        reopened = client.get('/ticket-stats/stream', buffered=False)
+        assert reopened.status_code == 200, "Les places doivent être rendues à la fermeture"
+        reopened.close()
+
+    print("✓ 50 abonnés, un calcul ; seules les sections modifiées sont envoyées ; flux plafonnés")
+    print()
+
+
+def test_scan_service():
+    """Test du service de scan ASGI : contrat /validate-ticket et écritures groupées"""
+    print("=== Test 16: Service de scan asynchrone ===")
+
+    async def post(service, body, content_type):
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "path": "/validate-ticket", "method": "POST",
+                 "headers": [(b"content-type", content_type.encode())]}
+        await service(scope, receive, send)
+        return json.loads(messages[1]["body"])
+
+    async def scenario(service, qr_content):
+        multipart = ("--X\r\nContent-Disposition: form-data; name=\"qr_data\"\r\n\r\n"
+                     f"{qr_content}\r\n--X\r\nContent-Disposition: form-data; "
+                     "name=\"scanner_location\"\r\n\r\nPorte A\r\n--X--\r\n").encode()
+        requests = [post(service, multipart, "multipart/form-data; boundary=X")]
+        requests += [post(service, f"qr_data={qr_content}".encode(), "application/x-www-form-urlencoded")
+                     for _ in range(9)]
+        requests.append(post(service, b"qr_data=", "application/x-www-form-urlencoded"))
+        results = await asyncio.gather(*requests)
+        await service.stop()
+        return results
+
+    with dossier_temporaire():
+        generator = TicketGenerator(render_images=False)
+        qr_content = generator.generate_ticket("Soirée ASGI", "Jean")["qr_content"]
+
+        batches = []
+        validate = generator.validate_tickets_qr
+        generator.validate_tickets_qr = lambda scans: batches.append(len(scans)) or validate(scans)
+
+        results = asyncio.run(scenario(ScanService(generator), qr_content))
+        assert [result["valid"] for result in results] == [True] + [False] * 10
+        assert results[0]["first_use"] and results[1]["error"] == "Billet déjà utilisé"
+        assert results[-1]["error"] == "Aucune donnée QR fournie"
+        assert batches == [10], f"Les scans concurrents doivent former un seul lot: {batches}"
+        assert generator.validator.store.get(results[0]["ticket_data"]["ticket_id"])["scanner_info"]["location"] == "Porte A"
+
+    # Écriture du lot impossible (disque plein) : 503, rien d'enregistré, billet encore valide
+    async def scan_status(service, qr_content):
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": f"qr_data={qr_content}".encode(), "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "path": "/validate-ticket", "method": "POST",
+                 "headers": [(b"content-type", b"application/x-www-form-urlencoded")]}
+        await service(scope, receive, send)
+        return messages[0]["status"], json.loads(messages[1]["body"])
+
+    def panne(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    async def failed_then_valid(service, qr_content):
+        store = service.generator.validator.store
+        if isinstance(store, JournalStore):
+            # Journal impossible à écrire : la ligne ne doit pas rester, la mémoire non plus
+            store._journal.close()
+            store._journal = open(store.journal_path, 'r', encoding='utf-8')
+        else:
+            store._write_snapshot = panne
+        failed = await scan_status(service, qr_content)
+        store.__dict__.pop("_write_snapshot", None)
+        retried = await scan_status(service, qr_content)
+        await service.stop()
+        return failed, retried
+
+    for storage in ("json", "journal", "shared"):
+        with dossier_temporaire():
+            generator = TicketGenerator(storage=storage, render_images=False, numbered=True)
+            ticket = generator.generate_ticket("Soirée ASGI", "Jean")
+            (status, failed), (_, retried) = asyncio.run(
+                failed_then_valid(ScanService(generator), ticket["qr_content"])
+            )
+            assert status == 503 and not failed["valid"], f"{storage}: {status} {failed}"
+            assert retried["valid"] and retried["first_use"], f"{storage}: bit ou mémoire non libérés"
+            generator.validator.store.close()
+            reloaded = TicketGenerator(storage=storage, render_images=False, numbered=True)
+            assert reloaded.validator.store.count() == 1, f"{storage}: une seule validation sur disque"
+
+    print("✓ Formulaires multipart et urlencoded, 10 scans concurrents en un seul lot, "
+          "503 si le lot n'a pas pu être écrit")
+    print()
+
+
+def test_compact_records():
+    """Test des enregistrements compacts : même vue dictionnaire, même fichier, moins de mémoire"""
+    print("=== Test 17: Enregistrements compacts en mémoire ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator(storage="json", render_images=False)
+        tickets = generator.generate_batch_tickets("Soirée Compacte", [f"Invité {i}" for i in range(200)])
+        generator.validate_tickets_qr([(generator.get_ticket_info(ticket["ticket_id"])["qr_content"],
+                                        {"location": "Porte A", "user_agent": "Scanner"})
+                                       for ticket in tickets[:100]])
+
+        for path, store in (("tickets_database.json", generator.ticket_store),
+                            ("ticket_validations.json", generator.validator.store)):
+            assert isinstance(store.records, CompactRecords)
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            records = json.loads(text)
+            assert dict(store.records) == records, "La vue dictionnaire doit rendre les enregistrements d'origine"
+            assert text == json.dumps(records, indent=2, ensure_ascii=False), "Le format du fichier ne change pas"
+
+        assert generator.ticket_store.count(event_name="Soirée Compacte") == 200
+        assert generator.validator.store.count_by("location") == {"Porte A": 100}
+
+        # Mémoire : comparer aux mêmes enregistrements en dictionnaires
+        with open("tickets_database.json", encoding='utf-8') as f:
+            text = f.read()
+        tracemalloc.start()
+        as_dicts = json.loads(text)
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        tracemalloc.start()
+        compact = CompactRecords(json.loads(text))
+        compact_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert dict(compact) == as_dicts
+        assert compact_bytes * 2 < dict_bytes, f"Gain insuffisant: {dict_bytes} -> {compact_bytes} octets"
+
+    print(f"✓ Vue et fichier identiques, mémoire des billets ÷{dict_bytes / compact_bytes:.1f}")
+    print()
+
+
+def test_normalized_schema():
+    """Test du format normalisé : pas de qr_content ni de ticket_data en double sur disque"""
+    print("=== Test 18: Format normalisé des bases ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator(storage="json", render_images=False)
+        tickets = generator.generate_batch_tickets("Soirée Normalisée", [f"Invité {i}" for i in range(50)])
+        single = generator.generate_ticket("Soirée Normalisée", "Seul")
+        contents = {ticket["ticket_id"]: generator.get_ticket_info(ticket["ticket_id"])["qr_content"]
+                    for ticket in tickets}
+        assert generator.get_ticket_info(single["ticket_id"])["qr_content"] == single["qr_content"]
+
+        stored = generator.ticket_store.get(single["ticket_id"])
+        assert "qr_content" not in stored and stored["signature"] and stored["signed_at"]
+        generator.validate_tickets_qr([(qr_content, None) for qr_content in contents.values()])
+        entry = generator.validator.store.get(tickets[0]["ticket_id"])
+        assert "ticket_data" not in entry and entry["event_name"] == "Soirée Normalisée"
+
+        # Un second scan rend toujours les données du billet
+        second = generator.validate_ticket_qr(contents[tickets[0]["ticket_id"]])
+        assert not second["valid"] and second["ticket_data"]["buyer_info"]["nom"] == "Invité 0"
+        recent = generator.validator.get_validation_stats()["recent_validations"]
+        assert all(validation["ticket_data"]["event_name"] == "Soirée Normalisée" for validation in recent)
+        recent_tickets = generator.get_event_statistics("Soirée Normalisée")["recent_tickets"]
+        assert recent_tickets and all(ticket["qr_content"] == generator.get_ticket_info(ticket["ticket_id"])["qr_content"]
+                                      for ticket in recent_tickets), "Derniers billets avec leur qr_content"
+
+        # Anciennes bases (qr_content et ticket_data recopiés) : lisibles, puis migrées
+        legacy_tickets = {ticket_id: generator.get_ticket_info(ticket_id) for ticket_id in generator.ticket_store.records}
+        for record in legacy_tickets.values():
+            record.pop("signature", None)
+            record.pop("signed_at", None)
+        legacy_validations = {ticket_id: generator.validator.with_ticket_data(entry)
+                              for ticket_id, entry in generator.validator.store.records.items()}
+        generator.ticket_store.close()
+        generator.validator.store.close()
+        for path, records in (("tickets_database.json", legacy_tickets),
+                              ("ticket_validations.json", legacy_validations)):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, indent=2, ensure_ascii=False)
+
+        report = migrate("json")
+        assert report["tickets"]["normalized"] == 51 and report["validations"]["normalized"] == 50
+        for table in ("tickets", "validations"):
+            assert report[table]["size_after"] < report[table]["size_before"]
+
+        migrated = TicketGenerator(storage="json", render_images=False)
+        assert all(migrated.get_ticket_info(ticket_id)["qr_content"] == qr_content
+                   for ticket_id, qr_content in contents.items())
+        assert migrated.validator.store.count(event_name="Soirée Normalisée") == 50
+        assert not migrated.validate_ticket_qr(contents[tickets[1]["ticket_id"]])["valid"]
+
+        # Billet d'une base d'avant le format normalisé (qr_content, sans signed_at)
+        # et validation sans ticket_data : données lues dans le QR code signé
+        legacy = migrated.generate_ticket("Soirée Normalisée", "Ancien")
+        record = {key: value for key, value in migrated.ticket_store.get(legacy["ticket_id"]).items()
+                  if key not in ("signature", "signed_at")}
+        record.update(qr_content=legacy["qr_content"], generated_at="2024-01-01T00:00:00")
+        migrated.ticket_store.put(legacy["ticket_id"], record)
+        entry = migrated.validator.with_ticket_data({"ticket_id": legacy["ticket_id"], "validated_at": "x"})
+        assert entry["ticket_data"] == legacy["signed_ticket"]["data"], "Données signées, pas la date en base"
+
+    print(f"✓ Billets {report['tickets']['size_before']} -> {report['tickets']['size_after']} octets, "
+          f"validations {report['validations']['size_before']} -> {report['validations']['size_after']} octets")
+    print()
+
+
+def test_streaming_export():
+    """Test de l'export en flux : CSV et NDJSON par morceaux, filtres, état de scan"""
+    print("=== Test 19: Export des billets en flux ===")
+
+    with dossier_temporaire():
+        generator = TicketGenerator(storage="json", render_images=False)
+        tickets = generator.generate_batch_tickets("Soirée Export", [f"Invité {i}" for i in range(25)])
+        generator.generate_batch_tickets("Autre Soirée", ["Intrus"])
+        generator.validate_tickets_qr([(generator.get_ticket_info(ticket["ticket_id"])["qr_content"],
+                                        {"location": "Porte B"}) for ticket in tickets[:10]])
+
+        chunks = generator.iter_export("csv", chunk_size=10, event_name="Soirée Export", include_validation=True)
+        assert not isinstance(chunks, (list, str)), "L'export doit être produit au fil de l'eau"
+        chunks = list(chunks)
+        assert len(chunks) == 3, f"25 lignes par 10 : 3 morceaux attendus, {len(chunks)} obtenus"
+        rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+        assert len(rows) == 25 and {row["event_name"] for row in rows} == {"Soirée Export"}
+        assert sum(row["validated"] == "True" for row in rows) == 10
+        assert {row["validation_location"] for row in rows if row["validated"] == "True"} == {"Porte B"}
+
+        lines = "".join(generator.iter_export("ndjson")).splitlines()
+        assert len(lines) == 26 and "validated" not in json.loads(lines[0])
+        assert not list(generator.iter_export("ndjson", until="2000-01-01"))
+        assert generator.export_tickets_list("Soirée Export", format="csv") == \
+            "".join(generator.iter_export("csv", event_name="Soirée Export"))
+        assert generator.export_tickets_list("Inconnue", format="csv") == ""
+
+    print(f"✓ {len(rows)} lignes CSV en {len(chunks)} morceaux, {len(lines)} lignes NDJSON")
+    print()
+
+
+def test_resumable_issue():
+    """Test de l'émission depuis un CSV : reprise après arrêt sans billet en double"""
+    print("=== Test 20: Émission en masse reprenable ===")
+
+    with dossier_temporaire():
+        with open("acheteurs.csv", "w", newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(["Nom", "Email"])
+            writer.writerows([f"Invité {i}", f"invite{i}@example.com"] for i in range(30))
+            writer.writerow(["", "sans.nom@example.com"])
+
+        # Arrêt juste après l'enregistrement du 2e paquet, avant son point de reprise
+        generator = TicketGenerator(storage="journal", render_images=False)
+        generate_batch = generator.generate_batch_tickets
+        calls = []
+
+        def generate_then_crash(*args, **kwargs):
+            results = generate_batch(*args, **kwargs)
+            calls.append(len(results))
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return results
+
+        generator.generate_batch_tickets = generate_then_crash
+        try:
+            issue_from_csv(generator, "acheteurs.csv", "Soirée Importée", chunk_size=10, progress=None)
+            assert False, "L'arrêt simulé aurait dû interrompre l'import"
+        except KeyboardInterrupt:
+            pass
+        generator.ticket_store.close()
+        with open("acheteurs.csv.checkpoint.json", encoding='utf-8') as f:
+            assert json.load(f)["rows_done"] == 10
+
+        resumed = TicketGenerator(storage="journal", render_images=False)
+        lines = []
+        checkpoint = issue_from_csv(resumed, "acheteurs.csv", "Soirée Importée", chunk_size=10,
+                                    progress=lines.append)
+        assert checkpoint["issued"] == 30 and checkpoint["failed_rows"] == [31]
+        assert not checkpoint["completed"], "Une ligne en échec laisse l'import inachevé"
+        assert resumed.ticket_store.count(event_name="Soirée Importée") == 30, "Aucun billet en double"
+        names = {ticket["buyer_info"]["nom"] for ticket in resumed.ticket_store.find(event_name="Soirée Importée")}
+        assert names == {f"Invité {i}" for i in range(30)}
+        assert any("billets/s" in line and "reste" in line for line in lines)
+
+        # Ligne insérée avant la ligne en échec : les suivantes ont changé de numéro, refus
+        with open("acheteurs.csv", "w", newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(["Nom", "Email"])
+            writer.writerow(["Nouveau", "nouveau@example.com"])
+            writer.writerows([f"Invité {i}", f"invite{i}@example.com"] for i in range(31))
+        try:
+            issue_from_csv(resumed, "acheteurs.csv", "Soirée Importée", chunk_size=10, progress=None)
+            assert False, "Un fichier décalé ne doit pas être repris"
+        except ValueError as e:
+            assert "ligne 1" in str(e), str(e)
+        assert resumed.ticket_store.count(event_name="Soirée Importée") == 30, "Rien d'émis en double"
+
+        # Fichier corrigé sur place : seule la ligne en échec est émise, avec son identifiant d'origine
+        with open("acheteurs.csv", "w", newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(["Nom", "Email"])
+            writer.writerows([f"Invité {i}", f"invite{i}@example.com"] for i in range(31))
+        checkpoint = issue_from_csv(resumed, "acheteurs.csv", "Soirée Importée", chunk_size=10, progress=None)
+        assert checkpoint["completed"] and checkpoint["issued"] == 31 and checkpoint["failed"] == 0
+        names = sorted(ticket["buyer_info"]["nom"]
+                       for ticket in resumed.ticket_store.find(event_name="Soirée Importée"))
+        assert names == sorted(f"Invité {i}" for i in range(31)), "Exactement un billet par ligne"
+
+        # Relancer un import terminé ne fait rien
+        assert issue_from_csv(resumed, "acheteurs.csv", "Soirée Importée", progress=None)["issued"] == 31
+        assert resumed.ticket_store.count(event_name="Soirée Importée") == 31
+        resumed.ticket_store.close()
+
+    print(f"✓ Reprise après la ligne 10 puis de la ligne en échec : {checkpoint['issued']} billets, aucun doublon")
+    print()
+
+
+def test_bulk_limits():
+    """Test des limites de /validate-tickets : refus avant de tout lire et analyser"""
+    print("=== Test 21: Limites des scans en lot ===")
+
+    with dossier_temporaire():
+        import app as application
+        client = application.app.test_client()
+        limit = application.MAX_BULK_SCANS
+
+        oversized = client.post('/validate-tickets', data=b"[" + b" " * application.MAX_BULK_BYTES + b"]",
+                                content_type='application/json')
+        assert oversized.status_code == 413, "Corps trop gros refusé d'après sa longueur"
+
+        # La ligne invalide après la limite n'est jamais analysée
+        ndjson = "{}\n" * (limit + 1) + "pas du json\n"
+        response = client.post('/validate-tickets', data=ndjson, content_type='application/x-ndjson')
+        assert response.status_code == 413 and response.get_json()["error"] == "Trop de scans"
+
+        response = client.post('/validate-tickets', data="pas du json", content_type='application/json')
+        assert response.status_code == 400
+
+    print(f"✓ Au-delà de {limit} scans ou {application.MAX_BULK_BYTES} octets : 413 sans tout analyser")
+    print()
+
+
+def main():
+    """Fonction principale de test"""
+    print("🧪 TESTS DE LA BILLETTERIE SÉCURISÉE")
+    print("=" * 50)
+    print()
+
+    try:
+        test_journal_store()
+        test_ticket_generator_journal()
+        test_sqlite_store()
+        test_parallel_batch()
+        test_compact_payload()
+        test_lazy_images()
+        test_batch_zip()
+        test_batch_signing()
+        test_validation_fast_path()
+        test_shared_store()
+        test_bulk_validation()
+        test_offline_manifest()
+        test_numbered_tickets()
+        test_incremental_stats()
+        test_live_stats()
+        test_scan_service()
+        test_compact_records()
+        test_normalized_schema()
+        test_streaming_export()
+        test_resumable_issue()
+        test_bulk_limits()
+    except AssertionError as e:
+        print(f"❌ ÉCHEC DU TEST: {e}")
+        sys.exit(1)
+
+    print("✅ Tests terminés avec succès!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from ticket_images import evict_oldest_files
+
+
+class _ChunkSink:
+    """Flux d'écriture non positionnable qui accumule les octets produits par zipfile.
+
+    Sans seek(), zipfile écrit chaque entrée d'un seul passage (en-tête,
+    données puis descripteur avec CRC et taille) : l'archive peut être
+    envoyée au fur et à mesure.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def stream_zip(entries, chunk_size=64 * 1024):
+    """Générer une archive ZIP morceau par morceau
+
+    entries : itérable de (nom, octets). Les entrées sont STORED (sans
+    compression) : les PNG sont déjà compressés, les recompresser ne fait
+    que consommer du CPU.
+    """
+    import zipfile
+    
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+            if sink.size >= chunk_size:
+                yield sink.take()
+    yield sink.take()
+
+
+class ZipBundleCache:
+    """Cache disque des archives ZIP déjà envoyées.
+
+    Une archive est écrite pendant son premier envoi puis servie comme un
+    simple fichier. Le dossier est limité en taille (les archives les moins
+    récemment téléchargées sont supprimées en premier).
+    """
+
+    def __init__(self, disk_dir, max_bytes=1024 * 1024 * 1024):
+        self.disk_dir = disk_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key_for(*parts):
+        """Nom de fichier de cache pour une sélection (filtres + état de la base)"""
+        digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8'))
+        return f"{digest.hexdigest()[:32]}.zip"
+
+    def get(self, key):
+        """Chemin absolu de l'archive en cache, ou None"""
+        path = os.path.abspath(os.path.join(self.disk_dir, key))
+        try:
+            os.utime(path)  # marquer comme récemment utilisée pour l'éviction
+        except OSError:
+            return None
+        return path
+
+    def store(self, key, chunks):
+        """Relayer les morceaux d'une archive en l'écrivant dans le cache.
+
+        L'archive n'est ajoutée au cache que si elle a été envoyée en entier.
+        """
+        path = os.path.join(self.disk_dir, key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            f = open(tmp_path, 'wb')
+        except OSError as e:
+            print(f"Erreur lors de l'écriture du cache ZIP {key}: {e}")
+            yield from chunks
+            return
+
+        complete = False
+        try:
+            with f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, path)
+            complete = True
+        finally:
+            if not complete:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+        with self._lock:
+            evict_oldest_files(self.disk_dir, self.max_bytes)
@@ -0,0 +1,187 @@
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au processus courant
+    fcntl = None
+
+
+# En-tête : signature puis nombre de billets émis (uint32 big-endian)
+BITMAP_HEADER = struct.Struct(">4sI")
+BITMAP_MAGIC = b"TBM1"
+
+
+class TicketBitmap:
+    """Registre compact d'un événement : numéros émis et un bit « utilisé » par billet.
+
+    Les billets sont numérotés à partir de 1 ; le bit du billet n est le
+    bit (n - 1), bit de poids fort en premier dans chaque octet. Un
+    événement d'un million de billets tient en 125 Ko. Chaque opération
+    relit le fichier sous verrou (fcntl.flock), le registre est donc
+    partagé entre processus.
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # Après un fork, rouvrir : le descripteur hérité partagerait le verrou
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self._fd
+
+    def _locked(self, operation):
+        with self._lock:
+            fd = self._open()
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                return operation(fd)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _read_issued(self, fd):
+        header = os.pread(fd, BITMAP_HEADER.size, 0)
+        if not header:
+            return 0
+        magic, issued = BITMAP_HEADER.unpack(header)
+        if magic != BITMAP_MAGIC:
+            raise ValueError(f"Registre de billets invalide: {self.path}")
+        return issued
+
+    def _sync(self, fd):
+        if self.fsync:
+            os.fsync(fd)
+
+    def allocate(self, count=1):
+        """Réserver `count` numéros consécutifs ; retourne le premier"""
+        def operation(fd):
+            issued = self._read_issued(fd)
+            os.pwrite(fd, BITMAP_HEADER.pack(BITMAP_MAGIC, issued + count), 0)
+            # Agrandir le fichier pour que chaque numéro ait son bit
+            size = BITMAP_HEADER.size + (issued + count + 7) // 8
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._sync(fd)
+            return issued + 1
+        return self._locked(operation)
+
+    def release(self, numbers):
+        """Rendre des numéros réservés mais jamais émis (rendu ou enregistrement en échec)
+
+        Le compteur ne recule que sur les derniers numéros réservés : un numéro
+        suivi d'un numéro déjà émis reste un trou, jamais réattribué.
+        Retourne le nombre de numéros rendus.
+        """
+        numbers = set(numbers)
+
+        def operation(fd):
+            issued = released = self._read_issued(fd)
+            while released in numbers:
+                released -= 1
+            if released != issued:
+                os.pwrite(fd, BITMAP_HEADER.pack(BITMAP_MAGIC, released), 0)
+                self._sync(fd)
+            return issued - released
+        return self._locked(operation)
+
+    def _position(self, number):
+        index = number - 1
+        return BITMAP_HEADER.size + index // 8, 0x80 >> (index % 8)
+
+    def test_and_set(self, number):
+        """Marquer un billet comme utilisé ; retourne True s'il l'était déjà"""
+        offset, mask = self._position(number)
+
+        def operation(fd):
+            if not 1 <= number <= self._read_issued(fd):
+                raise ValueError(f"Numéro de billet hors registre: {number}")
+            byte = os.pread(fd, 1, offset)[0]
+            if byte & mask:
+                return True
+            os.pwrite(fd, bytes([byte | mask]), offset)
+            self._sync(fd)
+            return False
+        return self._locked(operation)
+
+    def clear(self, number):
+        """Remettre un billet à « non utilisé » (validation qui n'a pas pu être enregistrée)"""
+        offset, mask = self._position(number)
+
+        def operation(fd):
+            data = os.pread(fd, 1, offset)
+            if data and data[0] & mask:
+                os.pwrite(fd, bytes([data[0] & ~mask]), offset)
+                self._sync(fd)
+        return self._locked(operation)
+
+    def is_used(self, number):
+        """Tester le bit d'un billet"""
+        offset, mask = self._position(number)
+
+        def operation(fd):
+            data = os.pread(fd, 1, offset)
+            return bool(data and data[0] & mask)
+        return self._locked(operation)
+
+    def get_stats(self):
+        """Billets émis et billets utilisés"""
+        def operation(fd):
+            issued = self._read_issued(fd)
+            bits = os.pread(fd, (issued + 7) // 8, BITMAP_HEADER.size)
+            return {"issued": issued, "used": bin(int.from_bytes(bits, 'big')).count("1")}
+        return self._locked(operation)
+
+    def clear_used(self):
+        """Remettre tous les billets à « non utilisé » (les numéros émis sont gardés)"""
+        def operation(fd):
+            issued = self._read_issued(fd)
+            os.pwrite(fd, bytes((issued + 7) // 8), BITMAP_HEADER.size)
+            self._sync(fd)
+        return self._locked(operation)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None and self._pid == os.getpid():
+                os.close(self._fd)
+            self._fd = None
+            self._pid = None
+
+
+class TicketBitmaps:
+    """Registres des événements, un fichier `<event_id>.bits` par événement"""
+
+    def __init__(self, directory="ticket_bitmaps", fsync=True):
+        self.directory = directory
+        self.fsync = fsync
+        self._bitmaps = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def for_event(self, event_id):
+        """Registre d'un événement (identifiant hexadécimal, voir event_id_for)"""
+        with self._lock:
+            bitmap = self._bitmaps.get(event_id)
+            if bitmap is None:
+                path = os.path.join(self.directory, f"{event_id}.bits")
+                bitmap = self._bitmaps[event_id] = TicketBitmap(path, self.fsync)
+            return bitmap
+
+    def clear_used(self):
+        """Remettre à zéro les billets utilisés de tous les événements"""
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".bits"):
+                self.for_event(filename[:-len(".bits")]).clear_used()
+
+    def close(self):
+        with self._lock:
+            for bitmap in self._bitmaps.values():
+                bitmap.close()
@@ -1,49 +1,208 @@
-import qrcode
+import csv
+import io
 import json
 import os
+import sys
 import datetime
+import threading
 from qr_generator import QRCodeGenerator
-from ticket_security import TicketSecurity, TicketValidator
+from qr_render import OUTPUT_FORMATS, build_qr, make_qr_image, render_qr
+from ticket_images import TicketImageCache
+from ticket_records import ticket_filename
+from ticket_schema import expand_ticket, normalize_ticket, ticket_qr_content
+from ticket_bitmap import TicketBitmaps
+from ticket_security import TicketSecurity, TicketValidator, event_id_for, offline_tag
+from ticket_stats import StatsCounters
+from ticket_storage import create_store
+
+
+# Colonnes de l'export des billets (iter_export, export_tickets_list)
+EXPORT_FIELDS = ["ticket_id", "event_name", "buyer_name", "buyer_email", "ticket_type",
+                 "price", "generated_at", "status", "filename"]
+VALIDATION_EXPORT_FIELDS = ["validated", "validated_at", "validation_location"]
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def make_ticket_image(qr_content):
+    """Créer l'image QR d'un billet"""
+    qr = build_qr(qr_content, 'M', box_size=10, border=4)
+    return make_qr_image(qr)
+
+
+def render_ticket(qr_content, output_format="png"):
+    """Produire les octets de l'image d'un billet ("png", "svg" ou "matrix")"""
+    return render_qr(build_qr(qr_content, 'M', box_size=10, border=4), output_format)
+
+
+def render_ticket_file(job):
+    """Rendre et sauvegarder l'image d'un billet (exécuté dans le pool de processus)
+    
+    Retourne None en cas de succès, sinon le message d'erreur.
+    """
+    qr_content, filepath, output_format = job
+    try:
+        with open(filepath, 'wb') as f:
+            f.write(render_ticket(qr_content, output_format))
+        return None
+    except Exception as e:
+        return str(e)
+
 
 class TicketGenerator(QRCodeGenerator):
     """Générateur de billets QR sécurisés pour événements"""
     
-    def __init__(self):
+    def __init__(self, storage="json", storage_options=None, payload_format="v1",
+                 render_images=True, image_cache=None, image_format="png", numbered=False):
         super().__init__()
         self.security = TicketSecurity()
-        self.validator = TicketValidator(self.security)
+        # numbered=True : numéro séquentiel par événement signé dans le billet,
+        # et un bit « utilisé » par billet dans ticket_bitmaps/
+        self.bitmaps = TicketBitmaps() if numbered else None
+        self.validator = TicketValidator(self.security, storage, storage_options,
+                                         ticket_lookup=self._stored_ticket,
+                                         bitmaps=self.bitmaps)
+        self.payload_format = payload_format
+        
+        # render_images=False : l'image n'est rendue qu'au premier téléchargement
+        self.render_images = render_images
+        self.image_cache = image_cache or TicketImageCache()
+        
+        # Format des fichiers de billets : "png", "svg" (vectoriel) ou "matrix" (bits bruts)
+        if image_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Format d'image inconnu: {image_format}")
+        self.image_format = image_format
         self.output_dir = "generated_tickets"
         self.ticket_db = "tickets_database.json"
-        self.tickets = self.load_ticket_database()
+        # Base des billets chargée au premier accès (démarrage rapide des workers)
+        self._ticket_store = create_store(storage, self.ticket_db, "tickets",
+                                          **(storage_options or {}))
+        self._ticket_store_loaded = False
+        self._load_lock = threading.Lock()
+        
+        # Compteurs par événement et par type, tenus à jour à chaque billet généré
+        self.ticket_stats = StatsCounters(self._ticket_store,
+                                          {"event_name": "Inconnu", "ticket_type": "Standard"},
+                                          "generated_at", recent_size=5,
+                                          load=lambda: self.ticket_store)
         
         # Assurer que le dossier de sortie existe
         os.makedirs(self.output_dir, exist_ok=True)
     
+    @classmethod
+    def from_environ(cls, environ=None):
+        """Générateur configuré par les variables d'environnement (app Flask, service de scan)
+        
+        TICKET_STORAGE=journal : journal en ajout seul au lieu de réécrire le JSON à chaque scan
+        TICKET_STORAGE=shared  : journal partagé entre processus (workers gunicorn)
+        TICKET_STORAGE=sqlite  : base SQLite indexée (tickets.db), migrée depuis les JSON au premier lancement
+        TICKET_FORMAT=v2       : QR codes compacts (TICKET-V2, base45), plus faciles à scanner
+        TICKET_LAZY_IMAGES=1   : images rendues au premier téléchargement (cache LRU, + disque
+                                 si TICKET_IMAGE_CACHE_DIR est défini)
+        TICKET_IMAGE_FORMAT    : png, svg ou matrix
+        TICKET_NUMBERING=1     : numéro séquentiel par événement dans chaque billet, billets
+                                 utilisés suivis par un registre binaire (ticket_bitmaps/)
+        TICKET_COMPACT_RECORDS=0 : stockages JSON gardés en dictionnaires en mémoire (chargement
+                                 plus rapide, environ 2,5 fois plus de mémoire)
+        """
+        environ = os.environ if environ is None else environ
+        storage = environ.get('TICKET_STORAGE', 'json')
+        storage_options = None
+        if storage != 'sqlite' and environ.get('TICKET_COMPACT_RECORDS', '1') == '0':
+            storage_options = {"compact_records": False}
+        return cls(
+            storage=storage,
+            storage_options=storage_options,
+            payload_format=environ.get('TICKET_FORMAT', 'v1'),
+            render_images=environ.get('TICKET_LAZY_IMAGES', '0') != '1',
+            image_cache=TicketImageCache(disk_dir=environ.get('TICKET_IMAGE_CACHE_DIR') or None),
+            image_format=environ.get('TICKET_IMAGE_FORMAT', 'png'),
+            numbered=environ.get('TICKET_NUMBERING', '0') == '1'
+        )
+    
+    @property
+    def ticket_store(self):
+        """Stockage des billets, chargé au premier accès"""
+        if not self._ticket_store_loaded:
+            with self._load_lock:
+                if not self._ticket_store_loaded:
+                    self.load_ticket_database()
+                    self._ticket_store_loaded = True
+        return self._ticket_store
+    
+    @property
+    def tickets(self):
+        """Billets indexés par ticket_id"""
+        return self.ticket_store.records
+    
     def load_ticket_database(self):
-        """Charger la base de données des billets"""
-        try:
-            if os.path.exists(self.ticket_db):
-                with open(self.ticket_db, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"Erreur lors du chargement de la BD: {e}")
-        return {}
+        """Charger la base de données des billets (snapshot + journal éventuel)"""
+        return self._ticket_store.load()
     
     def save_ticket_database(self):
-        """Sauvegarder la base de données des billets"""
+        """Sauvegarder la base de données complète des billets"""
+        self.ticket_store.save()
+    
+    def _prepare_ticket(self, event_name, buyer_name, buyer_email="", 
+                        event_date=None, ticket_type="Standard", price="", 
+                        additional_info=None):
+        """Signer un billet et préparer son enregistrement (sans rendu d'image)"""
+        ticket_record = self._new_ticket_record(event_name, buyer_name, buyer_email, event_date,
+                                                ticket_type, price, additional_info)
+        signed_ticket = self._sign_records(event_name, [ticket_record], event_date)[0]
+        return signed_ticket, ticket_record
+    
+    def _sign_records(self, event_name, ticket_records, event_date=None):
+        """Signer des enregistrements de billets en une passe et y ajouter leur qr_content
+        
+        Retourne les billets signés, dans l'ordre.
+        """
+        if self.bitmaps is not None and ticket_records:
+            first_number = self.bitmaps.for_event(f"{event_id_for(event_name):08x}").allocate(len(ticket_records))
+            for offset, ticket_record in enumerate(ticket_records):
+                ticket_record["ticket_number"] = first_number + offset
+        
         try:
-            with open(self.ticket_db, 'w', encoding='utf-8') as f:
-                json.dump(self.tickets, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Erreur lors de la sauvegarde de la BD: {e}")
+            signed = self.security.sign_many(
+                event_name,
+                ticket_records,
+                event_date=event_date,
+                # Format compact : QR code bien plus petit, acheteur gardé en base
+                compact=self.payload_format == "v2"
+            )
+        except Exception:
+            self._discard_unsaved(event_name, ticket_records)
+            raise
+        for ticket_record, (_, qr_content) in zip(ticket_records, signed):
+            ticket_record["qr_content"] = qr_content
+        return [signed_ticket for signed_ticket, _ in signed]
     
-    def generate_ticket(self, event_name, buyer_name, buyer_email="", 
-                       event_date=None, ticket_type="Standard", price="", 
-                       additional_info=None):
-        """Générer un billet QR sécurisé"""
+    def _discard_unsaved(self, event_name, ticket_records):
+        """Effacer les images des billets qui n'ont pas été enregistrés et rendre leurs numéros
+        
+        Le numéro est signé dans le QR code, il est donc réservé avant le rendu
+        et l'enregistrement. En cas d'échec, l'image déjà rendue (un billet
+        signé valide) est supprimée avant que le numéro soit rendu au registre
+        (voir TicketBitmap.release) : un numéro réattribué n'a qu'un billet.
+        """
+        for record in ticket_records:
+            try:
+                os.remove(record["filepath"])
+            except FileNotFoundError:
+                pass
+        numbers = [record["ticket_number"] for record in ticket_records if "ticket_number" in record]
+        if self.bitmaps is not None and numbers:
+            self.bitmaps.for_event(f"{event_id_for(event_name):08x}").release(numbers)
+    
+    def _new_ticket_record(self, event_name, buyer_name, buyer_email="", 
+                           event_date=None, ticket_type="Standard", price="", 
+                           additional_info=None, ticket_id=None):
+        """Préparer l'enregistrement d'un billet, sans signature ni qr_content"""
         
-        # Générer un ID unique pour le billet
-        ticket_id = self.generate_unique_id("uuid")
+        # Générer un ID unique pour le billet (sauf s'il est imposé)
+        ticket_id = ticket_id or self.generate_unique_id("uuid")
         
         # Préparer les informations de l'acheteur
         buyer_info = {
@@ -59,42 +218,12 @@ class TicketGenerator(QRCodeGenerator):
             **(additional_info or {})
         }
         
-        # Créer les données sécurisées du billet
-        signed_ticket = self.security.create_ticket_data(
-            event_name=event_name,
-            ticket_id=ticket_id,
-            buyer_info=buyer_info,
-            event_date=event_date,
-            additional_data=additional_data
-        )
-        
-        # Encoder pour QR code
-        qr_content = self.security.encode_ticket_for_qr(signed_ticket)
-        
-        # Créer le QR code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_content)
-        qr.make(fit=True)
-        
-        # Créer l'image
-        img = qr.make_image(fill_color="black", back_color="white")
-        
         # Nom du fichier
-        safe_event_name = "".join(c for c in event_name if c.isalnum() or c in (' ', '-', '_')).strip()
-        safe_buyer_name = "".join(c for c in buyer_name if c.isalnum() or c in (' ', '-', '_')).strip()
-        
-        filename = f"ticket_{safe_event_name}_{safe_buyer_name}_{ticket_id[:8]}.png"
+        extension = OUTPUT_FORMATS[self.image_format]["extension"]
+        filename = ticket_filename(event_name, buyer_name, ticket_id, extension)
         filepath = os.path.join(self.output_dir, filename)
         
-        # Sauvegarder l'image
-        img.save(filepath)
-        
-        # Enregistrer dans la base de données
+        # Enregistrement pour la base de données
         ticket_record = {
             "ticket_id": ticket_id,
             "event_name": event_name,
@@ -103,30 +232,66 @@ class TicketGenerator(QRCodeGenerator):
             "ticket_type": ticket_type,
             "price": price,
             "additional_data": additional_data,
-            "qr_content": qr_content,
+            "qr_content": None,  # rempli à la signature
             "filename": filename,
             "filepath": filepath,
             "generated_at": datetime.datetime.now().isoformat(),
             "status": "active"
         }
         
-        self.tickets[ticket_id] = ticket_record
-        self.save_ticket_database()
+        return ticket_record
+    
+    def generate_ticket(self, event_name, buyer_name, buyer_email="", 
+                       event_date=None, ticket_type="Standard", price="", 
+                       additional_info=None):
+        """Générer un billet QR sécurisé"""
+        signed_ticket, ticket_record = self._prepare_ticket(
+            event_name, buyer_name, buyer_email, event_date,
+            ticket_type, price, additional_info
+        )
+        
+        try:
+            # Créer et sauvegarder l'image (sauf en mode rendu à la demande)
+            img = None
+            if self.render_images and self.image_format == "png":
+                img = make_ticket_image(ticket_record["qr_content"])
+                img.save(ticket_record["filepath"])
+            elif self.render_images:
+                # SVG ou matrice : pas de passage par PIL, "image" contient les octets
+                img = render_ticket(ticket_record["qr_content"], self.image_format)
+                with open(ticket_record["filepath"], 'wb') as f:
+                    f.write(img)
+            
+            # Enregistrer dans la base de données (sans qr_content, reconstruit à la lecture)
+            stored_record = normalize_ticket(ticket_record, signed_ticket)
+            self.ticket_store.put(ticket_record["ticket_id"], stored_record)
+        except Exception:
+            self._discard_unsaved(event_name, [ticket_record])
+            raise
+        self.ticket_stats.add(stored_record)
         
         return {
             "success": True,
-            "ticket_id": ticket_id,
-            "filename": filename,
-            "filepath": filepath,
-            "qr_content": qr_content,
+            "ticket_id": ticket_record["ticket_id"],
+            "filename": ticket_record["filename"],
+            "filepath": ticket_record["filepath"],
+            "qr_content": ticket_record["qr_content"],
             "signed_ticket": signed_ticket,
             "image": img
         }
     
     def generate_batch_tickets(self, event_name, buyers_list, event_date=None, 
-                              ticket_type="Standard", price=""):
-        """Générer plusieurs billets en lot"""
-        results = []
+                              ticket_type="Standard", price="", workers=1,
+                              chunk_size=500):
+        """Générer plusieurs billets en lot
+        
+        Avec workers > 1, les images sont rendues et encodées dans un pool de
+        processus (workers=0 : un processus par cœur). La base est sauvegardée
+        par paquets de chunk_size billets plutôt qu'après chaque billet.
+        Si render_images est désactivé, aucun PNG n'est produit ici.
+        """
+        results = [None] * len(buyers_list)
+        prepared = []
         
         for i, buyer in enumerate(buyers_list):
             try:
@@ -135,145 +300,411 @@ class TicketGenerator(QRCodeGenerator):
                     buyer_name = buyer
                     buyer_email = ""
                 elif isinstance(buyer, dict):
-                    # Si c'est un dictionnaire avec nom et email
+                    # Si c'est un dictionnaire avec nom et email (et un ticket_id imposé, voir ticket_issue)
                     buyer_name = buyer.get("nom", f"Acheteur_{i+1}")
                     buyer_email = buyer.get("email", "")
                 else:
-                    results.append({
+                    results[i] = {
                         "success": False,
                         "error": f"Format d'acheteur invalide: {buyer}",
                         "index": i + 1
-                    })
+                    }
                     continue
                 
-                # Générer le billet
-                ticket_result = self.generate_ticket(
+                # Préparer le billet (signature en une passe, rendu de l'image après)
+                ticket_record = self._new_ticket_record(
                     event_name=event_name,
                     buyer_name=buyer_name,
                     buyer_email=buyer_email,
                     event_date=event_date,
                     ticket_type=ticket_type,
-                    price=price
+                    price=price,
+                    ticket_id=buyer.get("ticket_id") if isinstance(buyer, dict) else None
                 )
-                
-                if ticket_result["success"]:
-                    results.append({
-                        "success": True,
-                        "index": i + 1,
-                        "buyer_name": buyer_name,
-                        "ticket_id": ticket_result["ticket_id"],
-                        "filename": ticket_result["filename"],
-                        "filepath": ticket_result["filepath"]
-                    })
-                else:
-                    results.append({
-                        "success": False,
-                        "error": "Erreur de génération",
-                        "index": i + 1
-                    })
+                prepared.append((i, buyer_name, ticket_record))
                     
             except Exception as e:
-                results.append({
+                results[i] = {
                     "success": False,
                     "error": str(e),
                     "index": i + 1
-                })
+                }
         
+        try:
+            self._sign_records(event_name, [record for _, _, record in prepared], event_date)
+        except Exception as e:
+            for i, _, _ in prepared:
+                results[i] = {
+                    "success": False,
+                    "error": str(e),
+                    "index": i + 1
+                }
+            return results
+        
+        if workers == 0:
+            workers = os.cpu_count() or 1
+        
+        jobs = [(record["qr_content"], record["filepath"], self.image_format)
+                for _, _, record in prepared]
+        if not self.render_images:
+            self._collect_batch(prepared, (None for _ in jobs), results, chunk_size)
+        elif workers > 1 and len(jobs) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                chunksize = max(1, len(jobs) // (workers * 4))
+                errors = executor.map(render_ticket_file, jobs, chunksize=chunksize)
+                self._collect_batch(prepared, errors, results, chunk_size)
+        else:
+            errors = (render_ticket_file(job) for job in jobs)
+            self._collect_batch(prepared, errors, results, chunk_size)
+        
+        # Billets non rendus ou non enregistrés : images effacées, numéros rendus au registre
+        self._discard_unsaved(event_name, [record for i, _, record in prepared if not results[i]["success"]])
         return results
     
+    def _collect_batch(self, prepared, errors, results, chunk_size):
+        """Enregistrer les billets rendus, dans l'ordre, par paquets"""
+        pending = []
+        for (i, buyer_name, ticket_record), error in zip(prepared, errors):
+            if error is not None:
+                results[i] = {
+                    "success": False,
+                    "error": error,
+                    "index": i + 1
+                }
+                continue
+            
+            pending.append((i, ticket_record))
+            results[i] = {
+                "success": True,
+                "index": i + 1,
+                "buyer_name": buyer_name,
+                "ticket_id": ticket_record["ticket_id"],
+                "filename": ticket_record["filename"],
+                "filepath": ticket_record["filepath"]
+            }
+            
+            if len(pending) >= chunk_size:
+                self._save_pending(pending, results)
+                pending = []
+        
+        if pending:
+            self._save_pending(pending, results)
+    
+    def _save_pending(self, pending, results):
+        """Enregistrer un paquet ; en cas d'échec, ses billets sont signalés en erreur"""
+        try:
+            self._save_batch([(ticket_record["ticket_id"], ticket_record) for _, ticket_record in pending])
+        except Exception as e:
+            for i, _ in pending:
+                results[i] = {
+                    "success": False,
+                    "error": str(e),
+                    "index": i + 1
+                }
+    
+    def _save_batch(self, pending):
+        """Enregistrer un paquet de billets (format normalisé) et les compter"""
+        pending = [(ticket_id, normalize_ticket(ticket_record)) for ticket_id, ticket_record in pending]
+        self.ticket_store.put_many(pending)
+        for _, ticket_record in pending:
+            self.ticket_stats.add(ticket_record)
+    
     def validate_ticket_qr(self, qr_data, scanner_info=None):
         """Valider un billet scanné"""
         return self.validator.validate_and_log(qr_data, scanner_info)
     
+    def validate_tickets_qr(self, scans):
+        """Valider une série de scans (qr_data, scanner_info) en une seule écriture"""
+        return self.validator.validate_many_and_log(scans)
+    
     def get_ticket_info(self, ticket_id):
-        """Obtenir les informations d'un billet"""
-        return self.tickets.get(ticket_id)
+        """Obtenir les informations d'un billet (avec son qr_content)"""
+        return expand_ticket(self.ticket_store.get(ticket_id))
     
-    def get_event_statistics(self, event_name=None):
-        """Obtenir les statistiques des billets"""
-        total_tickets = len(self.tickets)
+    def _stored_ticket(self, ticket_id):
+        """Enregistrement d'un billet tel qu'en base (sans qr_content au format normalisé)"""
+        return self.ticket_store.get(ticket_id)
+    
+    def find_ticket_by_filename(self, filename):
+        """Retrouver un billet à partir du nom de son fichier image"""
+        return expand_ticket(next(self.ticket_store.find(filename=filename, limit=1), None))
+    
+    def get_ticket_file(self, filename, output_format=None):
+        """Obtenir l'image d'un billet dans le format demandé
+        
+        `filename` est le nom de fichier enregistré pour le billet. Le fichier
+        existant est renvoyé s'il est déjà dans ce format, sinon l'image est
+        rendue à la demande depuis qr_content (et mise en cache).
+        Retourne None si aucun billet ne correspond.
+        """
+        if os.path.basename(filename) != filename:
+            return None
         
-        # Filtrer par événement si spécifié
-        tickets_to_analyze = self.tickets.values()
+        stem, extension = os.path.splitext(filename)
+        output_format = output_format or next(
+            (name for name, info in OUTPUT_FORMATS.items() if info["extension"] == extension),
+            "png"
+        )
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Format de sortie inconnu: {output_format}")
+        output_extension = OUTPUT_FORMATS[output_format]["extension"]
+        
+        filepath = os.path.join(self.output_dir, filename)
+        if extension == output_extension and os.path.exists(filepath):
+            with open(filepath, 'rb') as f:
+                return f.read()
+        
+        ticket = self.find_ticket_by_filename(filename)
+        if ticket is None:
+            return None
+        
+        return self.image_cache.get(
+            f"{stem}{output_extension}",
+            lambda: render_ticket(ticket_qr_content(ticket), output_format)
+        )
+    
+    def get_ticket_png(self, filename):
+        """Obtenir le PNG d'un billet, rendu à la demande s'il n'existe pas sur disque"""
+        return self.get_ticket_file(filename, "png")
+
+    def _selection_filters(self, event_name=None, ticket_type=None, since=None, until=None):
+        """Filtres de stockage pour une sélection de billets (dates ISO, bornes incluses)"""
+        filters = {}
         if event_name:
-            tickets_to_analyze = [t for t in tickets_to_analyze 
-                                if t.get("event_name") == event_name]
+            filters["event_name"] = event_name
+        if ticket_type:
+            filters["ticket_type"] = ticket_type
+        if until and len(until) == 10:
+            until += "T23:59:59.999999"  # une date seule couvre toute la journée
+        between = {"generated_at": (since, until)} if since or until else None
+        return filters, between
+
+    def get_selection_summary(self, event_name=None, ticket_type=None, since=None, until=None):
+        """Nombre de billets sélectionnés et date du plus récent"""
+        filters, between = self._selection_filters(event_name, ticket_type, since, until)
+        latest = next(self.ticket_store.find(order_by="generated_at", descending=True, limit=1,
+                                             between=between, **filters), None)
+        return {
+            "count": self.ticket_store.count(between=between, **filters),
+            "latest_generated_at": latest.get("generated_at") if latest else None
+        }
+
+    def iter_ticket_files(self, event_name=None, ticket_type=None, since=None, until=None):
+        """Itérer sur (nom de fichier, octets) des images des billets sélectionnés
+
+        Les billets sont lus depuis la base dans l'ordre de génération ; une
+        image absente du disque est rendue sans passer par le cache d'images.
+        """
+        filters, between = self._selection_filters(event_name, ticket_type, since, until)
+        for ticket in self.ticket_store.find(order_by="generated_at", between=between, **filters):
+            filename = ticket.get("filename")
+            if not filename or os.path.basename(filename) != filename:
+                continue
+
+            filepath = os.path.join(self.output_dir, filename)
+            try:
+                with open(filepath, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                extension = os.path.splitext(filename)[1]
+                output_format = next(
+                    (name for name, info in OUTPUT_FORMATS.items() if info["extension"] == extension),
+                    "png"
+                )
+                data = render_ticket(ticket_qr_content(ticket), output_format)
+            yield filename, data
+
+    def get_offline_manifest(self, event_name=None, tickets_since=None, validations_since=None):
+        """Manifeste des scanners hors ligne : empreintes des billets valides et déjà utilisés
         
-        # Statistiques par événement
-        events = {}
-        ticket_types = {}
+        Sans curseur, le manifeste est complet. Avec tickets_since et
+        validations_since (la version d'un manifeste précédent), seuls les
+        billets générés et validés depuis sont envoyés (bornes incluses : une
+        empreinte peut revenir deux fois).
+        """
+        filters = {"event_name": event_name} if event_name else {}
         
-        for ticket in tickets_to_analyze:
-            event = ticket.get("event_name", "Inconnu")
-            ticket_type = ticket.get("ticket_type", "Standard")
-            
-            events[event] = events.get(event, 0) + 1
-            ticket_types[ticket_type] = ticket_types.get(ticket_type, 0) + 1
+        tags = []
+        tickets_version = tickets_since
+        between = {"generated_at": (tickets_since, None)} if tickets_since else None
+        for ticket in self.ticket_store.find(between=between, **filters):
+            qr_content = ticket_qr_content(ticket)
+            if not qr_content:
+                continue
+            tags.append(offline_tag(qr_content))
+            generated_at = ticket.get("generated_at")
+            if generated_at and (tickets_version is None or generated_at > tickets_version):
+                tickets_version = generated_at
+        
+        used = []
+        validations_version = validations_since
+        between = {"validated_at": (validations_since, None)} if validations_since else None
+        for validation in self.validator.store.find(between=between, **filters):
+            ticket = self.ticket_store.get(validation.get("ticket_id"))
+            qr_content = ticket_qr_content(ticket) if ticket else None
+            if qr_content:
+                used.append(offline_tag(qr_content))
+            validated_at = validation.get("validated_at")
+            if validated_at and (validations_version is None or validated_at > validations_version):
+                validations_version = validated_at
+        
+        return {
+            "event_name": event_name,
+            "full": not (tickets_since or validations_since),
+            "version": {"tickets": tickets_version, "validations": validations_version},
+            "tags": tags,
+            "used": used
+        }
+    
+    def get_event_statistics(self, event_name=None):
+        """Obtenir les statistiques des billets (compteurs tenus à jour, sans parcourir la base)"""
+        self.ticket_stats.refresh()
+        snapshot = self.ticket_stats.snapshot(event_name)
+        total_tickets = snapshot["total"]
         
         # Statistiques de validation
         validation_stats = self.validator.get_validation_stats()
         
         return {
-            "total_tickets_generated": len(tickets_to_analyze),
+            "total_tickets_generated": total_tickets,
             "total_tickets_validated": validation_stats["total_validated"],
-            "events": events,
-            "ticket_types": ticket_types,
+            "events": snapshot["counts"]["event_name"],
+            "ticket_types": snapshot["counts"]["ticket_type"],
             "validation_rate": (
-                validation_stats["total_validated"] / len(tickets_to_analyze) * 100
-                if tickets_to_analyze else 0
+                validation_stats["total_validated"] / total_tickets * 100
+                if total_tickets else 0
             ),
-            "recent_tickets": sorted(
-                tickets_to_analyze,
-                key=lambda x: x.get("generated_at", ""),
-                reverse=True
-            )[:5]
+            # Derniers billets au format de l'API (avec qr_content)
+            "recent_tickets": [expand_ticket(ticket) for ticket in snapshot["recent"]]
         }
     
-    def export_tickets_list(self, event_name=None, format="json"):
-        """Exporter la liste des billets"""
-        tickets_to_export = []
+    def get_live_stats(self):
+        """Sections du tableau de bord en direct (voir ticket_stats.LiveStats)"""
+        self.ticket_stats.refresh()
+        tickets = self.ticket_stats.snapshot()
+        validation_stats = self.validator.get_validation_stats()
+        total_validated = validation_stats["total_validated"]
         
-        for ticket_id, ticket_data in self.tickets.items():
-            if event_name and ticket_data.get("event_name") != event_name:
-                continue
-            
+        # Admissions et refus par porte lus dans les stockages partagés : chaque
+        # flux montre les mêmes chiffres, quel que soit le worker qui le sert
+        gates = {}
+        for location, admitted in validation_stats["locations"].items():
+            gates[location] = {"admitted": admitted, "rejected": 0}
+        for location, rejected in validation_stats["invalid_by_location"].items():
+            gates.setdefault(location, {"admitted": 0})["rejected"] = rejected
+        
+        return {
+            "generation": {
+                "total": tickets["total"],
+                "events": tickets["counts"]["event_name"]
+            },
+            "admissions": {
+                "total": total_validated,
+                "events": validation_stats["events"],
+                "rate": round(total_validated / tickets["total"] * 100, 1) if tickets["total"] else 0,
+                "recent": [
+                    {
+                        "ticket_id": validation.get("ticket_id"),
+                        "event_name": (validation.get("event_name")
+                                       or (validation.get("ticket_data") or {}).get("event_name")),
+                        "location": (validation.get("scanner_info") or {}).get("location"),
+                        "validated_at": validation.get("validated_at")
+                    }
+                    for validation in validation_stats["recent_validations"][:5]
+                ]
+            },
+            "rejections": {"total": validation_stats["invalid_scans"]},
+            "gates": gates
+        }
+    
+    def iter_export_rows(self, event_name=None, status=None, since=None, until=None,
+                         include_validation=False):
+        """Itérer sur les lignes d'export des billets, lues au fil de la base
+        
+        Filtres : événement, statut, dates ISO de génération (bornes incluses).
+        include_validation ajoute l'état de scan de chaque billet.
+        """
+        filters, between = self._selection_filters(event_name, since=since, until=until)
+        if status:
+            filters["status"] = status
+        
+        for ticket_data in self.ticket_store.find(order_by="generated_at", between=between, **filters):
+            buyer_info = ticket_data.get("buyer_info") or {}
             # Données à exporter (sans le QR content pour économiser l'espace)
             export_data = {
-                "ticket_id": ticket_id,
+                "ticket_id": ticket_data.get("ticket_id"),
                 "event_name": ticket_data.get("event_name"),
-                "buyer_name": ticket_data.get("buyer_info", {}).get("nom"),
-                "buyer_email": ticket_data.get("buyer_info", {}).get("email"),
+                "buyer_name": buyer_info.get("nom"),
+                "buyer_email": buyer_info.get("email"),
                 "ticket_type": ticket_data.get("ticket_type"),
                 "price": ticket_data.get("price"),
                 "generated_at": ticket_data.get("generated_at"),
                 "status": ticket_data.get("status"),
                 "filename": ticket_data.get("filename")
             }
-            tickets_to_export.append(export_data)
+            if include_validation:
+                validation = self.validator.store.get(ticket_data.get("ticket_id")) or {}
+                export_data["validated"] = bool(validation)
+                export_data["validated_at"] = validation.get("validated_at")
+                export_data["validation_location"] = (validation.get("scanner_info") or {}).get("location")
+            yield export_data
+    
+    def iter_export(self, format="csv", chunk_size=1000, **selection):
+        """Exporter les billets en CSV ou NDJSON, par morceaux de texte
         
-        if format == "json":
-            return json.dumps(tickets_to_export, indent=2, ensure_ascii=False)
-        elif format == "csv":
-            if not tickets_to_export:
-                return ""
-            
-            # Créer le CSV
-            import csv
-            import io
-            
-            output = io.StringIO()
-            fieldnames = tickets_to_export[0].keys()
-            writer = csv.DictWriter(output, fieldnames=fieldnames)
+        Les lignes sont produites au fur et à mesure de la lecture de la base :
+        la mémoire reste constante quel que soit le nombre de billets.
+        selection : filtres de iter_export_rows.
+        """
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Format d'export inconnu: {format}")
+        
+        rows = self.iter_export_rows(**selection)
+        buffer = io.StringIO()
+        if format == "csv":
+            fieldnames = EXPORT_FIELDS + (VALIDATION_EXPORT_FIELDS if selection.get("include_validation") else [])
+            writer = csv.DictWriter(buffer, fieldnames=fieldnames)
             writer.writeheader()
-            writer.writerows(tickets_to_export)
-            
-            return output.getvalue()
+            write = writer.writerow
+        else:
+            def write(row):
+                buffer.write(json.dumps(row, ensure_ascii=False))
+                buffer.write("\n")
+        
+        pending = 0
+        for row in rows:
+            write(row)
+            pending += 1
+            if pending == chunk_size:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        if buffer.tell():
+            yield buffer.getvalue()
+    
+    def export_tickets_list(self, event_name=None, format="json", status=None):
+        """Exporter la liste des billets"""
+        if format == "csv":
+            csv_text = "".join(self.iter_export("csv", event_name=event_name, status=status))
+            # Pas de billet : texte vide, sans ligne d'en-tête
+            return csv_text if csv_text.count("\n") > 1 else ""
         
+        tickets_to_export = list(self.iter_export_rows(event_name, status))
+        if format == "json":
+            return json.dumps(tickets_to_export, indent=2, ensure_ascii=False)
         return tickets_to_export
 
 
 # Test du générateur de billets
 if __name__ == "__main__":
+    # python -m ticket_generator issue --csv acheteurs.csv ... : émission en masse (ticket_issue)
+    if sys.argv[1:2] == ["issue"]:
+        from ticket_issue import main
+        sys.exit(main(sys.argv[2:], TicketGenerator.from_environ()))
+    
     print("=== Test du Générateur de Billets QR Sécurisés ===")
     print()
     
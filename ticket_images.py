@@ -0,0 +1,143 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+def evict_oldest_files(directory, max_bytes):
+    """Supprimer les fichiers les moins récemment utilisés (mtime) jusqu'à 90 % de
+    max_bytes. Retourne la taille restante du dossier."""
+    entries = sorted(
+        (entry for entry in os.scandir(directory) if entry.is_file()),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    target = max_bytes * 0.9
+    size = sum(entry.stat().st_size for entry in entries)
+    for entry in entries:
+        if size <= target:
+            break
+        try:
+            entry_size = entry.stat().st_size
+            os.remove(entry.path)
+            size -= entry_size
+        except OSError:
+            continue
+    return size
+
+
+class TicketImageCache:
+    """Cache des images de billets rendues à la demande.
+
+    Un LRU en mémoire limité en octets, et optionnellement un dossier
+    disque lui aussi limité en taille (les fichiers les moins récemment
+    utilisés sont supprimés en premier).
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._disk_size = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key, render):
+        """Retourner les octets en cache pour `key`, ou les produire avec `render()`"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+
+        data = self._read_disk(key)
+        if data is None:
+            data = render()
+            self._write_disk(key, data)
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+
+        self._remember(key, data)
+        return data
+
+    def _remember(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key)
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # marquer comme récemment utilisé pour l'éviction
+            return data
+        except OSError:
+            return None
+
+    def _write_disk(self, key, data):
+        if not self.disk_dir:
+            return
+        try:
+            tmp_path = f"{self._disk_path(key)}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._disk_path(key))
+        except OSError as e:
+            print(f"Erreur lors de l'écriture du cache image {key}: {e}")
+            return
+
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = self._scan_disk_size()
+            else:
+                self._disk_size += len(data)
+            if self._disk_size > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _scan_disk_size(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.disk_dir) if entry.is_file())
+
+    def _evict_disk(self):
+        self._disk_size = evict_oldest_files(self.disk_dir, self.disk_max_bytes)
+
+    def clear(self):
+        """Vider le cache mémoire"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_stats(self):
+        """Statistiques du cache"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_dir": self.disk_dir,
+                "disk_bytes": self._disk_size
+            }
@@ -0,0 +1,279 @@
+"""
+Émission en masse de billets depuis un fichier CSV d'acheteurs, avec reprise
+
+    python -m ticket_generator issue --csv acheteurs.csv --event "Ma Soirée" [options]
+
+Le fichier est lu au fil de l'eau (colonnes nom/name et email, séparateur
+, ou ; détecté) et les billets sont émis par paquets avec
+generate_batch_tickets : la mémoire ne dépend pas de la taille du fichier.
+
+Après chaque paquet enregistré, un point de reprise (acheteurs.csv.checkpoint.json
+par défaut) note la dernière ligne traitée. Relancer la même commande reprend
+après cette ligne. L'identifiant de chaque billet est dérivé de l'identifiant
+de l'import et du numéro de ligne : si l'arrêt survient entre l'enregistrement
+d'un paquet et l'écriture du point de reprise, les billets déjà en base sont
+reconnus et ne sont pas émis une seconde fois.
+
+Les lignes en échec (nom manquant, erreur d'émission) sont notées dans le
+point de reprise et l'import reste inachevé : après correction de ces lignes
+sur place, relancer la même commande les réessaie avec leur identifiant
+d'origine. Les identifiants suivant les numéros de ligne, une reprise vérifie
+d'abord que le fichier n'a pas bougé (chaque billet déjà émis correspond
+toujours à sa ligne) et refuse de continuer si des lignes ont été insérées,
+supprimées ou modifiées ; de nouvelles lignes peuvent être ajoutées à la fin.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+import uuid
+
+NAME_COLUMNS = ("nom", "name", "buyer_name", "acheteur")
+EMAIL_COLUMNS = ("email", "mail", "buyer_email")
+
+
+def _open_buyers(csv_path):
+    """Ouvrir le CSV et retourner (fichier, lecteur de dictionnaires, colonne du nom, colonne de l'email)"""
+    f = open(csv_path, newline='', encoding='utf-8-sig')
+    try:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        columns = {name.strip().lower(): name for name in reader.fieldnames or ()}
+        name_column = next((columns[c] for c in NAME_COLUMNS if c in columns), None)
+        if name_column is None:
+            raise ValueError(f"Colonne du nom introuvable (attendu: {', '.join(NAME_COLUMNS)})")
+        email_column = next((columns[c] for c in EMAIL_COLUMNS if c in columns), None)
+    except Exception:
+        f.close()
+        raise
+    return f, reader, name_column, email_column
+
+
+def _buyer(row, name_column, email_column):
+    """(nom, email) d'une ligne, tels qu'enregistrés dans le billet"""
+    name = (row.get(name_column) or "").strip()
+    email = (row.get(email_column) or "").strip() if email_column else ""
+    return name, email
+
+
+def _row_ticket_id(namespace, row_number):
+    """Même ligne du même import -> même identifiant : rien n'est émis deux fois"""
+    return str(uuid.uuid5(namespace, str(row_number)))
+
+
+def _check_rows(generator, csv_path, checkpoint):
+    """Compter les lignes ; en reprise, vérifier que le fichier n'a pas bougé
+
+    Un billet déjà émis pour une ligne doit porter le nom et l'email de cette
+    ligne, et chaque ligne traitée sans échec doit avoir son billet. Sinon des
+    lignes ont été insérées, supprimées ou modifiées : les numéros de ligne (et
+    donc les identifiants) ne désignent plus les mêmes acheteurs.
+    """
+    resuming = checkpoint["rows_done"] > 0
+    namespace = uuid.UUID(checkpoint["import_id"])
+    failed_rows = set(checkpoint["failed_rows"])
+    total = 0
+    f, reader, name_column, email_column = _open_buyers(csv_path)
+    with f:
+        for total, row in enumerate(reader, 1):
+            if not resuming:
+                continue
+            ticket = generator.ticket_store.get(_row_ticket_id(namespace, total))
+            if ticket is None:
+                changed = total <= checkpoint["rows_done"] and total not in failed_rows
+            else:
+                buyer_info = ticket.get("buyer_info") or {}
+                changed = (buyer_info.get("nom"), buyer_info.get("email") or "") != \
+                    _buyer(row, name_column, email_column)
+            if changed:
+                break
+        else:
+            changed = total < checkpoint["rows_done"]
+    if changed:
+        raise ValueError(f"{csv_path} a changé depuis le début de l'import (ligne {total}) : "
+                         "rétablissez le fichier d'origine (seules les lignes en échec peuvent être "
+                         "corrigées sur place, les nouvelles lignes vont à la fin)")
+    return total
+
+
+def _load_checkpoint(path, csv_path, event_name):
+    """Point de reprise existant (vérifié pour ce fichier et cet événement), ou un nouveau"""
+    if not os.path.exists(path):
+        return {
+            "csv": os.path.abspath(csv_path),
+            "event_name": event_name,
+            "import_id": str(uuid.uuid4()),
+            "rows_done": 0,
+            "issued": 0,
+            "failed": 0,
+            "failed_rows": [],
+            "completed": False
+        }
+    with open(path, encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("csv") != os.path.abspath(csv_path) or checkpoint.get("event_name") != event_name:
+        raise ValueError(f"Le point de reprise {path} concerne un autre import "
+                         f"({checkpoint.get('csv')}, {checkpoint.get('event_name')})")
+    checkpoint.setdefault("failed_rows", [])
+    return checkpoint
+
+
+def _save_checkpoint(path, checkpoint):
+    """Écriture atomique : un arrêt pendant l'écriture garde le point précédent"""
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def issue_from_csv(generator, csv_path, event_name, event_date=None, ticket_type="Standard",
+                   price="", chunk_size=500, workers=1, checkpoint_path=None, progress=print):
+    """Émettre un billet par ligne du CSV, par paquets, en reprenant au point de reprise
+
+    Les lignes en échec d'un passage précédent sont réessayées d'abord ;
+    l'import n'est terminé (completed) que lorsqu'il n'en reste aucune.
+    progress : fonction appelée avec une ligne de texte après chaque paquet
+    (débit et temps restant), None pour rien afficher.
+    Retourne le point de reprise final (lignes traitées, billets émis, échecs).
+    """
+    checkpoint_path = checkpoint_path or f"{csv_path}.checkpoint.json"
+    checkpoint = _load_checkpoint(checkpoint_path, csv_path, event_name)
+    if checkpoint["completed"]:
+        if progress:
+            progress(f"✓ Import déjà terminé ({checkpoint['issued']} billets), rien à faire")
+        return checkpoint
+
+    total = _check_rows(generator, csv_path, checkpoint)
+    namespace = uuid.UUID(checkpoint["import_id"])
+    started = time.perf_counter()
+    rows_at_start = checkpoint["rows_done"]
+    failed_rows = set(checkpoint["failed_rows"])
+    if progress and rows_at_start:
+        progress(f"Reprise après la ligne {rows_at_start}/{total}"
+                 + (f", {len(failed_rows)} lignes en échec réessayées" if failed_rows else ""))
+
+    f, reader, name_column, email_column = _open_buyers(csv_path)
+    with f:
+        # Lignes en échec d'un passage précédent, puis lignes pas encore traitées
+        rows = ((row_number, row) for row_number, row in enumerate(reader, 1)
+                if row_number > rows_at_start or row_number in failed_rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            buyers = []
+            buyer_rows = []
+            for row_number, row in chunk:
+                failed_rows.discard(row_number)
+                name, email = _buyer(row, name_column, email_column)
+                if not name:
+                    failed_rows.add(row_number)
+                    if progress:
+                        progress(f"  ⚠️  Ligne {row_number}: nom manquant, ignorée")
+                    continue
+                ticket_id = _row_ticket_id(namespace, row_number)
+                if generator.ticket_store.get(ticket_id) is not None:
+                    checkpoint["issued"] += 1
+                    continue
+                buyers.append({
+                    "nom": name,
+                    "email": email,
+                    "ticket_id": ticket_id
+                })
+                buyer_rows.append(row_number)
+
+            if buyers:
+                results = generator.generate_batch_tickets(
+                    event_name, buyers, event_date=event_date, ticket_type=ticket_type,
+                    price=price, workers=workers, chunk_size=chunk_size
+                )
+                for result in results:
+                    if result["success"]:
+                        checkpoint["issued"] += 1
+                    else:
+                        failed_rows.add(buyer_rows[result["index"] - 1])
+                        if progress:
+                            progress(f"  ⚠️  {buyers[result['index'] - 1]['nom']}: {result['error']}")
+                generator.ticket_store.flush()
+
+            checkpoint["rows_done"] = max(checkpoint["rows_done"], chunk[-1][0])
+            checkpoint["failed_rows"] = sorted(failed_rows)
+            checkpoint["failed"] = len(failed_rows)
+            _save_checkpoint(checkpoint_path, checkpoint)
+
+            if progress:
+                elapsed = time.perf_counter() - started
+                rate = (checkpoint["rows_done"] - rows_at_start) / elapsed if elapsed else 0
+                remaining = (total - checkpoint["rows_done"]) / rate if rate else 0
+                progress(f"  {checkpoint['rows_done']}/{total} lignes, {checkpoint['issued']} billets, "
+                         f"{rate:.0f} billets/s, reste {_format_duration(remaining)}")
+
+    # Tant que des lignes restent en échec, l'import n'est pas terminé : la
+    # prochaine exécution les réessaie
+    checkpoint["completed"] = not failed_rows
+    _save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+def main(argv, generator):
+    """Commande `issue` (python -m ticket_generator issue --help)"""
+    parser = argparse.ArgumentParser(
+        prog="python -m ticket_generator issue",
+        description="Émettre les billets d'un fichier CSV d'acheteurs, avec reprise après arrêt"
+    )
+    parser.add_argument("--csv", required=True, help="fichier CSV (colonnes nom/name et email)")
+    parser.add_argument("--event", required=True, help="nom de l'événement")
+    parser.add_argument("--date", default=None, help="date de l'événement (ISO)")
+    parser.add_argument("--type", default="Standard", help="type de billet")
+    parser.add_argument("--price", default="", help="prix")
+    parser.add_argument("--chunk-size", type=int, default=500, help="billets par paquet enregistré")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processus de rendu des images (0 : un par cœur)")
+    parser.add_argument("--checkpoint", default=None,
+                        help="fichier du point de reprise (défaut : <csv>.checkpoint.json)")
+    args = parser.parse_args(argv)
+
+    print(f"=== Émission des billets de {args.csv} pour « {args.event} » ===")
+    started = time.perf_counter()
+    try:
+        checkpoint = issue_from_csv(
+            generator, args.csv, args.event, event_date=args.date, ticket_type=args.type,
+            price=args.price, chunk_size=args.chunk_size, workers=args.workers,
+            checkpoint_path=args.checkpoint
+        )
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    except KeyboardInterrupt:
+        generator.ticket_store.close()
+        print("⏸️  Interrompu : relancez la même commande pour reprendre")
+        return 130
+    # Attendre la fusion du journal en cours avant de quitter
+    generator.ticket_store.close()
+
+    print(f"✓ {checkpoint['issued']} billets émis, {checkpoint['failed']} lignes en échec "
+          f"({_format_duration(time.perf_counter() - started)})")
+    if checkpoint["failed"]:
+        print(f"⚠️  Lignes en échec : {', '.join(map(str, checkpoint['failed_rows'][:20]))}"
+              f"{' ...' if checkpoint['failed'] > 20 else ''} "
+              f"(corrigez ces lignes sur place, sans insérer ni supprimer de ligne, "
+              f"puis relancez la même commande)")
+        return 2
+    return 0
@@ -0,0 +1,353 @@
+import base64
+import binascii
+import datetime
+import os
+import re
+import sys
+from collections.abc import MutableMapping
+
+
+# Champs dont les valeurs se répètent d'un enregistrement à l'autre : une seule copie en mémoire
+INTERNED_FIELDS = frozenset({
+    "event_name", "event_date", "event_id", "ticket_type", "price", "status",
+    "type_billet", "prix", "location", "user_agent", "version",
+    "method", "error_correction", "format"
+})
+
+# Dates ISO gardées en datetime (48 octets au lieu d'environ 75 pour la chaîne)
+TIMESTAMP_FIELDS = frozenset({"generated_at", "achat_le", "validated_at", "signed_at", "created_at"})
+
+V1_PREFIX = "TICKET_V1:"
+
+# Caractères retirés des noms de fichiers (\w : lettres, chiffres et _)
+UNSAFE_FILENAME_CHARS = re.compile(r"[^\w \-]")
+
+
+def ticket_filename(event_name, buyer_name, ticket_id, extension):
+    """Nom du fichier image d'un billet"""
+    safe_event_name = UNSAFE_FILENAME_CHARS.sub("", event_name).strip()
+    safe_buyer_name = UNSAFE_FILENAME_CHARS.sub("", buyer_name).strip()
+    return f"ticket_{safe_event_name}_{safe_buyer_name}_{ticket_id[:8]}{extension}"
+
+
+class CompactRecord(tuple):
+    """Enregistrement compact : (forme, valeur1, valeur2, ...).
+
+    La forme est le tuple des clés, partagé par tous les enregistrements
+    de même structure ; les dictionnaires imbriqués sont eux aussi
+    compacts. get() lit un champ sans reconstruire l'enregistrement.
+    """
+
+    __slots__ = ()
+
+    def get(self, key, default=None):
+        index = _shape_index(self[0]).get(key)
+        if index is None:
+            return default
+        value = self[index + 1]
+        if type(value) in _DERIVED_TYPES:
+            return unpack_record(self)[key]
+        if type(value) is CompactRecord:
+            return value  # reste compact : a lui aussi get()
+        return _unpack_value(key, value)
+
+
+class _DerivedFilename:
+    """Nom de fichier recalculé depuis l'événement, l'acheteur et l'ID (voir ticket_filename)"""
+    __slots__ = ("extension",)
+
+    def __init__(self, extension):
+        self.extension = extension
+
+
+class _JoinedPath:
+    """Chemin recalculé : dossier partagé + nom du fichier"""
+    __slots__ = ("directory",)
+
+    def __init__(self, directory):
+        self.directory = directory
+
+
+def _unpack_uuid(value):
+    digits = value.hex()
+    return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
+
+
+def _unpack_v1(value):
+    return V1_PREFIX + base64.b64encode(value).decode('ascii')
+
+
+# Octets à reconvertir en chaîne selon le champ
+_BYTES_FIELDS = {
+    "ticket_id": _unpack_uuid,
+    "signature": bytes.hex,
+    "qr_content": _unpack_v1,
+}
+
+_SHAPES = {}
+_SHAPE_INDEXES = {}
+_DERIVED_VALUES = {}
+
+
+def _shape_index(shape):
+    index = _SHAPE_INDEXES.get(shape)
+    if index is None:
+        index = _SHAPE_INDEXES[shape] = {key: position for position, key in enumerate(shape)}
+    return index
+
+
+def _derived(cls, argument):
+    """Marqueurs partagés (un par extension ou par dossier)"""
+    value = _DERIVED_VALUES.get((cls, argument))
+    if value is None:
+        value = _DERIVED_VALUES[(cls, argument)] = cls(argument)
+    return value
+
+
+def _pack_uuid(value):
+    if len(value) != 36:
+        return value
+    try:
+        packed = bytes.fromhex(value.replace("-", ""))
+    except ValueError:
+        return value
+    return packed if _unpack_uuid(packed) == value else value
+
+
+def _pack_hex(value):
+    try:
+        packed = bytes.fromhex(value)
+    except ValueError:
+        return value
+    return packed if packed.hex() == value else value
+
+
+def _pack_v1(value):
+    """Contenu TICKET_V1 gardé décodé (le base64 est un tiers plus long)"""
+    if not value.startswith(V1_PREFIX):
+        return value
+    try:
+        packed = base64.b64decode(value[len(V1_PREFIX):], validate=True)
+    except binascii.Error:
+        return value
+    return packed if _unpack_v1(packed) == value else value
+
+
+def _pack_timestamp(value):
+    try:
+        packed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    return packed if packed.isoformat() == value else value
+
+
+# Forme compacte d'une chaîne selon le champ, gardée seulement si elle redonne la même chaîne
+_STRING_PACKERS = {
+    "ticket_id": _pack_uuid,
+    "signature": _pack_hex,
+    "qr_content": _pack_v1,
+    **{field: _pack_timestamp for field in TIMESTAMP_FIELDS},
+    **{field: sys.intern for field in INTERNED_FIELDS},
+}
+
+
+def _pack_value(key, value, memo):
+    value_type = type(value)
+    if value_type is str:
+        # Une même chaîne répétée dans l'enregistrement (ID, acheteur) n'est gardée qu'une fois
+        packed = memo.get(value)
+        if packed is None or (type(packed) is bytes and key not in _BYTES_FIELDS):
+            pack = _STRING_PACKERS.get(key)
+            packed = memo[value] = value if pack is None else pack(value)
+        return packed
+    if value_type is dict:
+        return _pack_dict(value, memo)
+    if value_type is list:
+        return [_pack_value(key, item, memo) for item in value]
+    return value
+
+
+def _pack_dict(record, memo):
+    keys = tuple(record)
+    shape = _SHAPES.get(keys)
+    if shape is None:
+        shape = _SHAPES[keys] = keys
+    return CompactRecord((shape, *[_pack_value(key, value, memo) for key, value in record.items()]))
+
+
+def pack_record(record, memo=None):
+    """Compacter un enregistrement (dictionnaire JSON) ; unpack_record le reconstruit à l'identique"""
+    memo = {} if memo is None else memo
+    packed = _pack_dict(record, memo)
+
+    # Champs recalculables depuis les autres : seuls les cas vérifiés sont remplacés
+    filename = record.get("filename")
+    if not isinstance(filename, str):
+        return packed
+    values = list(packed)
+    index = _shape_index(packed[0])
+    buyer_info = record.get("buyer_info")
+    if (isinstance(buyer_info, dict) and isinstance(buyer_info.get("nom"), str)
+            and isinstance(record.get("event_name"), str) and isinstance(record.get("ticket_id"), str)):
+        extension = os.path.splitext(filename)[1]
+        if ticket_filename(record["event_name"], buyer_info["nom"], record["ticket_id"], extension) == filename:
+            values[index["filename"] + 1] = _derived(_DerivedFilename, extension)
+    filepath = record.get("filepath")
+    if isinstance(filepath, str):
+        directory = os.path.dirname(filepath)
+        if os.path.join(directory, filename) == filepath:
+            values[index["filepath"] + 1] = _derived(_JoinedPath, sys.intern(directory))
+    return CompactRecord(values)
+
+
+def _unpack_value(key, value):
+    value_type = type(value)
+    if value_type is CompactRecord:
+        return unpack_record(value)
+    if value_type is datetime.datetime:
+        return value.isoformat()
+    if value_type is bytes:
+        return _BYTES_FIELDS[key](value)
+    if value_type is list:
+        return [_unpack_value(key, item) for item in value]
+    return value
+
+
+_DERIVED_TYPES = (_DerivedFilename, _JoinedPath)
+
+
+def unpack_record(packed):
+    """Reconstruire le dictionnaire d'un enregistrement compact (les autres valeurs sont rendues telles quelles)"""
+    if type(packed) is not CompactRecord:
+        return packed
+    shape = packed[0]
+    record = {}
+    derived = False
+    for position, key in enumerate(shape, 1):
+        value = packed[position]
+        if type(value) is str or value is None:
+            record[key] = value
+        elif type(value) in _DERIVED_TYPES:
+            record[key] = value
+            derived = True
+        else:
+            record[key] = _unpack_value(key, value)
+
+    if derived:
+        filename = record.get("filename")
+        if type(filename) is _DerivedFilename:
+            filename = record["filename"] = ticket_filename(
+                record["event_name"], record["buyer_info"]["nom"], record["ticket_id"], filename.extension
+            )
+        filepath = record.get("filepath")
+        if type(filepath) is _JoinedPath:
+            record["filepath"] = os.path.join(filepath.directory, filename)
+    return record
+
+
+class CompactRecords(MutableMapping):
+    """Enregistrements gardés compacts en mémoire, avec une vue dictionnaire (clé -> dict).
+
+    Chaque lecture reconstruit un dictionnaire neuf : le modifier ne change
+    pas l'enregistrement, il faut le réécrire (put).
+    """
+
+    def __init__(self, records=()):
+        self._packed = {}
+        self.update(records)
+
+    def __getitem__(self, key):
+        return unpack_record(self._packed[key])
+
+    def __setitem__(self, key, record):
+        # Le champ égal à la clé (ticket_id) partage la chaîne de la clé
+        self._packed[key] = pack_record(record, {key: key}) if isinstance(record, dict) else record
+
+    def __delitem__(self, key):
+        del self._packed[key]
+
+    def __iter__(self):
+        return iter(self._packed)
+
+    def __len__(self):
+        return len(self._packed)
+
+    def __contains__(self, key):
+        return key in self._packed
+
+    def get(self, key, default=None):
+        packed = self._packed.get(key)
+        return default if packed is None else unpack_record(packed)
+
+    def update(self, other=(), **kwargs):
+        if isinstance(other, CompactRecords) and not kwargs:
+            self._packed.update(other._packed)
+        else:
+            super().update(other, **kwargs)
+
+    def clear(self):
+        self._packed.clear()
+
+    def copy(self):
+        """Copie indépendante (les enregistrements compacts sont immuables et partagés)"""
+        copy = CompactRecords()
+        copy._packed = dict(self._packed)
+        return copy
+
+    def packed_values(self):
+        """Enregistrements compacts, sans reconstruction (lecture des champs par get())"""
+        return self._packed.values()
+
+    def packed_items(self):
+        return self._packed.items()
+
+
+if __name__ == "__main__":
+    import json
+    import tracemalloc
+    import uuid
+
+    print("=== Mémoire des enregistrements : dictionnaires JSON vs compacts ===")
+    count = 20000
+    event_name = "Soirée Dansante 2025"
+    user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/140.0.0.0 Safari/537.36"
+    now = datetime.datetime.now()
+    tickets, validations = {}, {}
+    for i in range(count):
+        ticket_id = str(uuid.uuid4())
+        generated_at = (now + datetime.timedelta(microseconds=i)).isoformat()
+        buyer_info = {"nom": f"Invité {i}", "email": f"invite{i}@example.com", "achat_le": generated_at}
+        additional_data = {"type_billet": "Standard", "prix": "25€"}
+        ticket_data = {"event_name": event_name, "ticket_id": ticket_id, "generated_at": generated_at,
+                       "event_date": None, "buyer_info": buyer_info, "additional_data": additional_data}
+        signed = {"data": ticket_data, "signature": os.urandom(32).hex(), "version": "1.0"}
+        filename = ticket_filename(event_name, buyer_info["nom"], ticket_id, ".png")
+        tickets[ticket_id] = {
+            "ticket_id": ticket_id, "event_name": event_name, "buyer_info": buyer_info,
+            "event_date": None, "ticket_type": "Standard", "price": "25€", "additional_data": additional_data,
+            "qr_content": V1_PREFIX + base64.b64encode(json.dumps(signed, separators=(',', ':')).encode()).decode(),
+            "filename": filename, "filepath": os.path.join("generated_tickets", filename),
+            "generated_at": generated_at, "status": "active"
+        }
+        validations[ticket_id] = {
+            "ticket_id": ticket_id, "validated_at": (now + datetime.timedelta(seconds=i)).isoformat(),
+            "scanner_info": {"location": "Entrée principale", "validated_at": "2025-09-13T18:38:14.678Z",
+                             "user_agent": user_agent},
+            "ticket_data": ticket_data
+        }
+
+    for name, records in (("billets", tickets), ("validations", validations)):
+        text = json.dumps(records)
+        tracemalloc.start()
+        as_dicts = json.loads(text)
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        compact = CompactRecords(json.loads(text))
+        compact_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        assert all(compact[key] == value for key, value in as_dicts.items())
+        print(f"✓ {count} {name}: {dict_bytes / count:.0f} octets/enregistrement en dict, "
+              f"{compact_bytes / count:.0f} en compact (÷{dict_bytes / compact_bytes:.1f})")
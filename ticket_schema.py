@@ -0,0 +1,145 @@
+"""
+Format normalisé des bases de billets et de validations
+
+    python ticket_schema.py     # migrer les bases existantes (stockage TICKET_STORAGE)
+
+Billets : qr_content (copie base64 du billet signé, V1) n'est plus enregistré.
+Seuls la signature et la date signée (signed_at) sont gardés ; le contenu est
+reconstruit à la demande depuis les champs du billet (ticket_qr_content).
+Les billets V2 gardent leur qr_content, qui est déjà la forme signée compacte.
+
+Validations : ticket_data (copie complète du billet à chaque entrée) est
+remplacé par event_name ; les données du billet sont reprises de la base
+des billets à l'affichage (TicketValidator.with_ticket_data).
+
+Dans les deux cas, un enregistrement n'est normalisé que si rien ne se perd :
+contenu QR reconstruit à l'identique, billet présent dans la base. Les
+anciens enregistrements restent lisibles tels quels.
+"""
+
+import base64
+import binascii
+import json
+import os
+import sys
+
+from ticket_security import TICKET_V1_PREFIX, encode_signed_ticket, signed_ticket_data
+from ticket_storage import create_store
+
+
+def ticket_qr_content(record):
+    """Contenu QR d'un billet : enregistré tel quel (ancien format, V2) ou reconstruit"""
+    qr_content = record.get("qr_content")
+    if qr_content is None and record.get("signature") and record.get("signed_at"):
+        qr_content = encode_signed_ticket({
+            "data": signed_ticket_data(record),
+            "signature": record["signature"],
+            "version": "1.0"
+        })
+    return qr_content
+
+
+def expand_ticket(record):
+    """Enregistrement d'un billet avec son qr_content (format des appelants et de l'API)"""
+    if record is None or "qr_content" in record:
+        return record
+    qr_content = ticket_qr_content(record)
+    return record if qr_content is None else {**record, "qr_content": qr_content}
+
+
+def _decode_v1(qr_content):
+    try:
+        signed = json.loads(base64.b64decode(qr_content[len(TICKET_V1_PREFIX):], validate=True))
+    except (binascii.Error, ValueError):
+        return None
+    return signed if isinstance(signed, dict) and isinstance(signed.get("data"), dict) else None
+
+
+def normalize_ticket(record, signed_ticket=None):
+    """Enregistrement d'un billet sans qr_content, s'il se reconstruit à l'identique
+
+    signed_ticket : billet signé correspondant, s'il est connu (sinon décodé
+    depuis qr_content). Retourne l'enregistrement inchangé sinon.
+    """
+    qr_content = record.get("qr_content")
+    if not isinstance(qr_content, str) or not qr_content.startswith(TICKET_V1_PREFIX):
+        return record
+    signed = signed_ticket or _decode_v1(qr_content)
+    if signed is None:
+        return record
+
+    normalized = {key: value for key, value in record.items() if key != "qr_content"}
+    normalized["signature"] = signed.get("signature")
+    normalized["signed_at"] = signed["data"].get("generated_at")
+    return normalized if ticket_qr_content(normalized) == qr_content else record
+
+
+def normalize_validation(entry, ticket_exists):
+    """Validation sans copie du billet, si le billet est dans la base (ticket_exists(ticket_id))"""
+    if "ticket_data" not in entry or not ticket_exists(entry.get("ticket_id")):
+        return entry
+    normalized = {key: value for key, value in entry.items() if key != "ticket_data"}
+    normalized.setdefault("event_name", (entry.get("ticket_data") or {}).get("event_name"))
+    return normalized
+
+
+def _file_size(path):
+    """Taille d'un stockage JSON sur disque (snapshot et journaux)"""
+    return sum(os.path.getsize(p) for p in (path, f"{path}.journal", f"{path}.journal.compacting")
+               if os.path.exists(p))
+
+
+def migrate(storage="json", tickets_path="tickets_database.json",
+            validations_path="ticket_validations.json", **storage_options):
+    """Réécrire les billets et validations existants au format normalisé
+
+    Retourne, par table, le nombre d'enregistrements normalisés et la taille
+    avant/après (None pour SQLite, où la place se libère au VACUUM).
+    """
+    report = {}
+    tickets = create_store(storage, tickets_path, "tickets", **storage_options)
+    validations = create_store(storage, validations_path, "validations", **storage_options)
+
+    for table, store, path in (("tickets", tickets, tickets_path),
+                               ("validations", validations, validations_path)):
+        size_before = _file_size(path) if storage != "sqlite" else None
+        store.load()
+        if table == "tickets":
+            normalize = normalize_ticket
+        else:
+            def normalize(entry):
+                return normalize_validation(entry, lambda ticket_id: tickets.get(ticket_id) is not None)
+        changed = []
+        for key, record in store.records.items():
+            normalized = normalize(record)
+            if normalized is not record:
+                changed.append((key, normalized))
+        if changed:
+            store.put_many(changed)
+        # JSON : réécrire le snapshot d'un coup (journal vidé)
+        if storage != "sqlite":
+            store.save()
+        report[table] = {
+            "normalized": len(changed),
+            "size_before": size_before,
+            "size_after": _file_size(path) if storage != "sqlite" else None
+        }
+
+    tickets.close()
+    validations.close()
+    return report
+
+
+if __name__ == "__main__":
+    storage = os.environ.get("TICKET_STORAGE", "json")
+    print(f"=== Migration vers le format normalisé (stockage {storage}) ===")
+    try:
+        report = migrate(storage)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    for table, result in report.items():
+        line = f"✓ {table}: {result['normalized']} enregistrements normalisés"
+        if result["size_before"] is not None:
+            line += f", {result['size_before'] / 1024:.0f} Ko -> {result['size_after'] / 1024:.0f} Ko"
+        print(line)
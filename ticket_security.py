@@ -1,10 +1,140 @@
 import hashlib
 import hmac
+import os
 import secrets
 import json
 import base64
 import datetime
+import struct
+import threading
+import uuid
 from pathlib import Path
+from collections import OrderedDict
+from ticket_stats import RejectionCounters, StatsCounters
+from ticket_storage import create_store
+
+TICKET_V1_PREFIX = "TICKET_V1:"
+
+# Format compact : préfixe et contenu limités au jeu alphanumérique des QR codes
+TICKET_V2_PREFIX = "TICKET-V2:"
+BASE45_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+BASE45_BYTES = BASE45_ALPHABET.encode('ascii')
+BASE45_TABLE = bytes.maketrans(BASE45_BYTES, bytes(range(45)))
+
+# version, UUID, id d'événement, généré le (epoch), date de l'événement (epoch, 0 = aucune)
+V2_RECORD = struct.Struct(">B16sIII")
+V2_NUMBERED_RECORD = struct.Struct(">B16sIIII")  # version 3 : + numéro du billet dans l'événement
+V2_TAG_SIZE = 10  # HMAC-SHA256 tronqué à 80 bits
+
+
+def base45_encode(data):
+    """Encoder des octets en base45 (RFC 9285)"""
+    chars = []
+    for i in range(0, len(data) - 1, 2):
+        value = data[i] * 256 + data[i + 1]
+        value, c0 = divmod(value, 45)
+        c2, c1 = divmod(value, 45)
+        chars.extend((BASE45_ALPHABET[c0], BASE45_ALPHABET[c1], BASE45_ALPHABET[c2]))
+    if len(data) % 2:
+        c1, c0 = divmod(data[-1], 45)
+        chars.extend((BASE45_ALPHABET[c0], BASE45_ALPHABET[c1]))
+    return "".join(chars)
+
+
+def base45_decode(text):
+    """Décoder une chaîne base45, ValueError si elle est invalide"""
+    try:
+        raw = text.encode('ascii')
+    except UnicodeEncodeError:
+        raise ValueError("Caractère base45 invalide")
+    if raw.translate(None, BASE45_BYTES) or len(raw) % 3 == 1:
+        raise ValueError("Chaîne base45 invalide")
+
+    # Traduire chaque caractère en sa valeur (0-44) en une seule passe
+    values = raw.translate(BASE45_TABLE)
+    data = bytearray()
+    full = len(values) - len(values) % 3
+    for i in range(0, full, 3):
+        value = values[i] + values[i + 1] * 45 + values[i + 2] * 2025
+        if value > 0xFFFF:
+            raise ValueError("Bloc base45 invalide")
+        data += value.to_bytes(2, 'big')
+    if full < len(values):
+        value = values[full] + values[full + 1] * 45
+        if value > 0xFF:
+            raise ValueError("Bloc base45 invalide")
+        data.append(value)
+    return bytes(data)
+
+
+# Encodeurs JSON réutilisés (json.dumps en recrée un à chaque appel avec ces options)
+CANONICAL_JSON = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+COMPACT_JSON = json.JSONEncoder(separators=(',', ':'))
+
+
+# Contenus refusés gardés en mémoire (QR codes étrangers vus en boucle par la caméra)
+REJECTED_CACHE_SIZE = 4096
+
+# Point de contrôle des scans envoyés sans "location"
+NO_LOCATION = "Non précisé"
+
+
+def payload_digest(qr_data):
+    """Empreinte 128 bits d'un contenu de QR code (signature comprise)"""
+    return hashlib.blake2b(qr_data.encode('utf-8'), digest_size=16).digest()
+
+
+# Empreinte publiée dans le manifeste des scanners hors ligne (64 bits, hexadécimal)
+OFFLINE_TAG_CHARS = 16
+
+
+def offline_tag(qr_content):
+    """Empreinte d'un contenu de billet pour la liste hors ligne (SHA-256 tronqué)
+    
+    Le navigateur la recalcule avec crypto.subtle ; le manifeste ne contient
+    ni les billets ni de quoi en fabriquer.
+    """
+    return hashlib.sha256(qr_content.encode('utf-8')).hexdigest()[:OFFLINE_TAG_CHARS]
+
+
+def encode_signed_ticket(signed_ticket):
+    """Encoder un billet signé pour un QR code (base64, ou base45 pour V2)"""
+    if signed_ticket.get("version") == "2.0":
+        packed = bytes.fromhex(signed_ticket["payload"]) + bytes.fromhex(signed_ticket["signature"])
+        return f"{TICKET_V2_PREFIX}{base45_encode(packed)}"
+    
+    json_string = COMPACT_JSON.encode(signed_ticket)
+    
+    # Encoder en base64 pour réduire la taille
+    encoded = base64.b64encode(json_string.encode('utf-8')).decode('utf-8')
+    
+    # Ajouter un préfixe pour identifier nos billets
+    return f"{TICKET_V1_PREFIX}{encoded}"
+
+
+def signed_ticket_data(record):
+    """Données signées (V1) d'un billet, reconstruites depuis son enregistrement en base
+    
+    Même structure que create_many_ticket_data ; la date signée est signed_at
+    (format normalisé, voir ticket_schema) ou, à défaut, la date de génération.
+    """
+    ticket_data = {
+        "event_name": record.get("event_name"),
+        "ticket_id": record.get("ticket_id"),
+        "generated_at": record.get("signed_at") or record.get("generated_at"),
+        "event_date": record.get("event_date"),
+        "buyer_info": record.get("buyer_info") or {},
+        "additional_data": record.get("additional_data") or {}
+    }
+    if record.get("ticket_number") is not None:
+        ticket_data["ticket_number"] = record["ticket_number"]
+    return ticket_data
+
+
+def event_id_for(event_name):
+    """Identifiant 32 bits d'un événement, dérivé de son nom"""
+    return int.from_bytes(hashlib.sha256(event_name.encode('utf-8')).digest()[:4], 'big')
+
 
 class TicketSecurity:
     """Système de sécurité pour l'authentification des billets QR"""
@@ -12,6 +142,8 @@ class TicketSecurity:
     def __init__(self, secret_key_file="ticket_secret.key"):
         self.secret_key_file = secret_key_file
         self.secret_key = self._load_or_create_secret_key()
+        self._hmac_key = None
+        self._hmac_state = None
     
     def _load_or_create_secret_key(self):
         """Charger ou créer une clé secrète pour la signature"""
@@ -38,52 +170,170 @@ class TicketSecurity:
     def create_ticket_data(self, event_name, ticket_id, buyer_info=None, 
                           event_date=None, additional_data=None):
         """Créer les données d'un billet avec signature"""
+        return self.create_many_ticket_data(
+            event_name,
+            [{"ticket_id": ticket_id, "buyer_info": buyer_info, "additional_data": additional_data}],
+            event_date=event_date
+        )[0]
+    
+    def create_many_ticket_data(self, event_name, tickets, event_date=None):
+        """Créer les données signées de plusieurs billets d'un même événement
         
-        # Données du billet
-        ticket_data = {
-            "event_name": event_name,
-            "ticket_id": ticket_id,
-            "generated_at": datetime.datetime.now().isoformat(),
-            "event_date": event_date,
-            "buyer_info": buyer_info or {},
-            "additional_data": additional_data or {}
-        }
+        tickets : dictionnaires avec ticket_id, buyer_info, additional_data et
+        éventuellement ticket_number.
+        Les billets d'un même appel partagent la date de génération.
+        """
+        generated_at = datetime.datetime.now().isoformat()
+        signed_tickets = []
         
-        # Créer la signature
-        data_string = json.dumps(ticket_data, sort_keys=True, separators=(',', ':'))
-        signature = self._create_signature(data_string)
+        for ticket in tickets:
+            # Données du billet
+            ticket_data = {
+                "event_name": event_name,
+                "ticket_id": ticket["ticket_id"],
+                "generated_at": generated_at,
+                "event_date": event_date,
+                "buyer_info": ticket.get("buyer_info") or {},
+                "additional_data": ticket.get("additional_data") or {}
+            }
+            if ticket.get("ticket_number") is not None:
+                ticket_data["ticket_number"] = ticket["ticket_number"]
+            
+            # Signer et ajouter la signature aux données
+            signed_tickets.append({
+                "data": ticket_data,
+                "signature": self._create_signature(CANONICAL_JSON.encode(ticket_data)),
+                "version": "1.0"
+            })
         
-        # Ajouter la signature aux données
-        signed_ticket = {
-            "data": ticket_data,
-            "signature": signature,
-            "version": "1.0"
-        }
+        return signed_tickets
+    
+    def sign_many(self, event_name, tickets, event_date=None, compact=False):
+        """Signer et encoder pour QR code une liste de billets
         
-        return signed_ticket
+        tickets : dictionnaires avec ticket_id, buyer_info, additional_data et
+        éventuellement ticket_number (seuls ticket_id et ticket_number sont
+        utilisés en format compact).
+        Retourne la liste des (billet signé, contenu QR), dans l'ordre.
+        """
+        if compact:
+            signed_tickets = [self.create_compact_ticket(event_name, ticket["ticket_id"], event_date,
+                                                         ticket.get("ticket_number"))
+                              for ticket in tickets]
+        else:
+            signed_tickets = self.create_many_ticket_data(event_name, tickets, event_date)
+        return [(signed, self.encode_ticket_for_qr(signed)) for signed in signed_tickets]
+    
+    def _keyed_hmac(self):
+        """Copie d'un état HMAC déjà initialisé avec la clé secrète"""
+        if self._hmac_key != self.secret_key:
+            self._hmac_state = hmac.new(self.secret_key.encode('utf-8'), digestmod=hashlib.sha256)
+            self._hmac_key = self.secret_key
+        return self._hmac_state.copy()
     
     def _create_signature(self, data_string):
         """Créer une signature HMAC pour les données"""
-        signature = hmac.new(
-            self.secret_key.encode('utf-8'),
-            data_string.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        return signature
+        mac = self._keyed_hmac()
+        mac.update(data_string.encode('utf-8'))
+        return mac.hexdigest()
+    
+    def create_compact_ticket(self, event_name, ticket_id, event_date=None, ticket_number=None):
+        """Créer un billet compact (TICKET-V2) : enregistrement binaire + HMAC tronqué
+        
+        Seuls l'ID, l'événement, les dates et l'éventuel numéro du billet sont
+        signés ; les informations de l'acheteur restent dans la base de données.
+        """
+        generated_at = datetime.datetime.now().replace(microsecond=0)
+        event_timestamp = 0
+        if event_date:
+            event_timestamp = int(datetime.datetime.fromisoformat(event_date).timestamp())
+        
+        fields = (
+            uuid.UUID(ticket_id).bytes,
+            event_id_for(event_name),
+            int(generated_at.timestamp()),
+            event_timestamp
+        )
+        if ticket_number is None:
+            record = V2_RECORD.pack(2, *fields)
+        else:
+            record = V2_NUMBERED_RECORD.pack(3, *fields, ticket_number)
+        
+        ticket_data = self._unpack_compact_record(record)
+        ticket_data["event_name"] = event_name
+        
+        return {
+            "data": ticket_data,
+            "signature": self._create_compact_tag(record).hex(),
+            "version": "2.0",
+            "payload": record.hex()
+        }
+    
+    def _create_compact_tag(self, record):
+        """Créer la signature tronquée d'un enregistrement compact"""
+        mac = self._keyed_hmac()
+        mac.update(record)
+        return mac.digest()[:V2_TAG_SIZE]
+    
+    def _unpack_compact_record(self, record):
+        """Reconstruire les données d'un billet compact"""
+        ticket_number = None
+        if record[:1] == b"\x03":
+            version, ticket_uuid, event_id, generated_at, event_date, ticket_number = \
+                V2_NUMBERED_RECORD.unpack(record)
+        else:
+            version, ticket_uuid, event_id, generated_at, event_date = V2_RECORD.unpack(record)
+        if version not in (2, 3):
+            raise ValueError(f"Version de billet compact inconnue: {version}")
+        
+        ticket_data = {
+            "event_name": None,
+            "event_id": f"{event_id:08x}",
+            "ticket_id": str(uuid.UUID(bytes=ticket_uuid)),
+            "generated_at": datetime.datetime.fromtimestamp(generated_at).isoformat(),
+            "event_date": (datetime.datetime.fromtimestamp(event_date).isoformat()
+                           if event_date else None),
+            "buyer_info": {},
+            "additional_data": {}
+        }
+        if ticket_number is not None:
+            ticket_data["ticket_number"] = ticket_number
+        return ticket_data
     
     def validate_ticket(self, ticket_qr_data):
-        """Valider un billet en vérifiant sa signature"""
+        """Valider un billet en vérifiant sa signature (formats V1 et V2)"""
+        return self._validate_ticket(ticket_qr_data, datetime.datetime.now().isoformat())
+    
+    def verify_many(self, tickets_qr_data):
+        """Valider une liste de billets ; retourne les résultats dans l'ordre
+        
+        Chaque résultat a le format de validate_ticket. Les billets d'un
+        même appel partagent la date de validation.
+        """
+        validated_at = datetime.datetime.now().isoformat()
+        return [self._validate_ticket(ticket_qr_data, validated_at) for ticket_qr_data in tickets_qr_data]
+    
+    def _validate_ticket(self, ticket_qr_data, validated_at):
         try:
             # Décoder les données du QR code
             if isinstance(ticket_qr_data, str):
-                try:
-                    ticket_json = json.loads(ticket_qr_data)
-                except json.JSONDecodeError:
-                    return {
-                        "valid": False,
-                        "error": "Format de données invalide",
-                        "details": "Le QR code ne contient pas de JSON valide"
-                    }
+                if ticket_qr_data.startswith((TICKET_V1_PREFIX, TICKET_V2_PREFIX)):
+                    ticket_json = self.decode_ticket_from_qr(ticket_qr_data)
+                    if ticket_json is None:
+                        return {
+                            "valid": False,
+                            "error": "Format de données invalide",
+                            "details": "Le contenu du QR code ne peut pas être décodé"
+                        }
+                else:
+                    try:
+                        ticket_json = json.loads(ticket_qr_data)
+                    except json.JSONDecodeError:
+                        return {
+                            "valid": False,
+                            "error": "Format de données invalide",
+                            "details": "Le QR code ne contient pas de JSON valide"
+                        }
             else:
                 ticket_json = ticket_qr_data
             
@@ -96,13 +346,23 @@ class TicketSecurity:
                     "details": f"Champs requis manquants: {required_fields}"
                 }
             
-            # Extraire les données et signature
-            ticket_data = ticket_json["data"]
             provided_signature = ticket_json["signature"]
             
-            # Recalculer la signature
-            data_string = json.dumps(ticket_data, sort_keys=True, separators=(',', ':'))
-            expected_signature = self._create_signature(data_string)
+            if ticket_json["version"] == "2.0":
+                # Billet compact : les données sont reconstruites depuis l'enregistrement signé
+                record = bytes.fromhex(ticket_json["payload"])
+                ticket_data = self._unpack_compact_record(record)
+                ticket_data["event_name"] = ticket_json["data"].get("event_name")
+                if (ticket_data["event_name"] is not None
+                        and f"{event_id_for(ticket_data['event_name']):08x}" != ticket_data["event_id"]):
+                    ticket_data["event_name"] = None
+                expected_signature = self._create_compact_tag(record).hex()
+            else:
+                # Extraire les données
+                ticket_data = ticket_json["data"]
+                
+                # Recalculer la signature
+                expected_signature = self._create_signature(CANONICAL_JSON.encode(ticket_data))
             
             # Comparer les signatures de manière sécurisée
             is_valid = hmac.compare_digest(provided_signature, expected_signature)
@@ -111,7 +371,7 @@ class TicketSecurity:
                 return {
                     "valid": True,
                     "ticket_data": ticket_data,
-                    "validated_at": datetime.datetime.now().isoformat(),
+                    "validated_at": validated_at,
                     "event_name": ticket_data.get("event_name"),
                     "ticket_id": ticket_data.get("ticket_id"),
                     "generated_at": ticket_data.get("generated_at"),
@@ -133,23 +393,30 @@ class TicketSecurity:
             }
     
     def encode_ticket_for_qr(self, signed_ticket):
-        """Encoder les données du billet pour un QR code (base64 compressé)"""
-        json_string = json.dumps(signed_ticket, separators=(',', ':'))
-        
-        # Encoder en base64 pour réduire la taille
-        encoded = base64.b64encode(json_string.encode('utf-8')).decode('utf-8')
-        
-        # Ajouter un préfixe pour identifier nos billets
-        return f"TICKET_V1:{encoded}"
+        """Encoder les données du billet pour un QR code (base64, ou base45 pour V2)"""
+        return encode_signed_ticket(signed_ticket)
     
     def decode_ticket_from_qr(self, qr_data):
-        """Décoder les données d'un QR code de billet"""
+        """Décoder les données d'un QR code de billet (formats V1 et V2)"""
         try:
-            if not qr_data.startswith("TICKET_V1:"):
+            if qr_data.startswith(TICKET_V2_PREFIX):
+                packed = base45_decode(qr_data[len(TICKET_V2_PREFIX):])
+                record_size = V2_NUMBERED_RECORD.size if packed[:1] == b"\x03" else V2_RECORD.size
+                if len(packed) != record_size + V2_TAG_SIZE:
+                    return None
+                record, tag = packed[:record_size], packed[record_size:]
+                return {
+                    "data": self._unpack_compact_record(record),
+                    "signature": tag.hex(),
+                    "version": "2.0",
+                    "payload": record.hex()
+                }
+            
+            if not qr_data.startswith(TICKET_V1_PREFIX):
                 return None
             
             # Retirer le préfixe
-            encoded_data = qr_data[10:]  # len("TICKET_V1:") = 10
+            encoded_data = qr_data[len(TICKET_V1_PREFIX):]
             
             # Décoder base64
             json_string = base64.b64decode(encoded_data.encode('utf-8')).decode('utf-8')
@@ -169,132 +436,315 @@ class TicketSecurity:
             "secret_key_exists": Path(self.secret_key_file).exists(),
             "signature_algorithm": "HMAC-SHA256",
             "encoding": "Base64",
-            "version": "1.0"
+            "version": "1.0",
+            "compact_format": {
+                "prefix": TICKET_V2_PREFIX,
+                "encoding": "Base45",
+                "record_bytes": V2_RECORD.size,
+                "tag_bytes": V2_TAG_SIZE
+            }
         }
 
 
 class TicketValidator:
     """Validateur de billets avec historique"""
     
-    def __init__(self, security_system=None):
+    def __init__(self, security_system=None, storage="json", storage_options=None,
+                 ticket_lookup=None, rejected_cache_size=REJECTED_CACHE_SIZE, bitmaps=None):
         self.security = security_system or TicketSecurity()
+        self.ticket_lookup = ticket_lookup
+        # Registres des billets numérotés (ticket_bitmap.TicketBitmaps) : leur bit
+        # « utilisé » fait foi, le stockage ne sert plus que de journal des scans
+        self.bitmaps = bitmaps
         self.validation_log = "ticket_validations.json"
-        self.validated_tickets = self._load_validation_history()
+        # Historique chargé au premier scan ou à la première statistique
+        self._store = create_store(storage, self.validation_log, "validations",
+                                   **(storage_options or {}))
+        self._store_loaded = False
+        self._load_lock = threading.Lock()
+        
+        # Compteurs tenus à jour à chaque scan ; les refus ne sont pas des
+        # validations : leurs totaux par processus vont dans un stockage à part,
+        # additionnés à la lecture (mêmes chiffres quel que soit le worker)
+        self.stats = StatsCounters(self._store, {"event_name": "Inconnu", "location": NO_LOCATION},
+                                   "validated_at", load=lambda: self.store)
+        # (chemin absolu : le minuteur des refus peut écrire après un changement de dossier)
+        self.rejection_log = os.path.abspath("ticket_rejections.json")
+        self.rejections = RejectionCounters(create_store(storage, self.rejection_log, "rejections",
+                                                         **(storage_options or {})))
+        
+        # Raccourcis avant décodage, indexés par l'empreinte du contenu complet :
+        # seule une copie exacte d'un contenu déjà vérifié peut y correspondre
+        self.rejected_cache_size = rejected_cache_size
+        self._used_payloads = {}  # empreinte -> ticket_id
+        self._rejected_payloads = OrderedDict()  # empreinte -> résultat du refus
+        self._cache_lock = threading.Lock()
+    
+    @property
+    def store(self):
+        """Stockage des validations, chargé au premier accès"""
+        if not self._store_loaded:
+            with self._load_lock:
+                if not self._store_loaded:
+                    self._load_validation_history()
+                    self._store_loaded = True
+        return self._store
+    
+    @property
+    def validated_tickets(self):
+        """Validations indexées par ticket_id"""
+        return self.store.records
     
     def _load_validation_history(self):
-        """Charger l'historique des validations"""
-        try:
-            if Path(self.validation_log).exists():
-                with open(self.validation_log, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception:
-            pass
-        return {}
+        """Charger l'historique des validations (snapshot + journal éventuel)"""
+        return self._store.load()
     
     def _save_validation_history(self):
-        """Sauvegarder l'historique des validations"""
-        try:
-            with open(self.validation_log, 'w', encoding='utf-8') as f:
-                json.dump(self.validated_tickets, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Erreur sauvegarde historique: {e}")
+        """Sauvegarder l'historique complet des validations"""
+        self.store.save()
     
     def validate_and_log(self, qr_data, scanner_info=None):
         """Valider un billet et enregistrer la validation"""
+        return self.validate_many_and_log([(qr_data, scanner_info)])[0]
+    
+    def validate_many_and_log(self, scans):
+        """Valider une série de scans et enregistrer les validations en une seule écriture
         
-        # S'assurer que validated_tickets est un dictionnaire
-        if not isinstance(self.validated_tickets, dict):
-            print(f"⚠️ validated_tickets corrigé de {type(self.validated_tickets)} vers dict")
-            self.validated_tickets = {}
+        scans : itérable de (qr_data, scanner_info). Les résultats sont rendus
+        dans l'ordre ; un billet présent plusieurs fois dans la série n'est
+        accepté qu'à sa première occurrence.
+        """
         
-        # Décoder le QR code
-        ticket_data = self.security.decode_ticket_from_qr(qr_data)
-        if not ticket_data:
-            return {
-                "valid": False,
-                "error": "QR code non reconnu",
-                "details": "Ce n'est pas un billet valide de votre système"
+        results = []
+        pending = []  # (position, empreinte, résultat, entrée de validation)
+        locations = []  # point de contrôle de chaque scan, pour compter les refus
+        
+        for qr_data, scanner_info in scans:
+            locations.append((scanner_info or {}).get("location") or NO_LOCATION)
+            # Contenu déjà vu : billet déjà utilisé ou refusé récemment
+            digest = payload_digest(qr_data) if isinstance(qr_data, str) else None
+            if digest is not None:
+                known_result = self._check_known_payload(digest)
+                if known_result is not None:
+                    results.append(known_result)
+                    continue
+            
+            # Décoder le QR code
+            ticket_data = self.security.decode_ticket_from_qr(qr_data)
+            if not ticket_data:
+                results.append(self._remember_rejected(digest, {
+                    "valid": False,
+                    "error": "QR code non reconnu",
+                    "details": "Ce n'est pas un billet valide de votre système"
+                }))
+                continue
+            
+            # Valider la signature
+            validation_result = self.security.validate_ticket(ticket_data)
+            if not validation_result["valid"]:
+                results.append(self._remember_rejected(digest, validation_result))
+                continue
+            
+            if "event_id" in validation_result["ticket_data"]:
+                self._complete_compact_ticket(validation_result)
+            
+            validation_entry = {
+                "ticket_id": validation_result["ticket_data"]["ticket_id"],
+                "validated_at": datetime.datetime.now().isoformat(),
+                "scanner_info": scanner_info or {},
+                "event_name": validation_result["ticket_data"].get("event_name")
             }
+            # Les données d'un billet présent en base n'y sont pas recopiées (voir ticket_schema)
+            if self.ticket_lookup is None or self.ticket_lookup(validation_entry["ticket_id"]) is None:
+                validation_entry["ticket_data"] = validation_result["ticket_data"]
+            
+            # Billet numéroté : un test-and-set dans le registre de l'événement
+            ticket_number = validation_result["ticket_data"].get("ticket_number")
+            if ticket_number is not None and self.bitmaps is not None:
+                validation_entry["ticket_number"] = ticket_number
+                rejection = self._mark_numbered_ticket(digest, validation_result)
+                if rejection is not None:
+                    results.append(rejection)
+                    continue
+            
+            pending.append((len(results), digest, validation_result, validation_entry))
+            results.append(validation_result)
+        
+        if not pending:
+            self._count_invalid(results, locations)
+            return results
         
-        # Valider la signature
-        validation_result = self.security.validate_ticket(ticket_data)
+        # Marquer comme utilisés seulement s'ils ne le sont pas déjà (atomique, une écriture)
+        try:
+            previous_uses = self.store.insert_many_if_absent(
+                [(entry["ticket_id"], entry) for _, _, _, entry in pending]
+            )
+        except Exception:
+            # Aucune validation enregistrée : rendre les billets numérotés à nouveau utilisables
+            for _, _, validation_result, _ in pending:
+                self._unmark_numbered_ticket(validation_result)
+            raise
         
-        if validation_result["valid"]:
-            ticket_id = validation_result["ticket_data"]["ticket_id"]
+        for (position, digest, validation_result, entry), previous_use in zip(pending, previous_uses):
+            if digest is not None:
+                with self._cache_lock:
+                    self._used_payloads[digest] = entry["ticket_id"]
             
-            # Vérifier si le billet a déjà été utilisé
-            if ticket_id in self.validated_tickets:
-                previous_use = self.validated_tickets[ticket_id]
-                return {
+            if previous_use is not None:
+                results[position] = {
                     "valid": False,
                     "error": "Billet déjà utilisé",
                     "details": f"Ce billet a été scanné le {previous_use['validated_at']}",
                     "previous_validation": previous_use,
                     "ticket_data": validation_result["ticket_data"]
                 }
-            
-            # Enregistrer la validation
-            validation_entry = {
-                "ticket_id": ticket_id,
-                "validated_at": datetime.datetime.now().isoformat(),
-                "scanner_info": scanner_info or {},
-                "ticket_data": validation_result["ticket_data"]
-            }
-            
-            self.validated_tickets[ticket_id] = validation_entry
-            self._save_validation_history()
+                continue
             
             validation_result["first_use"] = True
             validation_result["validation_logged"] = True
+            self.stats.add(entry)
         
-        return validation_result
+        self._count_invalid(results, locations)
+        return results
     
-    def get_validation_stats(self):
-        """Obtenir les statistiques de validation"""
-        # S'assurer que validated_tickets est un dictionnaire (c'est sa structure normale)
-        if not isinstance(self.validated_tickets, dict):
-            print(f"⚠️ validated_tickets n'est pas un dictionnaire: {type(self.validated_tickets)}")
-            self.validated_tickets = {}
-            
-        # Obtenir la liste des validations depuis le dictionnaire
-        validation_list = list(self.validated_tickets.values())
-        total_validated = len(validation_list)
+    def _count_invalid(self, results, locations):
+        self.rejections.add([location for result, location in zip(results, locations) if not result["valid"]])
+    
+    def _mark_numbered_ticket(self, digest, validation_result):
+        """Marquer un billet numéroté comme utilisé ; retourne le refus s'il l'était déjà"""
+        ticket_data = validation_result["ticket_data"]
+        event_id = ticket_data.get("event_id") or f"{event_id_for(ticket_data['event_name']):08x}"
+        try:
+            already_used = self.bitmaps.for_event(event_id).test_and_set(ticket_data["ticket_number"])
+        except ValueError as e:
+            return {
+                "valid": False,
+                "error": "Billet inconnu du registre",
+                "details": str(e),
+                "ticket_data": ticket_data
+            }
+        if not already_used:
+            return None
         
-        # Statistiques par événement
-        events = {}
-        for validation in validation_list:
-            try:
-                if isinstance(validation, dict) and "ticket_data" in validation:
-                    event_name = validation["ticket_data"].get("event_name", "Inconnu")
-                    events[event_name] = events.get(event_name, 0) + 1
-            except (TypeError, KeyError, AttributeError) as e:
-                print(f"⚠️ Erreur lors du traitement d'une validation: {e}")
-                continue
+        if digest is not None:
+            with self._cache_lock:
+                self._used_payloads[digest] = ticket_data["ticket_id"]
+        previous_use = self.store.get(ticket_data["ticket_id"])
+        return {
+            "valid": False,
+            "error": "Billet déjà utilisé",
+            "details": (f"Ce billet a été scanné le {previous_use['validated_at']}" if previous_use
+                        else f"Le billet n°{ticket_data['ticket_number']} a déjà été scanné"),
+            "previous_validation": previous_use,
+            "ticket_data": ticket_data
+        }
+    
+    def _unmark_numbered_ticket(self, validation_result):
+        """Annuler le marquage d'un billet numéroté dont la validation n'a pas été enregistrée"""
+        ticket_data = validation_result["ticket_data"]
+        if ticket_data.get("ticket_number") is None or self.bitmaps is None:
+            return
+        event_id = ticket_data.get("event_id") or f"{event_id_for(ticket_data['event_name']):08x}"
+        self.bitmaps.for_event(event_id).clear(ticket_data["ticket_number"])
+    
+    def _check_known_payload(self, digest):
+        """Résultat immédiat pour un contenu déjà refusé ou déjà utilisé, sinon None"""
+        with self._cache_lock:
+            rejected = self._rejected_payloads.get(digest)
+            if rejected is not None:
+                self._rejected_payloads.move_to_end(digest)
+                return dict(rejected)
+            ticket_id = self._used_payloads.get(digest)
         
-        # Validations récentes - trier par date avec gestion d'erreur
-        recent_validations = []
-        try:
-            recent_validations = sorted(
-                [v for v in validation_list if isinstance(v, dict)],
-                key=lambda x: x.get("validated_at", ""),
-                reverse=True
-            )[:10]
-        except Exception as e:
-            print(f"⚠️ Erreur lors du tri des validations récentes: {e}")
-            recent_validations = validation_list[:10]  # Prendre les 10 premiers sans tri
+        if ticket_id is None:
+            return None
+        previous_use = self.store.get(ticket_id)
+        if previous_use is None:
+            return None  # validations réinitialisées entre-temps
+        return {
+            "valid": False,
+            "error": "Billet déjà utilisé",
+            "details": f"Ce billet a été scanné le {previous_use['validated_at']}",
+            "previous_validation": previous_use,
+            "ticket_data": self.with_ticket_data(previous_use).get("ticket_data")
+        }
+    
+    def _remember_rejected(self, digest, result):
+        """Garder le refus d'un contenu dans le cache borné, et le retourner"""
+        if digest is not None and self.rejected_cache_size:
+            with self._cache_lock:
+                self._rejected_payloads[digest] = dict(result)
+                self._rejected_payloads.move_to_end(digest)
+                while len(self._rejected_payloads) > self.rejected_cache_size:
+                    self._rejected_payloads.popitem(last=False)
+        return result
+    
+    def with_ticket_data(self, validation):
+        """Validation complétée des données du billet, reprises de la base des billets
+        
+        Une validation enregistrée au format normalisé ne contient que les
+        informations du scan ; les anciennes gardent leur copie de ticket_data.
+        Les données sont lues dans le qr_content du billet s'il est enregistré
+        (ancien format, V2), reconstruites depuis l'enregistrement sinon.
+        """
+        if "ticket_data" in validation or self.ticket_lookup is None:
+            return validation
+        ticket = self.ticket_lookup(validation.get("ticket_id"))
+        if ticket is None:
+            return validation
+        decoded = self.security.decode_ticket_from_qr(ticket["qr_content"]) if ticket.get("qr_content") else None
+        if decoded is None:
+            return {**validation, "ticket_data": signed_ticket_data(ticket)}
+        ticket_data = decoded["data"]
+        if "event_id" in ticket_data:
+            self._complete_compact_ticket({"ticket_data": ticket_data})
+        return {**validation, "ticket_data": ticket_data}
+    
+    def _complete_compact_ticket(self, validation_result):
+        """Compléter un billet V2 (non signé : acheteur, type) depuis la base des billets"""
+        if self.ticket_lookup is None:
+            return
+        
+        ticket_data = validation_result["ticket_data"]
+        record = self.ticket_lookup(ticket_data["ticket_id"])
+        if not record or f"{event_id_for(record.get('event_name', '')):08x}" != ticket_data["event_id"]:
+            return
+        
+        ticket_data["event_name"] = record["event_name"]
+        ticket_data["buyer_info"] = record.get("buyer_info", {})
+        ticket_data["additional_data"] = record.get("additional_data", {})
+        validation_result["event_name"] = ticket_data["event_name"]
+        validation_result["buyer_info"] = ticket_data["buyer_info"]
+    
+    def get_validation_stats(self):
+        """Obtenir les statistiques de validation"""
+        # Compteurs tenus à jour par validate_many_and_log (rattrapage si un autre
+        # processus a validé des billets entre-temps)
+        self.stats.refresh()
+        snapshot = self.stats.snapshot()
+        invalid_scans, invalid_by_location = self.rejections.totals()
         
         return {
-            "total_validated": total_validated,
-            "events": events,
-            "recent_validations": recent_validations,
-            "valid_scans": total_validated,
-            "invalid_scans": 0  # Pour l'instant, on ne trace que les validations réussies
+            "total_validated": snapshot["total"],
+            "events": snapshot["counts"]["event_name"],
+            "locations": snapshot["counts"]["location"],
+            "recent_validations": [self.with_ticket_data(validation)  # les 10 dernières
+                                   for validation in snapshot["recent"]],
+            "valid_scans": snapshot["total"],
+            "invalid_scans": invalid_scans,
+            "invalid_by_location": invalid_by_location
         }
     
     def reset_validations(self):
         """Réinitialiser l'historique des validations"""
-        self.validated_tickets = {}
-        self._save_validation_history()
+        self.store.clear()
+        if self.bitmaps is not None:
+            self.bitmaps.clear_used()
+        self.stats.clear()
+        self.rejections.clear()
+        with self._cache_lock:
+            self._used_payloads.clear()
+            self._rejected_payloads.clear()
         return True
 
 
@@ -379,4 +829,79 @@ if __name__ == "__main__":
     print(f"✓ Système de sécurité: {security_info['signature_algorithm']}")
     print()
     
+    print("6. Comparaison des formats V1 / V2...")
+    
+    import timeit
+    import qrcode
+    
+    compact_ticket = security.create_compact_ticket(
+        event_name="Soirée Dansante 2025",
+        ticket_id=str(uuid.uuid4()),
+        event_date="2025-12-31T20:00:00"
+    )
+    for label, signed in (("V1", ticket_data), ("V2", compact_ticket)):
+        content = security.encode_ticket_for_qr(signed)
+        qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M)
+        qr.add_data(content)
+        qr.make(fit=True)
+        
+        def decode_and_validate():
+            security.validate_ticket(security.decode_ticket_from_qr(content))
+        
+        duration = timeit.timeit(decode_and_validate, number=2000) / 2000
+        print(f"✓ {label}: {len(content)} caractères, QR version {qr.version} "
+              f"({qr.modules_count}x{qr.modules_count} modules), "
+              f"décodage + validation {duration * 1e6:.1f} µs")
+    print()
+    
+    print("7. Signature et vérification en lot...")
+    
+    batch = [
+        {
+            "ticket_id": str(uuid.uuid4()),
+            "buyer_info": {"nom": f"Invité {i}", "email": f"invite{i}@email.com"},
+            "additional_data": {"type_billet": "Standard", "prix": "25€"}
+        }
+        for i in range(1000)
+    ]
+    key = security.secret_key.encode('utf-8')
+    
+    def sign_one_by_one():
+        # Ancienne méthode : nouvelle clé HMAC et nouvel encodeur JSON par billet
+        for ticket in batch:
+            data = {"event_name": "Soirée Dansante 2025", "generated_at": datetime.datetime.now().isoformat(),
+                    "event_date": None, **ticket}
+            signature = hmac.new(key, json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8'),
+                                 hashlib.sha256).hexdigest()
+            signed = {"data": data, "signature": signature, "version": "1.0"}
+            TICKET_V1_PREFIX + base64.b64encode(json.dumps(signed, separators=(',', ':')).encode('utf-8')).decode()
+    
+    def sign_batch():
+        security.sign_many("Soirée Dansante 2025", batch)
+    
+    contents = [content for _, content in security.sign_many("Soirée Dansante 2025", batch)]
+    assert all(result["valid"] for result in security.verify_many(contents))
+    sample = security.decode_ticket_from_qr(contents[0])["data"]
+    sample_bytes = CANONICAL_JSON.encode(sample).encode('utf-8')
+    
+    def keyed_hmac(data):
+        mac = security._keyed_hmac()
+        mac.update(data)
+        return mac.hexdigest()
+    
+    for label, one_by_one, batched in (
+        ("HMAC", lambda: [hmac.new(key, sample_bytes, hashlib.sha256).hexdigest() for _ in batch],
+         lambda: [keyed_hmac(sample_bytes) for _ in batch]),
+        ("JSON canonique", lambda: [json.dumps(sample, sort_keys=True, separators=(',', ':')) for _ in batch],
+         lambda: [CANONICAL_JSON.encode(sample) for _ in batch]),
+        ("Signature + encodage QR", sign_one_by_one, sign_batch),
+        ("Vérification", lambda: [security.validate_ticket(content) for content in contents],
+         lambda: security.verify_many(contents)),
+    ):
+        single_time = min(timeit.repeat(one_by_one, number=1, repeat=7)) / len(batch)
+        batch_time = min(timeit.repeat(batched, number=1, repeat=7)) / len(batch)
+        print(f"✓ {label}: {single_time * 1e6:.1f} µs/billet un par un, "
+              f"{batch_time * 1e6:.1f} µs/billet en lot")
+    print()
+    
     print("✅ Tests terminés - Système de sécurité opérationnel!")
\ No newline at end of file
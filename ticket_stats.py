@@ -0,0 +1,302 @@
+import datetime
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+
+
+class StatsCounters:
+    """Statistiques d'un stockage tenues à jour à chaque écriture.
+
+    Compteurs par valeur de champ (au total et par événement) et derniers
+    enregistrements gardés dans des tas bornés : une lecture ne parcourt
+    plus la base. Les compteurs sont reconstruits une fois au chargement ;
+    si d'autres processus écrivent dans le même stockage (workers
+    gunicorn), refresh() rattrape leurs enregistrements d'après le champ
+    de tri au lieu de tout relire.
+
+    Le premier comptage n'a lieu qu'au premier usage ; load est alors
+    appelé pour charger le stockage s'il ne l'est pas encore.
+    """
+
+    def __init__(self, store, group_fields, order_field, recent_size=10, load=None):
+        self.store = store
+        self.group_fields = group_fields  # {champ: valeur par défaut}
+        self.order_field = order_field
+        self.recent_size = recent_size
+        self.load = load
+        self._lock = threading.RLock()
+        self._sequence = itertools.count()
+        self._built = False
+        self._reset()
+
+    def _ensure_built(self):
+        """Compter le stockage au premier usage ; retourne False si c'est fait à l'instant"""
+        if self._built:
+            return True
+        if self.load is not None:
+            self.load()
+        self.rebuild()
+        return False
+
+    def _reset(self):
+        self.total = 0
+        self.counts = {field: {} for field in self.group_fields}
+        self.event_counts = {}  # événement -> {champ: {valeur: nombre}}
+        self._recent = {None: []}  # événement (None = tous) -> tas (valeur, n°, enregistrement)
+        self._latest = None
+        self._latest_keys = set()
+
+    def _value(self, field, record):
+        value = self.store.fields[field](record)
+        return self.group_fields[field] if value is None else value
+
+    def add(self, record):
+        """Compter un nouvel enregistrement (appelé après son écriture dans le stockage)"""
+        with self._lock:
+            if not self._ensure_built():
+                return  # le comptage initial vient de l'inclure
+            self.total += 1
+            event_name = self._value("event_name", record)
+            event_counts = self.event_counts.setdefault(
+                event_name, {field: {} for field in self.group_fields}
+            )
+            for field in self.group_fields:
+                value = self._value(field, record)
+                self.counts[field][value] = self.counts[field].get(value, 0) + 1
+                event_counts[field][value] = event_counts[field].get(value, 0) + 1
+
+            order_value = self.store.fields[self.order_field](record) or ""
+            entry = (order_value, next(self._sequence), record)
+            for heap in (self._recent[None], self._recent.setdefault(event_name, [])):
+                if len(heap) < self.recent_size:
+                    heapq.heappush(heap, entry)
+                elif order_value > heap[0][0]:
+                    heapq.heapreplace(heap, entry)
+
+            if self._latest is None or order_value > self._latest:
+                self._latest = order_value
+                self._latest_keys = set()
+            if order_value == self._latest:
+                self._latest_keys.add(record.get("ticket_id"))
+
+    def rebuild(self):
+        """Recompter tout le stockage (au chargement, ou après une remise à zéro)"""
+        with self._lock:
+            self._reset()
+            self._built = True
+            for record in self.store.find():
+                self.add(record)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self._built = True
+
+    def refresh(self):
+        """Rattraper les écritures des autres processus (un simple comptage sinon)"""
+        with self._lock:
+            if not self._ensure_built():
+                return
+            count = self.store.count()
+            if count == self.total:
+                return
+            if count > self.total and self._latest is not None:
+                for record in self.store.find(between={self.order_field: (self._latest, None)}):
+                    if record.get("ticket_id") not in self._latest_keys:
+                        self.add(record)
+                count = self.store.count()
+            if count != self.total:
+                self.rebuild()
+
+    def snapshot(self, event_name=None):
+        """Totaux, compteurs par champ et derniers enregistrements (tous ou d'un événement)"""
+        with self._lock:
+            self._ensure_built()
+            if event_name is None:
+                counts, total = self.counts, self.total
+            else:
+                counts = self.event_counts.get(event_name, {field: {} for field in self.group_fields})
+                total = sum(counts["event_name"].values())
+            recent = sorted(self._recent.get(event_name, []), reverse=True)
+            return {
+                "total": total,
+                "counts": {field: dict(values) for field, values in counts.items()},
+                "recent": [record for _, _, record in recent]
+            }
+
+
+class RejectionCounters:
+    """Refus de scan comptés par chaque processus et mis en commun dans un stockage.
+
+    Chaque processus (worker gunicorn) écrit ses propres totaux sous sa clé :
+    aucun incrément concurrent entre processus. Les refus sont écrits au plus
+    une fois par flush_interval secondes (un minuteur écrit les derniers) et
+    la lecture additionne les totaux de tous les processus. Un total effacé
+    par une remise à zéro repart de zéro.
+    """
+
+    def __init__(self, store, flush_interval=1.0):
+        self.store = store
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._pid = None
+        self._key = None
+        self._pending = {}  # lieu -> refus pas encore écrits
+        self._flushed_at = 0.0
+        self._timer = None
+
+    def _check_process(self):
+        # Après un fork (gunicorn --preload), une nouvelle clé et rien en attente
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._key = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+            self._pending = {}
+            self._timer = None
+        if not self._loaded:
+            self.store.load()
+            self._loaded = True
+
+    def add(self, locations):
+        """Compter un refus par lieu de la liste"""
+        if not locations:
+            return
+        with self._lock:
+            self._check_process()
+            for location in locations:
+                self._pending[location] = self._pending.get(location, 0) + 1
+            if time.monotonic() - self._flushed_at >= self.flush_interval:
+                self._write()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Écrire les refus en attente de ce processus"""
+        with self._lock:
+            self._timer = None
+            if self._pid != os.getpid() or not self._pending:
+                return
+            try:
+                self._write()
+            except Exception as e:
+                print(f"Erreur lors de l'écriture des refus: {e}")
+
+    def _write(self):
+        record = self.store.get(self._key) or {}
+        by_location = dict(record.get("by_location") or {})
+        for location, count in self._pending.items():
+            by_location[location] = by_location.get(location, 0) + count
+        self.store.put(self._key, {
+            "invalid_scans": sum(by_location.values()),
+            "by_location": by_location,
+            "updated_at": datetime.datetime.now().isoformat()
+        })
+        self._pending = {}
+        self._flushed_at = time.monotonic()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def totals(self):
+        """(refus au total, refus par lieu), tous processus confondus"""
+        with self._lock:
+            self._check_process()
+            if self._pending:
+                self._write()
+        by_location = {}
+        for record in self.store.find():
+            for location, count in (record.get("by_location") or {}).items():
+                by_location[location] = by_location.get(location, 0) + count
+        return sum(by_location.values()), by_location
+
+    def clear(self):
+        """Remettre à zéro les refus de tous les processus"""
+        with self._lock:
+            self._check_process()
+            self._pending = {}
+            self.store.clear()
+
+
+class LiveStats:
+    """Diffusion des statistiques aux tableaux de bord ouverts (Server-Sent Events).
+
+    Les statistiques sont recalculées au plus une fois par intervalle, quel
+    que soit le nombre d'abonnés : chaque flux lit le dernier instantané et
+    n'envoie que les sections qui ont changé depuis son dernier envoi.
+    """
+
+    def __init__(self, compute, interval=1.0, max_streams=4):
+        self.compute = compute  # () -> {section: données JSON}
+        self.interval = interval
+        # Chaque flux occupe un thread du worker : au-delà de max_streams, les
+        # tableaux de bord sont renvoyés vers le rafraîchissement périodique
+        self.max_streams = max_streams
+        self._slots = threading.BoundedSemaphore(max_streams)
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._computed_at = None
+
+    def current(self):
+        """Dernier instantané, recalculé s'il date de plus d'un intervalle"""
+        with self._lock:
+            now = time.monotonic()
+            if self._computed_at is None or now - self._computed_at >= self.interval:
+                self._snapshot = self.compute()
+                self._computed_at = now
+            return self._snapshot
+
+    def subscribe(self, **options):
+        """Ouvrir un flux s'il reste une place, sinon None
+        
+        La place est rendue à la fermeture du flux (le serveur WSGI appelle
+        close() à la fin de la réponse ou à la déconnexion du client).
+        """
+        if not self._slots.acquire(blocking=False):
+            return None
+        return LiveStream(self.stream(**options), self._slots.release)
+
+    def stream(self, max_duration=300, heartbeat=15):
+        """Générer les messages SSE d'un abonné
+        
+        Le flux se termine après max_duration secondes pour libérer le thread ;
+        EventSource se reconnecte de lui-même et reçoit alors un état complet.
+        """
+        yield f"retry: {max(1000, int(self.interval * 1000))}\n\n"
+        sent = {}
+        started = last_message = time.monotonic()
+        while time.monotonic() - started < max_duration:
+            for section, data in self.current().items():
+                if sent.get(section) != data:
+                    sent[section] = data
+                    last_message = time.monotonic()
+                    yield f"event: {section}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            if time.monotonic() - last_message >= heartbeat:
+                last_message = time.monotonic()
+                yield ": ping\n\n"  # commentaire : garde la connexion ouverte à travers les proxys
+            time.sleep(self.interval)
+
+
+class LiveStream:
+    """Flux SSE d'un abonné, qui rend sa place dans LiveStats à la fermeture"""
+
+    def __init__(self, messages, release):
+        self._messages = messages
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._messages)
+
+    def close(self):
+        self._messages.close()
+        release, self._release = self._release, None
+        if release is not None:
+            release()
@@ -0,0 +1,1016 @@
+import contextlib
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections.abc import ItemsView, MutableMapping, ValuesView
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou de fichier, stockage partagé indisponible
+    fcntl = None
+
+from ticket_records import CompactRecords, unpack_record
+
+
+# Champs indexables de chaque table, et comment les extraire d'un enregistrement
+TICKET_FIELDS = {
+    "event_name": lambda record: record.get("event_name"),
+    "ticket_type": lambda record: record.get("ticket_type"),
+    "status": lambda record: record.get("status"),
+    "generated_at": lambda record: record.get("generated_at"),
+    "filename": lambda record: record.get("filename"),
+}
+
+VALIDATION_FIELDS = {
+    # Format normalisé : event_name seul ; anciennes validations : copie du billet
+    "event_name": lambda record: record.get("event_name") or (record.get("ticket_data") or {}).get("event_name"),
+    "validated_at": lambda record: record.get("validated_at"),
+    "location": lambda record: (record.get("scanner_info") or {}).get("location") or None,
+}
+
+# Historique des QR codes génériques (qr_generator), par empreinte des données
+QR_CODE_FIELDS = {
+    "unique_id": lambda record: record.get("unique_id"),
+    "method": lambda record: record.get("method"),
+    "created_at": lambda record: record.get("created_at"),
+}
+
+# Refus de scan : un total par processus (ticket_stats.RejectionCounters)
+REJECTION_FIELDS = {
+    "updated_at": lambda record: record.get("updated_at"),
+}
+
+TABLE_FIELDS = {
+    "tickets": TICKET_FIELDS,
+    "validations": VALIDATION_FIELDS,
+    "qr_codes": QR_CODE_FIELDS,
+    "rejections": REJECTION_FIELDS,
+}
+
+
+class JsonStore:
+    """Stockage JSON classique : le fichier complet est réécrit à chaque modification
+
+    Les billets et validations sont gardés compacts en mémoire
+    (ticket_records.CompactRecords) ; self.records reste une vue
+    dictionnaire et le fichier garde son format.
+    """
+
+    def __init__(self, path, table=None, compact_records=True):
+        self.path = path
+        self.table = table
+        self.fields = TABLE_FIELDS.get(table, {})
+        self.compact_records = compact_records and table in TABLE_FIELDS
+        self.records = self._new_records()
+        self._lock = threading.RLock()
+
+    def _new_records(self, records=()):
+        return CompactRecords(records) if self.compact_records else dict(records)
+
+    def load(self):
+        """Charger les enregistrements depuis le fichier JSON"""
+        with self._lock:
+            self.records = self._read_snapshot()
+        return self.records
+
+    def _read_snapshot(self):
+        """Lire le fichier JSON complet (snapshot)"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    return self._new_records(data) if self.compact_records else data
+                print(f"⚠️ {self.path} ne contient pas un dictionnaire, ignoré")
+        except Exception as e:
+            print(f"Erreur lors du chargement de {self.path}: {e}")
+        return self._new_records()
+
+    def _write_snapshot(self, records):
+        """Écrire le fichier JSON complet de manière atomique"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if isinstance(records, CompactRecords):
+                self._dump_compact(records, f)
+            else:
+                json.dump(records, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _dump_compact(records, f, chunk_size=1000):
+        """Même sortie que json.dump(indent=2), par blocs d'enregistrements reconstruits"""
+        items = iter(records.packed_items())
+        opening = "{"
+        while True:
+            chunk = {key: unpack_record(packed) for key, packed in itertools.islice(items, chunk_size)}
+            if not chunk:
+                break
+            text = json.dumps(chunk, indent=2, ensure_ascii=False)
+            f.write(opening + text[1:-2])  # sans les accolades ni le dernier saut de ligne
+            opening = ","
+        f.write("{}" if opening == "{" else "\n}")
+
+    def put(self, key, record):
+        """Ajouter ou remplacer un enregistrement puis le persister"""
+        self.put_many([(key, record)])
+
+    def put_many(self, items):
+        """Ajouter plusieurs enregistrements avec une seule sauvegarde
+
+        Si l'écriture échoue, l'exception remonte et la mémoire revient à
+        l'état du fichier : rien n'est tenu pour enregistré.
+        """
+        with self._lock:
+            items = list(items)
+            previous = [(key, self.records.get(key)) for key, _ in items]
+            self.records.update(items)
+            try:
+                self.save()
+            except Exception:
+                for key, record in previous:
+                    if record is None:
+                        self.records.pop(key, None)
+                    else:
+                        self.records[key] = record
+                raise
+
+    def save(self):
+        """Réécrire tout le fichier (l'erreur d'écriture remonte à l'appelant)"""
+        with self._lock:
+            try:
+                self._write_snapshot(self.records)
+            except Exception as e:
+                print(f"Erreur lors de la sauvegarde de {self.path}: {e}")
+                raise
+
+    def get(self, key):
+        """Retourner un enregistrement, ou None"""
+        return self.records.get(key)
+
+    def insert_if_absent(self, key, record):
+        """Enregistrer seulement si la clé est absente.
+
+        Retourne l'enregistrement existant, ou None si l'insertion a eu lieu.
+        """
+        with self._lock:
+            existing = self.records.get(key)
+            if existing is not None:
+                return existing
+            self.put(key, record)
+            return None
+
+    def insert_many_if_absent(self, items):
+        """Version en lot de insert_if_absent, avec une seule sauvegarde.
+
+        Retourne pour chaque élément l'enregistrement existant, ou None s'il a
+        été inséré. Pour une clé répétée dans le lot, la première occurrence gagne.
+        """
+        with self._lock:
+            results = []
+            inserted = {}
+            for key, record in items:
+                existing = self.records.get(key)
+                if existing is None:
+                    existing = inserted.get(key)
+                if existing is None:
+                    inserted[key] = record
+                results.append(existing)
+            if inserted:
+                self.put_many(inserted.items())
+            return results
+
+    def clear(self):
+        """Supprimer tous les enregistrements"""
+        with self._lock:
+            self.records.clear()
+            self.save()
+
+    def _matches(self, record, filters, between=None):
+        if not all(self.fields[field](record) == value for field, value in filters.items()):
+            return False
+        for field, (low, high) in (between or {}).items():
+            value = self.fields[field](record)
+            if value is None or (low is not None and value < low) or (high is not None and value > high):
+                return False
+        return True
+
+    def _check_fields(self, *fields):
+        for field in fields:
+            if field not in self.fields:
+                raise ValueError(f"Champ non indexé: {field}")
+
+    def _scan(self):
+        """Enregistrements tels que gardés en mémoire : les extracteurs lisent aussi les compacts
+        
+        Copie prise sous verrou, parcourue ensuite sans le garder : une écriture
+        concurrente ne fait pas échouer le parcours (dictionnaire modifié).
+        """
+        with self._lock:
+            if isinstance(self.records, CompactRecords):
+                return list(self.records.packed_values())
+            return list(self.records.values())
+
+    def count(self, between=None, **filters):
+        """Compter les enregistrements correspondant aux filtres
+        
+        between : {champ: (min, max)} bornes incluses, None pour une borne ouverte
+        """
+        self._check_fields(*filters, *(between or ()))
+        if not filters and not between:
+            return len(self.records)
+        return sum(1 for record in self._scan() if self._matches(record, filters, between))
+
+    def count_by(self, field, default=None, **filters):
+        """Compter les enregistrements par valeur d'un champ"""
+        self._check_fields(field, *filters)
+        extract = self.fields[field]
+        counts = {}
+        for record in self._scan():
+            if filters and not self._matches(record, filters):
+                continue
+            value = extract(record)
+            if value is None:
+                value = default
+            counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def find(self, order_by=None, descending=False, limit=None, between=None, **filters):
+        """Itérer sur les enregistrements filtrés, éventuellement triés et limités"""
+        return map(unpack_record, self._find_packed(order_by, descending, limit, between, **filters))
+
+    def _find_packed(self, order_by=None, descending=False, limit=None, between=None, **filters):
+        """Comme find, mais rend les enregistrements tels que gardés en mémoire"""
+        self._check_fields(*filters, *(between or ()))
+        records = (record for record in self._scan()
+                   if not (filters or between) or self._matches(record, filters, between))
+        if order_by is None:
+            if limit is not None:
+                records = (record for _, record in zip(range(limit), records))
+            return records
+
+        self._check_fields(order_by)
+        extract = self.fields[order_by]
+
+        def sort_key(record):
+            return extract(record) or ""
+
+        if limit is not None:
+            select = heapq.nlargest if descending else heapq.nsmallest
+            return iter(select(limit, records, key=sort_key))
+        return iter(sorted(records, key=sort_key, reverse=descending))
+
+    def flush(self):
+        """Rien à faire : chaque modification est déjà écrite"""
+
+    def close(self):
+        """Fermer le stockage"""
+        self.flush()
+
+
+class JournalStore(JsonStore):
+    """Stockage journalisé : une ligne JSON ajoutée par modification,
+    compactée périodiquement en arrière-plan dans le snapshot JSON.
+
+    Le snapshot garde exactement le format de `JsonStore`, on peut donc
+    passer d'un mode à l'autre sans migration.
+    """
+
+    def __init__(self, path, table=None, fsync_every=1, compact_every=1000, compact_records=True):
+        super().__init__(path, table, compact_records)
+        self.journal_path = f"{path}.journal"
+        self.compacting_path = f"{path}.journal.compacting"
+        self.fsync_every = fsync_every
+        self.compact_every = compact_every
+        self._journal = None
+        self._journal_records = 0
+        self._unsynced = 0
+        self._compaction = None
+
+    def load(self):
+        """Charger le snapshot puis rejouer le journal"""
+        with self._lock:
+            self._wait_compaction()
+            self._close_journal()
+            records = self._read_snapshot()
+            interrupted = os.path.exists(self.compacting_path)
+
+            # Une compaction interrompue laisse son journal à côté du snapshot
+            replayed = self._replay(self.compacting_path, records)
+            replayed += self._replay(self.journal_path, records)
+
+            self.records = records
+            self._journal_records = replayed
+            self._open_journal()
+
+            if interrupted:
+                try:
+                    self.save()
+                except Exception:
+                    pass  # le journal de compaction reste, repris à la prochaine compaction
+        return self.records
+
+    def _replay(self, journal_path, records):
+        """Appliquer les entrées d'un journal, en ignorant une dernière ligne tronquée"""
+        if not os.path.exists(journal_path):
+            return 0
+
+        count = 0
+        valid_size = 0
+        with open(journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    print(f"⚠️ Journal {journal_path} tronqué après {count} entrées")
+                    break
+                self._apply(entry, records)
+                valid_size += len(line)
+                count += 1
+
+        # Couper la fin corrompue pour que les prochains ajouts restent lisibles
+        if valid_size != os.path.getsize(journal_path):
+            with open(journal_path, 'r+b') as f:
+                f.truncate(valid_size)
+        return count
+
+    def _apply(self, entry, records):
+        """Appliquer une entrée de journal"""
+        if entry.get("op") == "put":
+            records[entry["key"]] = entry["value"]
+
+    def _open_journal(self):
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._unsynced = 0
+
+    def _close_journal(self):
+        if self._journal is not None:
+            try:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal.close()
+            except Exception as e:
+                print(f"Erreur lors de la fermeture du journal {self.journal_path}: {e}")
+            self._journal = None
+
+    def put(self, key, record):
+        """Ajouter ou remplacer un enregistrement (une ligne de journal)"""
+        with self._lock:
+            self._append([{"op": "put", "key": key, "value": record}])
+            self.records[key] = record
+            self._compact_if_needed()
+
+    def put_many(self, items):
+        """Ajouter plusieurs enregistrements avec un seul fsync"""
+        with self._lock:
+            items = list(items)
+            if not items:
+                return
+            self._append([{"op": "put", "key": key, "value": record} for key, record in items],
+                         sync=bool(self.fsync_every))
+            self.records.update(items)
+            self._compact_if_needed()
+
+    def _append(self, entries, sync=False):
+        """Écrire des entrées à la fin du journal : toutes ou aucune.
+
+        La mémoire n'est mise à jour qu'après : si l'écriture ou le fsync
+        échoue, les lignes sont retirées du journal et l'exception remonte.
+        """
+        start = None
+        try:
+            start = os.fstat(self._journal.fileno()).st_size
+            self._journal.write("".join(
+                json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n" for entry in entries
+            ))
+            self._journal.flush()
+            self._unsynced += len(entries)
+            if sync or (self.fsync_every and self._unsynced >= self.fsync_every):
+                os.fsync(self._journal.fileno())
+                self._unsynced = 0
+        except Exception as e:
+            print(f"Erreur lors de l'écriture du journal {self.journal_path}: {e}")
+            if start is not None:
+                self._rewind_journal(start)
+            raise
+        self._journal_records += len(entries)
+
+    def _rewind_journal(self, size):
+        """Couper le journal à `size` octets après une écriture ratée"""
+        journal, self._journal = self._journal, None
+        try:
+            journal.close()
+        except Exception:
+            pass  # tampon impossible à vider : le descripteur est fermé quand même
+        try:
+            os.truncate(self.journal_path, size)
+        except OSError as e:
+            print(f"Erreur lors de la réparation du journal {self.journal_path}: {e}")
+        self._open_journal()
+
+    def _compact_if_needed(self):
+        if self.compact_every and self._journal_records >= self.compact_every:
+            try:
+                self.compact()
+            except Exception as e:
+                # Les entrées sont déjà dans le journal : la compaction sera retentée
+                print(f"Erreur lors de la compaction de {self.path}: {e}")
+
+    def compact(self, background=True):
+        """Fusionner le journal dans le snapshot JSON"""
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                if not background:
+                    self._wait_compaction()
+                    self.save()
+                return
+
+            # Une compaction précédente a échoué : tout réécrire maintenant
+            if os.path.exists(self.compacting_path):
+                self.save()
+                return
+
+            self._close_journal()
+            if os.path.exists(self.journal_path):
+                os.replace(self.journal_path, self.compacting_path)
+            snapshot = self.records.copy()
+            self._journal_records = 0
+            self._open_journal()
+
+        if background:
+            self._compaction = threading.Thread(
+                target=self._write_compaction, args=(snapshot,), daemon=True
+            )
+            self._compaction.start()
+        else:
+            self._write_compaction(snapshot)
+
+    def _write_compaction(self, snapshot):
+        try:
+            self._write_snapshot(snapshot)
+            if os.path.exists(self.compacting_path):
+                os.remove(self.compacting_path)
+        except Exception as e:
+            print(f"Erreur lors de la compaction de {self.path}: {e}")
+
+    def _wait_compaction(self):
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+
+    def save(self):
+        """Réécrire le snapshot complet et vider le journal"""
+        with self._lock:
+            self._wait_compaction()
+            self._close_journal()
+            try:
+                self._write_snapshot(self.records)
+                for journal_path in (self.compacting_path, self.journal_path):
+                    if os.path.exists(journal_path):
+                        os.remove(journal_path)
+                self._journal_records = 0
+            except Exception as e:
+                print(f"Erreur lors de la sauvegarde de {self.path}: {e}")
+                raise
+            finally:
+                self._open_journal()
+
+    def flush(self):
+        """Forcer l'écriture sur disque des entrées non synchronisées"""
+        with self._lock:
+            if self._journal is not None and self._unsynced:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._unsynced = 0
+
+    def close(self):
+        """Attendre la compaction en cours et fermer le journal"""
+        with self._lock:
+            self._wait_compaction()
+            self._close_journal()
+
+
+class SharedJournalStore(JournalStore):
+    """Stockage journalisé partagé entre plusieurs processus (workers gunicorn).
+
+    Chaque écriture prend un verrou exclusif sur `{path}.lock`, rattrape
+    d'abord les entrées ajoutées au journal par les autres processus, puis
+    ajoute la sienne : insert_if_absent est donc atomique entre workers.
+    Les lectures (get, count, find) rattrapent le journal sous verrou
+    partagé. La compaction se fait sous le verrou exclusif, jamais en
+    arrière-plan, et incrémente la génération écrite dans `{path}.lock` :
+    un processus qui voit une autre génération relit tout (un nouveau
+    journal peut réutiliser l'inode de l'ancien et le dépasser en taille).
+    """
+
+    def __init__(self, path, table=None, fsync_every=1, compact_every=1000, compact_records=True):
+        if fcntl is None:
+            raise ValueError("Stockage partagé indisponible : verrous de fichiers non supportés")
+        super().__init__(path, table, fsync_every, compact_every, compact_records)
+        self.lock_path = f"{path}.lock"
+        self._lock_file = None
+        self._lock_depth = 0
+        self._pid = None
+        self._generation = None
+        self._journal_offset = 0
+
+    @contextlib.contextmanager
+    def _file_lock(self, exclusive=True):
+        """Verrou inter-processus (réentrant dans un même processus)"""
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            # Après un fork (gunicorn --preload), rouvrir le verrou et le journal :
+            # un descripteur hérité partagerait le verrou avec le processus parent
+            if self._pid != os.getpid():
+                self._lock_file = os.fdopen(os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+                if self._journal is not None:
+                    self._journal = None
+                    self._open_journal()
+                self._pid = os.getpid()
+
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth = 1
+            try:
+                self._sync()
+                yield
+                if self._journal is not None:
+                    self._track_journal()
+            finally:
+                self._lock_depth = 0
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _track_journal(self):
+        """Mémoriser la génération du journal et la position déjà appliquée"""
+        self._generation = self._read_generation()
+        self._journal_offset = os.fstat(self._journal.fileno()).st_size
+
+    def _read_generation(self):
+        """Numéro de génération du journal (incrémenté à chaque compaction), sous verrou"""
+        data = os.pread(self._lock_file.fileno(), 32, 0)
+        return int(data) if data.strip() else 0
+
+    def _next_generation(self):
+        """Journal remplacé (compaction, sauvegarde complète) : nouvelle génération"""
+        fd = self._lock_file.fileno()
+        generation = str(self._read_generation() + 1).encode()
+        os.pwrite(fd, generation, 0)
+        os.ftruncate(fd, len(generation))
+
+    def _sync(self):
+        """Appliquer les entrées écrites par les autres processus depuis le dernier accès"""
+        if self._journal is None:
+            return  # pas encore chargé
+        try:
+            stat = os.stat(self.journal_path)
+        except FileNotFoundError:
+            stat = None
+
+        if stat is None or self._read_generation() != self._generation or stat.st_size < self._journal_offset:
+            # Journal compacté ou réécrit par un autre processus : tout relire,
+            # en gardant le même dictionnaire (référencé par les appelants)
+            records = self._read_snapshot()
+            self._journal_records = self._replay(self.compacting_path, records)
+            self._journal_records += self._replay(self.journal_path, records)
+            self.records.clear()
+            self.records.update(records)
+            self._close_journal()
+            self._open_journal()
+            return
+
+        if stat.st_size > self._journal_offset:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+            # Ne rejouer que les lignes complètes : la position n'avance que jusqu'à
+            # la fin de la dernière ligne terminée par un saut de ligne
+            complete = data[:data.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    print(f"⚠️ Entrée illisible ignorée dans {self.journal_path}")
+                    continue
+                self._apply(entry, self.records)
+                self._journal_records += 1
+            self._journal_offset += len(complete)
+
+            if len(complete) < len(data):
+                # Ligne tronquée par un processus interrompu en pleine écriture : aucun
+                # autre écrivain n'est actif sous notre verrou, la couper avant le
+                # prochain ajout pour qu'il ne soit pas collé à cette fin corrompue
+                print(f"⚠️ Journal {self.journal_path} tronqué, fin incomplète supprimée")
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(self._journal_offset)
+
+    def load(self):
+        """Charger le snapshot puis rejouer le journal, sous verrou exclusif"""
+        with self._file_lock():
+            super().load()
+            self._track_journal()
+        return self.records
+
+    def get(self, key):
+        with self._file_lock(exclusive=False):
+            return self.records.get(key)
+
+    def put(self, key, record):
+        with self._file_lock():
+            super().put(key, record)
+
+    def put_many(self, items):
+        with self._file_lock():
+            super().put_many(items)
+
+    def insert_if_absent(self, key, record):
+        with self._file_lock():
+            return super().insert_if_absent(key, record)
+
+    def insert_many_if_absent(self, items):
+        with self._file_lock():
+            return super().insert_many_if_absent(items)
+
+    def clear(self):
+        with self._file_lock():
+            super().clear()
+
+    def count(self, between=None, **filters):
+        with self._file_lock(exclusive=False):
+            return super().count(between=between, **filters)
+
+    def count_by(self, field, default=None, **filters):
+        with self._file_lock(exclusive=False):
+            return super().count_by(field, default, **filters)
+
+    def find(self, order_by=None, descending=False, limit=None, between=None, **filters):
+        with self._file_lock(exclusive=False):
+            # Matérialiser pendant le verrou (le dictionnaire peut être relu ensuite), mais
+            # garder les enregistrements compacts : ils ne sont reconstruits qu'à la lecture
+            records = list(self._find_packed(order_by, descending, limit, between, **filters))
+        return map(unpack_record, records)
+
+    def compact(self, background=True):
+        """Fusionner le journal dans le snapshot (toujours synchrone, sous verrou)"""
+        with self._file_lock():
+            super().compact(background=False)
+            self._next_generation()
+
+    def save(self):
+        with self._file_lock():
+            super().save()
+            self._next_generation()
+
+
+def read_json_records(path):
+    """Lire un stockage JSON (snapshot + journaux éventuels) sans l'ouvrir en écriture"""
+    reader = JournalStore(path)
+    records = reader._read_snapshot()
+    reader._replay(reader.compacting_path, records)
+    reader._replay(reader.journal_path, records)
+    return records
+
+
+class SqliteRecords(MutableMapping):
+    """Vue dictionnaire sur une table SQLite (clé -> enregistrement)"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def __getitem__(self, key):
+        record = self._store.get(key)
+        if record is None:
+            raise KeyError(key)
+        return record
+
+    def __setitem__(self, key, record):
+        self._store.put(key, record)
+
+    def __delitem__(self, key):
+        if not self._store.delete(key):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._store.get(key) is not None
+
+    def __iter__(self):
+        return self._store.iter_keys()
+
+    def __len__(self):
+        return self._store.count()
+
+    def values(self):
+        return _SqliteValues(self)
+
+    def items(self):
+        return _SqliteItems(self)
+
+
+class _SqliteValues(ValuesView):
+    def __iter__(self):
+        for _, record in self._mapping._store.iter_items():
+            yield record
+
+
+class _SqliteItems(ItemsView):
+    def __iter__(self):
+        return self._mapping._store.iter_items()
+
+
+class SqliteStore:
+    """Stockage SQLite (mode WAL) avec colonnes indexées.
+
+    Chaque enregistrement est gardé tel quel en JSON, les champs de
+    `TABLE_FIELDS` sont dupliqués dans des colonnes indexées pour les
+    filtres, tris et statistiques. Si la table est vide au chargement,
+    le fichier JSON d'origine (et son journal) est importé.
+    """
+
+    def __init__(self, path, table, database="tickets.db"):
+        if table not in TABLE_FIELDS:
+            raise ValueError(f"Table inconnue: {table}")
+        self.path = path
+        self.table = table
+        self.fields = TABLE_FIELDS[table]
+        self.database = database
+        self.records = SqliteRecords(self)
+        self._lock = threading.RLock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        """Connexion SQLite, recréée après un fork (workers gunicorn)"""
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.database, check_same_thread=False,
+                                         isolation_level=None, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _create_schema(self, connection):
+        columns = "".join(f", {field} TEXT" for field in self.fields)
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} "
+            f"(key TEXT PRIMARY KEY{columns}, record TEXT NOT NULL)"
+        )
+        # Bases créées par une version précédente : ajouter les colonnes manquantes
+        existing = {row[1] for row in connection.execute(f"PRAGMA table_info({self.table})")}
+        missing = [field for field in self.fields if field not in existing]
+        for field in missing:
+            connection.execute(f"ALTER TABLE {self.table} ADD COLUMN {field} TEXT")
+        if missing:
+            self._backfill(connection, missing)
+
+        for field in self.fields:
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.table}_{field} ON {self.table} ({field})"
+            )
+
+    def _backfill(self, connection, fields):
+        """Remplir de nouvelles colonnes à partir des enregistrements JSON"""
+        rows = connection.execute(f"SELECT key, record FROM {self.table}").fetchall()
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        connection.execute("BEGIN")
+        connection.executemany(
+            f"UPDATE {self.table} SET {assignments} WHERE key = ?",
+            ([*(self.fields[field](json.loads(record)) for field in fields), key]
+             for key, record in rows)
+        )
+        connection.execute("COMMIT")
+
+    def load(self):
+        """Ouvrir la base, créer le schéma et migrer le JSON si la table est vide"""
+        with self._lock:
+            connection = self._connect()
+            self._create_schema(connection)
+            if self.count() == 0 and (os.path.exists(self.path)
+                                      or os.path.exists(f"{self.path}.journal")):
+                imported = self.import_records(read_json_records(self.path))
+                if imported:
+                    print(f"✓ {imported} enregistrements importés de {self.path} vers {self.database}")
+        return self.records
+
+    def _row(self, key, record):
+        values = [key]
+        values.extend(self.fields[field](record) for field in self.fields)
+        values.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        return values
+
+    def _insert_sql(self, verb):
+        columns = ", ".join(["key", *self.fields, "record"])
+        placeholders = ", ".join("?" * (len(self.fields) + 2))
+        return f"{verb} INTO {self.table} ({columns}) VALUES ({placeholders})"
+
+    def import_records(self, records):
+        """Importer un dictionnaire d'enregistrements en une seule transaction"""
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(
+                    self._insert_sql("INSERT OR REPLACE"),
+                    (self._row(key, record) for key, record in records.items())
+                )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return len(records)
+
+    def get(self, key):
+        with self._lock:
+            row = self._connect().execute(
+                f"SELECT record FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, record):
+        """Ajouter ou remplacer un enregistrement"""
+        with self._lock:
+            self._connect().execute(self._insert_sql("INSERT OR REPLACE"), self._row(key, record))
+
+    def put_many(self, items):
+        """Ajouter plusieurs enregistrements en une seule transaction"""
+        self.import_records(dict(items))
+
+    def insert_if_absent(self, key, record):
+        """Insertion atomique, y compris entre plusieurs processus.
+
+        Retourne l'enregistrement existant, ou None si l'insertion a eu lieu.
+        """
+        with self._lock:
+            cursor = self._connect().execute(self._insert_sql("INSERT OR IGNORE"),
+                                             self._row(key, record))
+            if cursor.rowcount == 1:
+                return None
+            return self.get(key)
+
+    def insert_many_if_absent(self, items):
+        """Insertions atomiques en une seule transaction (la première occurrence d'une clé gagne).
+
+        Retourne pour chaque élément l'enregistrement existant, ou None s'il a été inséré.
+        """
+        results = []
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for key, record in items:
+                    cursor = connection.execute(self._insert_sql("INSERT OR IGNORE"),
+                                                self._row(key, record))
+                    if cursor.rowcount == 1:
+                        results.append(None)
+                        continue
+                    row = connection.execute(
+                        f"SELECT record FROM {self.table} WHERE key = ?", (key,)
+                    ).fetchone()
+                    results.append(json.loads(row[0]))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return results
+
+    def delete(self, key):
+        with self._lock:
+            cursor = self._connect().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def iter_keys(self):
+        with self._lock:
+            rows = self._connect().execute(f"SELECT key FROM {self.table}").fetchall()
+        return (row[0] for row in rows)
+
+    def iter_items(self):
+        with self._lock:
+            cursor = self._connect().execute(f"SELECT key, record FROM {self.table}")
+            rows = cursor.fetchall()
+        return ((key, json.loads(record)) for key, record in rows)
+
+    def _check_fields(self, *fields):
+        for field in fields:
+            if field not in self.fields:
+                raise ValueError(f"Champ non indexé: {field}")
+
+    def _where(self, filters, between=None):
+        self._check_fields(*filters, *(between or ()))
+        clauses = [f"{field} = ?" for field in filters]
+        params = list(filters.values())
+        for field, (low, high) in (between or {}).items():
+            if low is not None:
+                clauses.append(f"{field} >= ?")
+                params.append(low)
+            if high is not None:
+                clauses.append(f"{field} <= ?")
+                params.append(high)
+            if low is None and high is None:
+                clauses.append(f"{field} IS NOT NULL")
+        if not clauses:
+            return "", []
+        return f" WHERE {' AND '.join(clauses)}", params
+
+    def _fetch(self, sql, params, batch_size=500):
+        """Itérer sur les lignes par paquets, sans garder le verrou entre deux paquets"""
+        with self._lock:
+            cursor = self._connect().execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def count(self, between=None, **filters):
+        where, params = self._where(filters, between)
+        with self._lock:
+            return self._connect().execute(
+                f"SELECT COUNT(*) FROM {self.table}{where}", params
+            ).fetchone()[0]
+
+    def count_by(self, field, default=None, **filters):
+        self._check_fields(field)
+        where, params = self._where(filters)
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {field}, COUNT(*) FROM {self.table}{where} GROUP BY {field}", params
+            ).fetchall()
+        counts = {}
+        for value, count in rows:
+            value = default if value is None else value
+            counts[value] = counts.get(value, 0) + count
+        return counts
+
+    def find(self, order_by=None, descending=False, limit=None, between=None, **filters):
+        where, params = self._where(filters, between)
+        sql = f"SELECT record FROM {self.table}{where}"
+        if order_by is not None:
+            self._check_fields(order_by)
+            sql += f" ORDER BY {order_by} {'DESC' if descending else 'ASC'}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return (json.loads(row[0]) for row in self._fetch(sql, params))
+
+    def save(self):
+        """Rien à faire : chaque écriture est déjà validée"""
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute(f"DELETE FROM {self.table}")
+
+    def flush(self):
+        """Rien à faire : chaque écriture est déjà validée"""
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+STORAGE_BACKENDS = {
+    "json": JsonStore,
+    "journal": JournalStore,
+    "shared": SharedJournalStore,
+    "sqlite": SqliteStore,
+}
+
+
+def create_store(backend, path, table, **options):
+    """Créer le stockage demandé ("json", "journal" ou "sqlite") pour une table"""
+    try:
+        store_class = STORAGE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Stockage inconnu: {backend} (choix: {', '.join(STORAGE_BACKENDS)})")
+    return store_class(path, table, **options)
+
+
+def migrate_json_to_sqlite(database="tickets.db", tickets_path="tickets_database.json",
+                           validations_path="ticket_validations.json"):
+    """Importer les fichiers JSON existants dans la base SQLite"""
+    imported = {}
+    for table, path in (("tickets", tickets_path), ("validations", validations_path)):
+        store = SqliteStore(path, table, database=database)
+        store.load()
+        imported[table] = store.import_records(read_json_records(path))
+        store.close()
+    return imported
+
+
+if __name__ == "__main__":
+    database = sys.argv[1] if len(sys.argv) > 1 else "tickets.db"
+    print(f"=== Migration JSON -> SQLite ({database}) ===")
+    for table, count in migrate_json_to_sqlite(database).items():
+        print(f"✓ {table}: {count} enregistrements")